@@ -0,0 +1,227 @@
+import difflib
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from schema_retrieval import GENERIC_WORDS, TABLES, TABLE_WORDS, split_words
+
+# Answers of the agent are reused for repeated questions. An exact tier matches the
+# normalized question, a similarity tier matches questions whose character n-grams
+# are close enough and that say the same thing: same numbers, same domain words in the
+# same order ("A faster than B" is not "B faster than A"), and no word of one question
+# missing from the other ("in USD"), spelling variants aside. Both are scoped to the chat history context of the question.
+
+AGENT_STOPPED_OUTPUT = "Agent stopped due to iteration limit or time limit."
+# Filler words that do not change the answer of a question
+STOP_WORDS = {"a", "an", "the", "what", "whats", "is", "are", "was", "were", "of", "in", "for", "please",
+              "tell", "me", "show", "give", "can", "could", "you", "about", "i", "want", "to", "know", "s"}
+# Words of the schema: table names, columns and known values (components, activities,
+# governorates, public/private, current/constant prices, quarters...). Questions
+# differing by one of them ("exports" and "imports") are close in n-grams only
+DOMAIN_WORDS = set().union(*TABLE_WORDS.values(), *(split_words(" ".join(table["columns"])) for table in TABLES.values())) - GENERIC_WORDS - STOP_WORDS
+
+
+def normalize_question(question):
+    question = question.lower()
+    question = re.sub(r"[^\w/%\s]", " ", question)
+    return " ".join(word for word in question.split() if word not in STOP_WORDS)
+
+
+def context_key(chat_history):
+    # The previous turns can change the meaning of a question ("and for 2022?")
+    if not chat_history:
+        return ""
+    text = normalize_question("\n".join(chat_history))
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def content_words(normalized):
+    # Words of a normalized question in order, plurals folded ("rates" -> "rate")
+    return [word for token in normalized.split() for word in sorted(split_words(token))]
+
+
+def has_words(words, other):
+    # Every word of words is in other, or a close spelling of one of its words
+    other = set(other)
+    return all(word in other or difflib.get_close_matches(word, other, n=1, cutoff=0.8) for word in words)
+
+
+def ngrams(text, size=3):
+    text = f" {text} "
+    return {text[i:i + size] for i in range(max(len(text) - size + 1, 1))}
+
+
+def referenced_tables(intermediate_steps):
+    # Tables read by the sql_db_query calls of an agent run
+    tables = set()
+    for action, _ in intermediate_steps or []:
+        if getattr(action, "tool", None) == "sql_db_query":
+            sql = str(action.tool_input)
+            tables.update(t.lower() for t in re.findall(r"\b(?:from|join)\s+[\"`]?(\w+)", sql, re.I))
+    return tables
+
+
+class CacheEntry:
+
+    def __init__(self, question, context, output, intermediate_steps, tables) -> None:
+        self.question = question
+        self.context = context
+        self.output = output
+        self.intermediate_steps = intermediate_steps
+        self.tables = tables
+        self.numbers = set(re.findall(r"\d+", question))
+        self.words = content_words(question)
+        self.domain_words = [word for word in self.words if word in DOMAIN_WORDS]
+        self.ngrams = ngrams(question)
+        self.created_at = time.monotonic()
+
+
+class AnswerCache:
+
+    def __init__(self, max_entries=512, ttl_seconds=6 * 60 * 60, similarity_threshold=0.8) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.entries = OrderedDict()
+        # n-gram -> keys of the entries containing it, used to find similar questions
+        self.index = {}
+        self.lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, question, chat_history=None):
+        # Returns (output, intermediate_steps) or None
+        normalized = normalize_question(question)
+        key = (context_key(chat_history), normalized)
+        with self.lock:
+            entry = self._get_entry(key)
+            if entry is not None:
+                self.stats["exact_hits"] += 1
+                return entry.output, entry.intermediate_steps
+
+            entry = self._get_similar_entry(key[0], normalized)
+            if entry is not None:
+                self.stats["similar_hits"] += 1
+                return entry.output, entry.intermediate_steps
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, question, chat_history, output, intermediate_steps):
+        # Failed runs are not worth reusing
+        if not output or not output.strip() or output == AGENT_STOPPED_OUTPUT:
+            return
+        normalized = normalize_question(question)
+        key = (context_key(chat_history), normalized)
+        entry = CacheEntry(normalized, key[0], output, intermediate_steps, referenced_tables(intermediate_steps))
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = entry
+            for gram in entry.ngrams:
+                self.index.setdefault(gram, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+                self.stats["evictions"] += 1
+
+    def invalidate(self, tables=None):
+        # Drop the answers built from the refreshed tables, or everything if tables is None
+        with self.lock:
+            if tables is None:
+                keys = list(self.entries)
+            else:
+                tables = {table.lower() for table in tables}
+                keys = [key for key, entry in self.entries.items() if entry.tables & tables]
+            for key in keys:
+                self._remove(key)
+            self.stats["invalidations"] += len(keys)
+
+    def metrics(self):
+        with self.lock:
+            metrics = dict(self.stats, entries=len(self.entries))
+        lookups = metrics["exact_hits"] + metrics["similar_hits"] + metrics["misses"]
+        metrics["hit_rate"] = (metrics["exact_hits"] + metrics["similar_hits"]) / lookups if lookups else 0.0
+        return metrics
+
+    def _get_entry(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.created_at > self.ttl_seconds:
+            self._remove(key)
+            self.stats["expirations"] += 1
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _get_similar_entry(self, context, normalized):
+        grams = ngrams(normalized)
+        numbers = set(re.findall(r"\d+", normalized))
+        words = content_words(normalized)
+        domain = [word for word in words if word in DOMAIN_WORDS]
+        candidates = set()
+        for gram in grams:
+            candidates.update(key for key in self.index.get(gram, ()) if key[0] == context)
+
+        best_key, best_score = None, self.similarity_threshold
+        for key in candidates:
+            entry = self.entries[key]
+            # Years and quarters must match exactly, "2023" and "2022" are not similar
+            if entry.numbers != numbers:
+                continue
+            # So must the components, activities, governorates, sectors, prices and tables,
+            # in the same order
+            if entry.domain_words != domain:
+                continue
+            # A qualifier of one question only ("in USD", "per capita") changes the answer
+            if not has_words(words, entry.words) or not has_words(entry.words, words):
+                continue
+            score = len(grams & entry.ngrams) / len(grams | entry.ngrams)
+            if score >= best_score:
+                best_key, best_score = key, score
+
+        return self._get_entry(best_key) if best_key is not None else None
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for gram in entry.ngrams:
+            keys = self.index.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.index[gram]
+
+
+class TableRefreshWatcher:
+    # Invalidates the caches when the Glue catalog reports that an Athena table changed
+
+    def __init__(self, caches, glue_client, database="athena_db") -> None:
+        self.caches = caches
+        self.glue_client = glue_client
+        self.database = database
+        self.update_times = {}
+
+    def check(self):
+        refreshed = []
+        first_check = not self.update_times
+        paginator = self.glue_client.get_paginator("get_tables")
+        for page in paginator.paginate(DatabaseName=self.database):
+            for table in page["TableList"]:
+                name = table["Name"].lower()
+                update_time = table.get("UpdateTime")
+                if name in self.update_times and self.update_times[name] != update_time:
+                    refreshed.append(name)
+                self.update_times[name] = update_time
+        if first_check:
+            # Refreshes made before startup, the Athena results reused across restarts
+            # may predate them
+            seeded = {name: update_time.timestamp() for name, update_time in self.update_times.items() if update_time is not None}
+            for cache in self.caches:
+                if hasattr(cache, "seed"):
+                    cache.seed(seeded)
+        if refreshed:
+            for cache in self.caches:
+                cache.invalidate(refreshed)
+
+        return refreshed
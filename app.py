@@ -1,10 +1,9 @@
-import requests
+import importlib
+import io
+import os
+import threading
 import streamlit as st
-from PIL import Image
-import json
 import uuid
-from langchain_core.messages import AIMessage, HumanMessage
-from invoke_agent import SqlAgent
 
 st.set_page_config(
     page_title="Chat With MPED",
@@ -17,160 +16,236 @@ st.title("Chat With MPED")
 def generate_new_session_id():
     return str(uuid.uuid4())
 
+# Anyone with the url of a session could read and continue its conversation, the
+# session id is only kept in the url (a reload resumes the conversation) when enabled
+RESUME_SESSIONS_FROM_URL = os.getenv('RESUME_SESSIONS_FROM_URL', 'false').lower() == 'true'
+
+GREETING = "Hello! I am a AI assistant. Ask me anything about the National Accounts Data of Egypt."
+
+# The agent pulls langchain, boto3 and sqlalchemy (more than a second to import), the
+# page is rendered without them and they are imported in the background meanwhile
+@st.cache_resource
+def start_agent_import():
+    thread = threading.Thread(target=importlib.import_module, args=("invoke_agent",), daemon=True)
+    thread.start()
+    return thread
+
+def get_sql_agent():
+    # Built on first use: the first question, or the resume of a session
+    if 'sql_agent' not in st.session_state:
+        from invoke_agent import SqlAgent
+        st.session_state['sql_agent'] = SqlAgent(session_id=st.session_state['sessionId'])
+    return st.session_state['sql_agent']
+
+def message_html(content):
+    return f'<div style="text-align": left; width: 120%; color:black !important>{content}</div>'
+
+def new_message(role, content):
+    # role: "Human" or "AI", the html is built once and reused by every run
+    return {"role": role, "content": content, "html": message_html(content)}
+
+def render_message(message):
+    with st.chat_message(message["role"]):
+        if message["role"] == "AI":
+            with st.expander("AI Output", expanded=True):
+                st.markdown(message["html"], unsafe_allow_html=True)
+        else:
+            st.markdown(message["html"], unsafe_allow_html=True)
+
 if 'sessionId' not in st.session_state:
-    st.session_state['sessionId'] = generate_new_session_id()
-    st.session_state['sql_agent'] = SqlAgent()
+    # With RESUME_SESSIONS_FROM_URL the session id is kept in the url so a reload or a
+    # restart resumes the conversation
+    resumed = st.query_params.get("session") if RESUME_SESSIONS_FROM_URL else None
+    st.session_state['sessionId'] = resumed or generate_new_session_id()
+    if RESUME_SESSIONS_FROM_URL:
+        st.query_params["session"] = st.session_state['sessionId']
+    st.session_state["chat_history"] = [new_message("AI", GREETING)]
+    if resumed:
+        for turn in get_sql_agent().memory.turns:
+            st.session_state["chat_history"] += [new_message("Human", turn["question"]), new_message("AI", turn["answer"])]
+start_agent_import()
 
 def fetch_data(question):
+    # Render the agent steps and the answer while they are generated
+    steps = st.status("Fetching response...", expanded=False)
+    with st.expander("AI Output", expanded=True):
+        answer = st.empty()
+    response = ""
 
     try: 
-        # Subracting 0 index represnts the response of the agent
-        response = st.session_state['sql_agent'].invoke_agent(question)[0].get("output")
+        for event in get_sql_agent().stream_agent(question):
+            if event["type"] == "thought":
+                steps.markdown(event["content"])
+            elif event["type"] == "sql":
+                steps.update(label="Looking up the data...")
+                steps.code(event["content"], language="sql")
+            elif event["type"] == "observation":
+                steps.text(event["content"][:1000])
+            elif event["type"] == "token":
+                steps.update(label="Writing the answer...")
+                response += event["content"]
+                answer.markdown(message_html(response), unsafe_allow_html=True)
+            elif event["type"] == "answer":
+                response = event["content"].get("output")
+        steps.update(label="Done", state="complete")
         print(response)
-        return response
     except Exception as e:
         print(f"Failed to invoke agent: {e}")
-        return "Hi! Could you please repeat your question or provide more details? Thanks!"
+        steps.update(label="Failed", state="error")
+        response = "Hi! Could you please repeat your question or provide more details? Thanks!"
 
-# st.set_page_config(page_title="ChatBot with DATABASE", page_icon=":speech_balloon:")
+    answer.markdown(message_html(response), unsafe_allow_html=True)
+    return response
 
+# st.set_page_config(page_title="ChatBot with DATABASE", page_icon=":speech_balloon:")
 
-def local_css(file_name):
-    with open(file_name) as f:
-        st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
 
-# Load the CSS file
-local_css("style.css")
+def debug_panel():
+    # Timings, tokens and Athena stats of the last answer
+    trace = st.session_state['sql_agent'].last_trace if 'sql_agent' in st.session_state else None
+    if trace is None or trace.duration is None:
+        st.write("No answer yet")
+        return
+    summary = trace.to_dict()
+    st.write(f"Path: {summary['path']}, {summary['duration']:.2f}s")
+    st.write(f"Iterations: {summary['iterations']}, parsing errors: {summary['parse_errors']}, Bedrock retries: {summary['bedrock_retries']}")
+    st.write(f"Tokens: {summary['input_tokens']} in / {summary['output_tokens']} out, Athena scanned: {summary['athena_bytes_scanned']} bytes")
+    st.write(f"Prompt cache (v{summary['prompt_version']}): {summary['cache_read_tokens']} tokens read / {summary['cache_write_tokens']} written")
+    st.json(summary["breakdown"])
+    st.json(summary["spans"], expanded=False)
 
 
 # Custom CSS for sidebar background color
 custom_sidebar_css = """
-<style>
     [data-testid="stSidebar"] {
         background-color: #0275d8;
     }
-</style>
 """
-st.markdown(custom_sidebar_css, unsafe_allow_html=True)
+custom_subheader_css = """
+    .custom-subheader { color: #ffffff; }
+"""
+custom_button_css = """
+    .stButton>button {
+        background-color: #ffffff;
+        font-weight: bold;
+        color: black;
+        border: none;
+        padding: 10px 20px;
+        text-align: center;
+        text-color= #CCBEBE;
+        text-decoration: none;
+        display: inline-block;
+        font-size: 16px;
+        margin: 4px 2px;
+        cursor: pointer;
+        border-radius: 8px;
+    }
+    .stButton>button:hover {
+        background-color: #CCBEBE;
+    }
+"""
+custom_css = """
+    .stAlert {
+        background-color: transparent !important;
+        color: white !important;
+        border: none !important;
+    }
+"""
+# Additional custom CSS for chat bubble
+custom_chat_css = """
+    .chat-bubble {
+        padding: 10px;
+        border-radius: 10px;
+        margin-bottom: 10px;
+    }
+    .user-bubble {
+        background-color: #f1f0f0;
+        color: black;
+    }
+"""
+
+# Pixels, twice the sidebar width for high density screens
+LOGO_WIDTH = 600
+
+# The static assets are read once per process, every run sends the CSS in one block
+@st.cache_resource
+def page_css(file_name):
+    with open(file_name) as f:
+        css = [f.read(), custom_sidebar_css, custom_subheader_css, custom_css, custom_button_css]
+    return f'<style>{"".join(css)}</style>'
+
+@st.cache_resource
+def logo(file_name, width=LOGO_WIDTH):
+    # The logo is far larger than the sidebar, st.image would decode and resize it on every run
+    from PIL import Image
+    image = Image.open(file_name)
+    image.thumbnail((width, width))
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+st.markdown(page_css("style.css"), unsafe_allow_html=True)
 with st.sidebar:
-    st.image("logo.png", use_column_width=True)
+    st.image(logo("logo.png"), use_column_width=True)
     st.write("")
     st.write("") 
     st.write("") 
     st.write("") 
     st.write("") 
 
-    
-    custom_subheader_css = """
-    <style>
-        .custom-subheader { color: #ffffff; }
-    </style>
-    """
-    st.markdown(custom_subheader_css, unsafe_allow_html=True)
     st.markdown('<h3 class="custom-subheader">Overview</h3>', unsafe_allow_html=True)
     st.write("""<p style="text-align: left;">This is an AI ChatBot to ask it about National Accounts Data of Egypt from The Ministry of Planning and Economic Development.</p>""", unsafe_allow_html=True)    
     st.sidebar.markdown('</div>', unsafe_allow_html=True)
-    
-    custom_button_css = """
-    <style>
-        .stButton>button {
-            background-color: #ffffff;
-            font-weight: bold;
-            color: black;
-            border: none;
-            padding: 10px 20px;
-            text-align: center;
-            text-color= #CCBEBE;
-            text-decoration: none;
-            display: inline-block;
-            font-size: 16px;
-            margin: 4px 2px;
-            cursor: pointer;
-            border-radius: 8px;
-        }
-        .stButton>button:hover {
-            background-color: #CCBEBE;
-        }
-    </style>
-    """
-    custom_css = """
-        <style>
-            .stAlert {
-                background-color: transparent !important;
-                color: white !important;
-                border: none !important;
-            }
-        </style>
-        """
-
-    # Apply the custom CSS
-    st.markdown(custom_css, unsafe_allow_html=True)
-    st.markdown(custom_button_css, unsafe_allow_html=True)
+
     if st.button("Clear"):
         with st.spinner("Clearing Session..."):
+            if 'sql_agent' in st.session_state:
+                st.session_state['sql_agent'].clear_chat_history()
+                del st.session_state['sql_agent']
             st.session_state['sessionId'] = generate_new_session_id()
-            st.session_state['sql_agent'].clear_chat_history()
+            if RESUME_SESSIONS_FROM_URL:
+                st.query_params["session"] = st.session_state['sessionId']
             st.session_state["chat_history"] = [
-                AIMessage(content="Hello! I am a AI assistant. Ask me anything about the National Accounts Data of Egypt.")
+                new_message("AI", GREETING)
             ]
             st.success("Session Cleared Successfully!")
             # st.markdown(f'<p class="custom-success">{data}</p>', unsafe_allow_html=True)
 
-# Additional custom CSS for chat bubble
-custom_chat_css = """
-<style>
-    .chat-bubble {
-        padding: 10px;
-        border-radius: 10px;
-        margin-bottom: 10px;
-    }
-    .user-bubble {
-        background-color: #f1f0f0;
-        color: black;
-    }
-</style>
-"""
-# st.markdown(custom_chat_css, unsafe_allow_html=True)
+    # Timings, tokens and Athena stats of the last answer, shown below the chat
+    st.toggle("Debug panel", key="debug_panel")
 
 if "chat_history" not in st.session_state:
     st.session_state["chat_history"] = [
-        AIMessage(content="Hello! I am a AI assistant. Ask me anything about the National Accounts Data of Egypt.")
+        new_message("AI", GREETING)
     ]
 
+# A full run (first load, sidebar widgets) renders the whole history, the questions
+# only rerun the chat fragment below
 for msg in st.session_state["chat_history"]:
-        if isinstance(msg, HumanMessage):
-            with st.chat_message("Human"):
-                # st.write(f'<div class="chat-bubble user-bubble">{msg.content}</div>', unsafe_allow_html=True)
-                # st.markdown(f"""<div style="text-align: left; width: 100%;">{msg.content}</div>""", unsafe_allow_html=True)
-                # st.markdown(msg.content, unsafe_allow_html=True)
-                st.markdown(f'<div style="text-align": left; width: 120%; color:black !important>{msg.content}</div>', unsafe_allow_html=True) 
-        elif isinstance(msg, AIMessage):
-            with st.chat_message("AI"):
-                # st.write(f'<div class="chat-bubble">{msg.content}</div>', unsafe_allow_html=True)
-                # st.markdown(f"""<div style="text-align: left; width: 100%;">{msg.content}</div>""", unsafe_allow_html=True)
-                with st.expander("AI Output", expanded=True):
-                    # st.markdown(msg.content, unsafe_allow_html=True)
-                    st.markdown(f'<div style="text-align": left; width: 120%; color:black !important>{msg.content}</div>', unsafe_allow_html=True)    
-
-user_query = st.chat_input("Type a message...")
-if user_query:
-    st.session_state["chat_history"].append(HumanMessage(content=user_query))
-    
-    with st.chat_message("Human"):
-        # st.write(f'<div class="chat-bubble user-bubble">{user_query}</div>', unsafe_allow_html=True)
-        # st.markdown(f"""<div style="text-align: left; width: 100%;">{user_query}</div>""", unsafe_allow_html=True)    
-        # st.markdown(user_query, unsafe_allow_html=True)
-        st.markdown(f'<div style="text-align": left; width: 120%; color:black !important>{user_query}</div>', unsafe_allow_html=True) 
-    
-    with st.chat_message("AI"):
-        with st.spinner("Fetching response..."):
+    render_message(msg)
+st.session_state["rendered_messages"] = len(st.session_state["chat_history"])
+
+@st.fragment
+def chat():
+    # Only the messages added since the last full run are rendered again, the
+    # answer stays on the page without rerunning the whole script
+    for msg in st.session_state["chat_history"][st.session_state["rendered_messages"]:]:
+        render_message(msg)
+
+    user_query = st.chat_input("Type a message...")
+    if user_query:
+        st.session_state["chat_history"].append(new_message("Human", user_query))
+        render_message(st.session_state["chat_history"][-1])
+
+        with st.chat_message("AI"):
+            # The answer is rendered incrementally by fetch_data
             response_content = fetch_data(user_query)
             if response_content and response_content.strip() != "":
-                st.session_state["chat_history"].append(AIMessage(content=response_content))
-                # st.write(f'<div class="chat-bubble">{response_content}</div>', unsafe_allow_html=True)
-                # st.markdown(f"""<div style="text-align: left; width: 100%;">{response_content}</div>""", unsafe_allow_html=True)
-                with st.expander("AI Output", expanded=True):
-                    # st.markdown(response_content, unsafe_allow_html=True)
-                    st.write(f'<div style="text-align": left; width: 120%; color:black !important>{response_content}</div>', unsafe_allow_html=True)
-    # Rerun the script to update the chat display
-    st.rerun()
\ No newline at end of file
+                st.session_state["chat_history"].append(new_message("AI", response_content))
+
+    # In the fragment, so the answers (which only rerun it) refresh the panel too
+    if st.session_state.get("debug_panel"):
+        with st.expander("Debug panel", expanded=True):
+            debug_panel()
+
+chat()
@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import threading
+import time
+from pyathena.model import AthenaQueryExecution
+from sqlalchemy import create_engine, event
+from sql_cache import referenced_tables
+
+# Execution layer of the Athena queries:
+# - polling: PyAthena checks GetQueryExecution every poll_interval (1 s by default),
+#   a query done in 300 ms is only seen after a second. The cursors here check after
+#   POLL_INTERVAL_SECONDS and back off to MAX_POLL_INTERVAL_SECONDS for long queries.
+# - result reuse: Athena returns the result of the same query run in the last
+#   ATHENA_RESULT_REUSE_MINUTES without scanning the tables again (no bytes billed),
+#   across processes and restarts unlike SqlResultCache. Athena does not check the
+#   tables changed since, AthenaResultReuse bounds the age by the table refreshes.
+# - cursor: "rest" pages through GetQueryResults (1000 rows per call), "arrow" and
+#   "pandas" read the whole result file from S3 at once, for bulk results. They need
+#   pyarrow or pandas, the rest cursor is used when they cannot be imported.
+# - pool: connections (each with its boto3 Athena client) are kept for the SQL threads.
+# - logging: one JSON line per query on the "athena" logger, instead of echo=True.
+
+# "rest", "arrow" or "pandas"
+ATHENA_CURSOR = os.getenv('ATHENA_CURSOR', 'rest')
+# 0 disables the result reuse
+ATHENA_RESULT_REUSE_MINUTES = int(os.getenv('ATHENA_RESULT_REUSE_MINUTES', '60'))
+POLL_INTERVAL_SECONDS = 0.05
+MAX_POLL_INTERVAL_SECONDS = 1.0
+POLL_BACKOFF = 1.5
+# One connection per SQL thread (SQL_MAX_WORKERS in sql_tools.py)
+ATHENA_POOL_SIZE = int(os.getenv('ATHENA_POOL_SIZE', os.getenv('SQL_MAX_WORKERS', '16')))
+ATHENA_MAX_OVERFLOW = 4
+# Characters of the statement kept in a log line
+LOG_SQL_CHARS = 500
+
+logger = logging.getLogger("athena")
+
+
+class AthenaResultReuse:
+    # Max age of the Athena results a query may reuse. Registered with the caches of
+    # the TableRefreshWatcher: a query over a table refreshed N minutes ago only reuses
+    # results younger than N minutes. The first check seeds the refresh times of Glue.
+
+    def __init__(self, max_age_minutes=ATHENA_RESULT_REUSE_MINUTES) -> None:
+        self.max_age_minutes = max_age_minutes
+        self.lock = threading.Lock()
+        # Table -> time.time() of its last refresh, None -> of the last refresh of all the tables
+        self.refreshed_at = {}
+
+    def invalidate(self, tables=None):
+        # None refreshes all the tables (e.g. a replica sync)
+        now = time.time()
+        with self.lock:
+            if tables is None:
+                self.refreshed_at = {None: now}
+                return
+            for table in tables:
+                self.refreshed_at[table.lower()] = now
+
+    def seed(self, refreshed_at):
+        # Table -> time.time() of its last refresh before startup (Glue UpdateTime), the
+        # results reused from before it would be stale
+        with self.lock:
+            for table, timestamp in refreshed_at.items():
+                table = table.lower()
+                self.refreshed_at[table] = max(timestamp, self.refreshed_at.get(table, timestamp))
+
+    def max_age(self, sql):
+        # Minutes, 0 when the query must run
+        minutes = self.max_age_minutes
+        now = time.time()
+        with self.lock:
+            # None: time of the last refresh of all the tables
+            for table in [None] + list(referenced_tables(sql)):
+                refreshed_at = self.refreshed_at.get(table)
+                if refreshed_at is not None:
+                    minutes = min(minutes, int((now - refreshed_at) // 60))
+
+        return max(minutes, 0)
+
+
+class BackoffPollingCursor:
+    # Mixin of the PyAthena cursors, see cursor_class
+    result_reuse = None
+
+    def execute(self, operation, parameters=None, **kwargs):
+        if self.result_reuse is not None and "result_reuse_enable" not in kwargs:
+            minutes = self.result_reuse.max_age(operation)
+            kwargs.update(result_reuse_enable=minutes > 0, result_reuse_minutes=max(minutes, 1))
+        return super().execute(operation, parameters, **kwargs)
+
+    def _poll_until_terminal(self, query_id):
+        interval = POLL_INTERVAL_SECONDS
+        while True:
+            query_execution = self._get_query_execution(query_id)
+            if self._on_poll:
+                self._on_poll(query_execution)
+            if query_execution.state in AthenaQueryExecution.TERMINAL_STATES:
+                return query_execution
+            time.sleep(interval)
+            interval = min(interval * POLL_BACKOFF, MAX_POLL_INTERVAL_SECONDS)
+
+
+def base_cursor_class(kind):
+    # (PyAthena cursor class, kind actually used)
+    try:
+        if kind == "arrow":
+            import pyarrow  # noqa: F401
+            from pyathena.arrow.cursor import ArrowCursor
+            return ArrowCursor, kind
+        if kind == "pandas":
+            import pandas  # noqa: F401
+            from pyathena.pandas.cursor import PandasCursor
+            return PandasCursor, kind
+    except ImportError as e:
+        print(f"Athena {kind} cursor unavailable, using the rest cursor: {e}")
+    from pyathena.cursor import Cursor
+
+    return Cursor, "rest"
+
+
+def cursor_class(kind=ATHENA_CURSOR, result_reuse=None):
+    base, kind = base_cursor_class(kind)
+    return type(f"BackoffPolling{base.__name__}", (BackoffPollingCursor, base), {"result_reuse": result_reuse})
+
+
+def log_query(conn, cursor, statement, parameters, context, executemany):
+    # SQLAlchemy after_cursor_execute hook
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    logger.info(json.dumps({
+        "event": "athena_query",
+        "query_id": getattr(cursor, "query_id", None),
+        "state": getattr(cursor, "state", None),
+        "reused": getattr(cursor, "reused_previous_result", None),
+        "bytes_scanned": getattr(cursor, "data_scanned_in_bytes", None),
+        "queue_ms": getattr(cursor, "query_queue_time_in_millis", None),
+        "engine_ms": getattr(cursor, "engine_execution_time_in_millis", None),
+        "total_ms": getattr(cursor, "total_execution_time_in_millis", None),
+        "sql": statement[:LOG_SQL_CHARS],
+    }))
+
+
+def create_athena_engine(database_url, cursor=ATHENA_CURSOR, result_reuse=None, session=None, pool_size=ATHENA_POOL_SIZE):
+    # session: boto3 Session the connections build their clients with (e.g. a mock)
+    connect_args = {"cursor_class": cursor_class(cursor, result_reuse), "poll_interval": POLL_INTERVAL_SECONDS}
+    if session is not None:
+        connect_args["session"] = session
+    # No pre-ping, a ping would be an Athena query
+    engine = create_engine(database_url, connect_args=connect_args, pool_size=pool_size, max_overflow=ATHENA_MAX_OVERFLOW, pool_pre_ping=False)
+    event.listen(engine, "after_cursor_execute", log_query)
+
+    return engine
@@ -0,0 +1,117 @@
+"""Per-query overhead of the Athena engine, before and after athena_backend.py.
+
+Runs the agent queries from --threads SQL threads against MockAthenaClient, a local
+stand-in of the Athena API with per-call latency, queueing and execution time (no
+AWS). Each distinct query is asked --repeats times, as sessions asking the same
+questions. The engines compared:
+- echo engine: the engine db_connection built (echo=True, PyAthena polling every
+  second, default pool of 5 + 10 overflow connections)
+- backoff polling: pooled engine of athena_backend.py, without result reuse
+- backoff + reuse: the same with Athena result reuse (the SqlResultCache is not
+  used here, reuse also serves other processes and restarts)
+The Arrow and Pandas cursors read the result file from S3, which the mock does not
+serve: they are not measured here.
+Run from the repository root: python -m benchmarks.athena_backend
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine, text
+from athena_backend import AthenaResultReuse, create_athena_engine
+from benchmarks.fixtures import MockAthenaClient, MockAthenaSession, create_sample_database
+from benchmarks.load_test import percentile
+
+DATABASE_URL = "awsathena+rest://:@athena.us-east-1.amazonaws.com:443/athena_db?s3_staging_dir=s3://mock-athena-results/&work_group=primary"
+QUERIES = [
+    "SELECT Years, Total FROM total_value_added ORDER BY Years DESC LIMIT 1",
+    "SELECT Governorates, Total_GDP FROM governorates_totals_gdp WHERE Years = '2023/2024' ORDER BY Total_GDP DESC LIMIT 5",
+    "SELECT Activities, Total FROM sectors_growth_rates WHERE Years = '2022/2023'",
+    "SELECT Governorates, Regions, Activities, GDP_Per_Activity FROM governorates_activities_gdp WHERE Years = '2020/2019'",
+    "SELECT Years, Governorates, Activities, GDP_Per_Activity FROM governorates_activities_gdp",
+]
+
+
+def build_engine(name, session):
+    if name == "echo engine":
+        return create_engine(DATABASE_URL, echo=True, connect_args={"session": session})
+    return create_athena_engine(DATABASE_URL, session=session, result_reuse=AthenaResultReuse() if name == "backoff + reuse" else None)
+
+
+def run_queries(engine, queries, threads):
+    latencies, errors, rows = [], [], {}
+    lock = threading.Lock()
+    pending = list(queries)
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                query = pending.pop()
+            start = time.perf_counter()
+            try:
+                with engine.connect() as connection:
+                    result = [tuple(row) for row in connection.execute(text(query)).fetchall()]
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                rows[query] = result
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    return latencies, errors, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=8, help="Times each distinct query is asked")
+    parser.add_argument("--threads", type=int, default=16, help="SQL threads (SQL_MAX_WORKERS)")
+    parser.add_argument("--api-latency", type=float, default=0.03, help="Seconds per Athena API call")
+    parser.add_argument("--queue-seconds", type=float, default=0.1)
+    parser.add_argument("--execution-seconds", type=float, default=0.4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "national_accounts.db")
+    create_sample_database("sqlite:///" + path)
+    with sqlite3.connect(path) as connection:
+        expected = {query: connection.execute(query).fetchall() for query in QUERIES}
+    queries = QUERIES * args.repeats
+    random.Random(args.seed).shuffle(queries)
+
+    for name in ("echo engine", "backoff polling", "backoff + reuse"):
+        athena = MockAthenaClient(path, api_latency=args.api_latency, queue_seconds=args.queue_seconds, execution_seconds=args.execution_seconds)
+        session = MockAthenaSession(athena)
+        # The echo engine logs every statement to stdout, keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            engine = build_engine(name, session)
+            start = time.perf_counter()
+            latencies, errors, rows = run_queries(engine, queries, args.threads)
+            elapsed = time.perf_counter() - start
+        engine.dispose()
+        executions = list(athena.executions.values())
+        reused = sum(execution["reused"] for execution in executions)
+        scanned = (len(executions) - reused) * athena.scan_bytes
+        polls = athena.calls.get("GetQueryExecution", 0) / max(len(executions), 1)
+        mismatches = sum(result != expected[query] for query, result in rows.items())
+        print(f"{name:<16} queries={len(latencies):3d}  errors={len(errors)}  mismatches={mismatches}  "
+              f"p50={percentile(latencies, 50) * 1000:7.1f} ms  p99={percentile(latencies, 99) * 1000:7.1f} ms  "
+              f"total={elapsed:5.1f} s  polls/query={polls:4.1f}  reused={reused:3d}  "
+              f"scanned={scanned / 1024 ** 3:5.2f} GiB  clients built={session.clients}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Burst of identical questions from many sessions, with and without SingleFlight.
+
+--users sessions ask one of --distinct questions within --burst-seconds (a new
+quarter was just published), with fake Bedrock and Athena stand-ins. The answer and
+SQL result caches are on in both runs, they only help the sessions asking once the
+first run finished. Reports the Bedrock calls, the database queries and the latency.
+Run from the repository root: python -m benchmarks.coalescing --users 48
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine
+from invoke_agent import SqlAgent
+from shared_resources import SharedResources
+from worker_pool import AgentWorkerPool
+from benchmarks.fixtures import ScriptedChatModel, SlowSQLDatabase, create_sample_database
+from benchmarks.load_test import percentile
+
+QUESTIONS = [
+    "What is the total value added in the latest year?",
+    "What is the latest total value added?",
+    "Show me the total value added of the last year",
+    "What was the total value added last year?",
+]
+
+
+def build_resources(args, database_url, use_single_flight):
+    llm = ScriptedChatModel(latency=args.llm_latency)
+    db = SlowSQLDatabase(create_engine(database_url), latency=args.db_latency)
+    resources = SharedResources(llm=llm, db=db, use_single_flight=use_single_flight)
+    resources.worker_pool = AgentWorkerPool(args.max_concurrency, 1, args.users)
+
+    return resources, llm
+
+
+def ask(agent, question, api):
+    if api == "invoke":
+        return agent.invoke_agent(question)
+    if api == "ainvoke":
+        return asyncio.run(agent.ainvoke_agent(question))
+    return list(agent.stream_agent(question))
+
+
+def run_burst(resources, args):
+    # One script thread per session, as Streamlit runs them
+    rng = random.Random(args.seed)
+    arrivals = sorted((rng.uniform(0, args.burst_seconds), QUESTIONS[rng.randrange(args.distinct)]) for _ in range(args.users))
+    latencies, paths, errors = [], [], []
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def run_user(user, arrival, question):
+        agent = SqlAgent(resources=resources, session_id=f"user-{user}", use_fast_path=False)
+        time.sleep(max(arrival - (time.perf_counter() - start), 0))
+        asked = time.perf_counter()
+        try:
+            ask(agent, question, args.api)
+        except Exception as e:
+            with lock:
+                errors.append(e)
+            return
+        with lock:
+            latencies.append(time.perf_counter() - asked)
+            paths.append(agent.last_trace.path)
+
+    threads = [threading.Thread(target=run_user, args=(user, arrival, question)) for user, (arrival, question) in enumerate(arrivals)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return latencies, paths, errors
+
+
+def report(name, resources, llm, latencies, paths, errors):
+    counts = {path: paths.count(path) for path in sorted(set(paths))}
+    print(f"{name:<14} answers={len(latencies):3d}  errors={len(errors)}  bedrock calls={llm.calls:3d}  "
+          f"database queries={resources.db.queries:3d}  p50={percentile(latencies, 50) * 1000:7.1f} ms  "
+          f"p95={percentile(latencies, 95) * 1000:7.1f} ms  p99={percentile(latencies, 99) * 1000:7.1f} ms  "
+          f"paths={', '.join(f'{path}={count}' for path, count in counts.items())}")
+    if resources.single_flight is not None:
+        print(f"{'':<14} single flight: {resources.single_flight.metrics()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=48)
+    parser.add_argument("--distinct", type=int, default=2, choices=range(1, len(QUESTIONS) + 1), help="Distinct questions of the burst")
+    parser.add_argument("--burst-seconds", type=float, default=2.0, help="Seconds within which every session asks")
+    parser.add_argument("--api", choices=["stream", "invoke", "ainvoke"], default="stream")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds per fake Bedrock call")
+    parser.add_argument("--db-latency", type=float, default=1.0, help="Seconds per fake Athena query")
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    database_url = create_sample_database("sqlite:///" + os.path.join(tempfile.mkdtemp(), "national_accounts.db"))
+
+    results = []
+    # The agent is verbose, keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, use_single_flight in (("no coalescing", False), ("single flight", True)):
+            resources, llm = build_resources(args, database_url, use_single_flight)
+            results.append((name, resources, llm, *run_burst(resources, args)))
+
+    for result in results:
+        report(*result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Share of a workload answered by the intent router and its latency.
+
+Runs every question of the corpus through IntentRouter against the sqlite stand-in
+(or --database-url). Questions it does not route would go to the agent.
+Run from the repository root: python -m benchmarks.fast_path
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from sqlalchemy import create_engine
+from langchain_community.utilities import SQLDatabase
+from intent_router import IntentRouter
+from benchmarks.fixtures import create_sample_database
+from benchmarks.prompt_savings import CORPUS_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    database_url = args.database_url or create_sample_database("sqlite:///" + os.path.join(tempfile.mkdtemp(), "national_accounts.db"))
+    router = IntentRouter(SQLDatabase(create_engine(database_url)))
+    with open(args.corpus) as f:
+        questions = [item["question"] for item in json.load(f)]
+
+    routed_timings = []
+    for question in questions:
+        start = time.perf_counter()
+        response = router.route(question)
+        elapsed = time.perf_counter() - start
+        if response is not None:
+            routed_timings.append(elapsed)
+        target = response["intermediate_steps"][0][0].log if response is not None else "agent"
+        print(f"{elapsed * 1000:8.2f} ms  {target:<40}  {question[:70]}")
+
+    print(f"\nfast path: {len(routed_timings)}/{len(questions)} questions ({len(routed_timings) / len(questions):.0%})")
+    if routed_timings:
+        print(f"fast path latency: median={statistics.median(routed_timings) * 1000:.2f} ms  max={max(routed_timings) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
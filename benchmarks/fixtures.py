@@ -0,0 +1,339 @@
+import asyncio
+import itertools
+import random
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any
+from sqlalchemy import create_engine, MetaData, Table, Column, String, Float
+from langchain_community.utilities import SQLDatabase
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from prompts import parse_table_description
+from rollups import ROLLUPS, build_rollups
+
+# Local stand-ins used by the benchmarks so they run without AWS
+YEARS = [f"{year}/{year - 1}" for year in range(2016, 2025)]
+TEXT_COLUMNS = ["Governorates", "Regions", "Years", "Activities", "Components"]
+
+
+def create_sample_database(database_url, seed=0):
+    # Create the national accounts tables described in the prompt and fill them
+    # with deterministic synthetic values, the rollups are then built from them
+    engine = create_engine(database_url)
+    metadata = MetaData()
+    rng = random.Random(seed)
+    tables = parse_table_description()
+
+    for name, description in tables.items():
+        if name in ROLLUPS:
+            continue
+        columns = [
+            Column(column, String if column in TEXT_COLUMNS else Float)
+            for column in description["columns"]
+        ]
+        table = Table(name, metadata, *columns)
+        metadata.drop_all(engine, tables=[table])
+        metadata.create_all(engine, tables=[table])
+
+        # One row per year and per value of every categorical column (except Regions)
+        rows = [{"Years": year} for year in YEARS]
+        for column, values in description["values"].items():
+            if column == "Regions":
+                continue
+            rows = [dict(row, **{column: value}) for row in rows for value in values]
+        for row in rows:
+            for column in description["columns"]:
+                if column == "Regions":
+                    row[column] = rng.choice(description["values"][column])
+                elif column not in row:
+                    row[column] = round(rng.uniform(1, 100000), 2)
+
+        with engine.begin() as connection:
+            connection.execute(table.insert(), rows)
+
+    build_rollups(engine)
+    engine.dispose()
+
+    return database_url
+
+
+class ScriptedChatModel(BaseChatModel):
+    # Fake Bedrock model following the ReAct format: the first call of a run asks for
+    # one sql_db_query, the call after the observation gives the final answer
+    sql: str = "SELECT Years, Total FROM total_value_added ORDER BY Years DESC LIMIT 1"
+    answer: str = "<p>The total value added is in the table above.</p>"
+    latency: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "scripted"
+
+    def get_content(self, messages):
+        self.calls += 1
+        prompt = messages[-1].content
+        if prompt.rstrip().endswith("Thought:"):
+            return f"I now know the final answer\nFinal Answer: {self.answer}"
+        return f"Thought: I should look at the data\nAction: sql_db_query\nAction Input: {self.sql}"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.get_content(messages)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.get_content(messages)))])
+
+
+class ReplayChatModel(BaseChatModel):
+    # Fake Bedrock model giving back the outputs saved for each question, in order,
+    # after the saved latency (synthetic fixtures, see benchmarks/replay.py). recordings: {question: [{"output", "latency"}, ...]}
+    # Token usage is estimated from the prompt so prompt changes show up in the results.
+    recordings: dict = {}
+    latency_scale: float = 1.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "replay"
+
+    def get_recording(self, messages):
+        self.calls += 1
+        prompt = messages[-1].content
+        # The last "Question:" of the prompt is the user question, the scratchpad follows
+        question_start = prompt.rfind("Question: ")
+        question = prompt[question_start:].split("\n", 1)[0][len("Question: "):].strip()
+        step = len(re.findall(r"^\s*Observation:", prompt[question_start:], re.M))
+        steps = self.recordings.get(question)
+        if steps is None or step >= len(steps):
+            raise ValueError(f"No recorded output for step {step} of {question!r}")
+        recording = steps[step]
+        usage = {"input_tokens": len(prompt) // 4, "output_tokens": len(recording["output"]) // 4}
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        message = AIMessage(content=recording["output"], usage_metadata=usage)
+
+        return message, recording.get("latency", 0.0) * self.latency_scale
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message, latency = self.get_recording(messages)
+        time.sleep(latency)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        message, latency = self.get_recording(messages)
+        await asyncio.sleep(latency)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class ThrottlingError(Exception):
+    pass
+
+
+class FlakyChatModel(BaseChatModel):
+    # Fake Bedrock model with a long latency tail and throttled calls: slow_rate of the
+    # calls take slow_factor times longer, throttle_rate fail after throttle_latency
+    latency: float = 1.0
+    slow_rate: float = 0.0
+    slow_factor: float = 10.0
+    throttle_rate: float = 0.0
+    throttle_latency: float = 0.1
+    seed: int = 0
+    calls: int = 0
+    rng: Any = None
+
+    @property
+    def _llm_type(self):
+        return "flaky"
+
+    def next_call(self):
+        # (seconds, throttled) of the next call
+        if self.rng is None:
+            self.rng = random.Random(self.seed)
+        self.calls += 1
+        if self.rng.random() < self.throttle_rate:
+            return self.throttle_latency, True
+        latency = self.latency * self.rng.uniform(0.8, 1.2)
+        if self.rng.random() < self.slow_rate:
+            latency *= self.slow_factor
+        return latency, False
+
+    def result(self, throttled):
+        if throttled:
+            raise ThrottlingError("ThrottlingException: Too many requests, please wait before trying again.")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="Final Answer: ok"))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        latency, throttled = self.next_call()
+        time.sleep(latency)
+        return self.result(throttled)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        latency, throttled = self.next_call()
+        await asyncio.sleep(latency)
+        return self.result(throttled)
+
+
+class SlowSQLDatabase(SQLDatabase):
+    # Local database with an Athena-like round-trip latency added to every query
+
+    def __init__(self, engine, latency=0.0, **kwargs) -> None:
+        super().__init__(engine, **kwargs)
+        self.latency = latency
+        self.queries = 0
+
+    def run(self, command, *args, **kwargs):
+        self.queries += 1
+        time.sleep(self.latency)
+        return super().run(command, *args, **kwargs)
+
+
+class MockAthenaClient:
+    # Athena API stand-in (StartQueryExecution, GetQueryExecution, GetQueryResults,
+    # StopQueryExecution) running the queries on a sqlite file. Every call takes
+    # api_latency seconds, a query is QUEUED for queue_seconds then RUNNING for
+    # execution_seconds and scans scan_bytes. With ResultReuseConfiguration enabled, the
+    # same query string succeeded within MaxAgeInMinutes is reused: it succeeds after
+    # reuse_seconds without scanning. Results are paged like GetQueryResults, with the
+    # column labels as the first row.
+
+    def __init__(self, database_path, api_latency=0.03, queue_seconds=0.1, execution_seconds=0.4, reuse_seconds=0.05, scan_bytes=64 * 1024 * 1024) -> None:
+        self.database_path = database_path
+        self.api_latency = api_latency
+        self.queue_seconds = queue_seconds
+        self.execution_seconds = execution_seconds
+        self.reuse_seconds = reuse_seconds
+        self.scan_bytes = scan_bytes
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        # Query id -> execution
+        self.executions = {}
+        self.calls = {}
+
+    def call(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        time.sleep(self.api_latency)
+
+    def run(self, query):
+        # (columns, rows, error)
+        connection = sqlite3.connect(self.database_path)
+        try:
+            cursor = connection.execute(query)
+            return [column[0] for column in cursor.description or []], cursor.fetchall(), None
+        except sqlite3.Error as e:
+            return [], [], str(e)
+        finally:
+            connection.close()
+
+    def start_query_execution(self, QueryString, ResultReuseConfiguration=None, **kwargs):
+        self.call("StartQueryExecution")
+        reuse = (ResultReuseConfiguration or {}).get("ResultReuseByAgeConfiguration", {})
+        now = time.time()
+        with self.lock:
+            previous = None
+            if reuse.get("Enabled"):
+                previous = next((execution for execution in reversed(self.executions.values())
+                                 if execution["query"] == QueryString and not execution["error"] and execution["done_at"] <= now
+                                 and now - execution["done_at"] <= reuse["MaxAgeInMinutes"] * 60), None)
+            query_id = f"mock-{next(self.ids)}"
+        if previous is not None:
+            execution = dict(previous, submitted_at=now, running_at=now, done_at=now + self.reuse_seconds, reused=True, cancelled=False)
+        else:
+            columns, rows, error = self.run(QueryString)
+            running_at = now + self.queue_seconds
+            execution = {"query": QueryString, "columns": columns, "rows": rows, "error": error, "submitted_at": now,
+                         "running_at": running_at, "done_at": running_at + self.execution_seconds, "reused": False, "cancelled": False}
+        with self.lock:
+            self.executions[query_id] = execution
+
+        return {"QueryExecutionId": query_id}
+
+    def state(self, execution):
+        now = time.time()
+        if execution["cancelled"]:
+            return "CANCELLED"
+        if now < execution["running_at"]:
+            return "QUEUED"
+        if now < execution["done_at"]:
+            return "RUNNING"
+        return "FAILED" if execution["error"] else "SUCCEEDED"
+
+    def get_query_execution(self, QueryExecutionId):
+        self.call("GetQueryExecution")
+        execution = self.executions[QueryExecutionId]
+        state = self.state(execution)
+        done = state in ("SUCCEEDED", "FAILED", "CANCELLED")
+        milliseconds = lambda seconds: int(seconds * 1000)
+        status = {"State": state, "SubmissionDateTime": datetime.fromtimestamp(execution["submitted_at"], timezone.utc)}
+        if done:
+            status["CompletionDateTime"] = datetime.fromtimestamp(execution["done_at"], timezone.utc)
+        if state == "FAILED":
+            status["StateChangeReason"] = execution["error"]
+        statistics = {"ResultReuseInformation": {"ReusedPreviousResult": execution["reused"]}}
+        if done:
+            statistics.update({
+                "DataScannedInBytes": 0 if execution["reused"] else self.scan_bytes,
+                "QueryQueueTimeInMillis": milliseconds(execution["running_at"] - execution["submitted_at"]),
+                "EngineExecutionTimeInMillis": milliseconds(execution["done_at"] - execution["running_at"]),
+                "TotalExecutionTimeInMillis": milliseconds(execution["done_at"] - execution["submitted_at"]),
+            })
+
+        return {"QueryExecution": {
+            "QueryExecutionId": QueryExecutionId,
+            "Query": execution["query"],
+            "StatementType": "DML",
+            "Status": status,
+            "Statistics": statistics,
+        }}
+
+    def get_query_results(self, QueryExecutionId, MaxResults=1000, NextToken=None, **kwargs):
+        self.call("GetQueryResults")
+        execution = self.executions[QueryExecutionId]
+        columns, rows = execution["columns"], execution["rows"]
+        types = []
+        for index in range(len(columns)):
+            value = next((row[index] for row in rows if row[index] is not None), None)
+            types.append("bigint" if isinstance(value, int) else "double" if isinstance(value, float) else "varchar")
+
+        def athena_row(values):
+            return {"Data": [{"VarCharValue": str(value)} if value is not None else {} for value in values]}
+
+        start = int(NextToken or 0)
+        page = [athena_row(columns)] if start == 0 else []
+        end = start + MaxResults - len(page)
+        page += [athena_row(row) for row in rows[start:end]]
+        response = {"ResultSet": {"Rows": page, "ResultSetMetadata": {"ColumnInfo": [
+            {"Name": column, "Label": column, "Type": column_type, "Precision": 0, "Scale": 0, "Nullable": "UNKNOWN"} for column, column_type in zip(columns, types)
+        ]}}, "UpdateCount": 0}
+        if end < len(rows):
+            response["NextToken"] = str(end)
+
+        return response
+
+    def stop_query_execution(self, QueryExecutionId):
+        self.call("StopQueryExecution")
+        self.executions[QueryExecutionId]["cancelled"] = True
+        return {}
+
+    def close(self):
+        pass
+
+
+class MockAthenaSession:
+    # boto3 Session stand-in giving the MockAthenaClient to every PyAthena connection.
+    # Building a client takes client_seconds, as botocore loading its service models
+    region_name = "us-east-1"
+
+    def __init__(self, athena, client_seconds=0.03) -> None:
+        self.athena = athena
+        self.client_seconds = client_seconds
+        self.clients = 0
+
+    def client(self, service_name, **kwargs):
+        self.clients += 1
+        time.sleep(self.client_seconds)
+        return self.athena
@@ -0,0 +1,107 @@
+"""Load test of concurrent agent runs with fake Bedrock and Athena stand-ins.
+
+Compares one thread per session calling invoke_agent (how Streamlit ran the agent)
+with ainvoke_agent on the shared worker pool, at the same concurrency (--threads
+defaults to --max-concurrency), and reports requests/sec and latency. The pool bounds
+the runs in flight and the waiting runs, it is not faster than threads: every run
+hops to the pool loop (defaults: 7.5 rps for both; --users 8 --llm-latency 0.05
+--db-latency 0.05 --max-concurrency 8: 36 rps with threads, 26 with the pool).
+The fake model has a real _agenerate, ChatBedrock does not: its async calls are only
+offloaded to threads (_generate in the default executor of the loop), not async I/O.
+Run from the repository root: python -m benchmarks.load_test --users 32
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine
+from invoke_agent import SqlAgent
+from shared_resources import SharedResources
+from worker_pool import AgentWorkerPool
+from benchmarks.fixtures import ScriptedChatModel, SlowSQLDatabase, create_sample_database
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def report(name, latencies, elapsed):
+    print(f"{name:<22} requests={len(latencies):4d}  rps={len(latencies) / elapsed:7.2f}  "
+          f"p50={percentile(latencies, 50) * 1000:8.1f} ms  p95={percentile(latencies, 95) * 1000:8.1f} ms")
+
+
+def build_resources(args, database_url):
+    llm = ScriptedChatModel(latency=args.llm_latency)
+    db = SlowSQLDatabase(create_engine(database_url), latency=args.db_latency)
+    resources = SharedResources(llm=llm, db=db, use_sql_result_cache=False)
+    resources.worker_pool = AgentWorkerPool(args.max_concurrency, args.per_user_concurrency, args.users * args.questions)
+
+    return resources
+
+
+def run_threads(resources, args):
+    def run_user(user):
+        agent = SqlAgent(resources=resources, use_answer_cache=False)
+        latencies = []
+        for question in range(args.questions):
+            start = time.perf_counter()
+            agent.invoke_agent(f"Question {question} of user {user}")
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        return [latency for latencies in executor.map(run_user, range(args.users)) for latency in latencies]
+
+
+async def run_async(resources, args):
+    async def run_user(user):
+        agent = SqlAgent(resources=resources, use_answer_cache=False, session_id=f"user-{user}")
+        latencies = []
+        for question in range(args.questions):
+            start = time.perf_counter()
+            await agent.ainvoke_agent(f"Question {question} of user {user}")
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    results = await asyncio.gather(*(run_user(user) for user in range(args.users)))
+    return [latency for latencies in results for latency in latencies]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--questions", type=int, default=2, help="Questions asked by each user, one after the other")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds per fake Bedrock call")
+    parser.add_argument("--db-latency", type=float, default=1.0, help="Seconds per fake Athena query")
+    parser.add_argument("--threads", type=int, default=None, help="Threads of the threaded run, --max-concurrency by default")
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    parser.add_argument("--per-user-concurrency", type=int, default=1)
+    args = parser.parse_args()
+    if args.threads is None:
+        args.threads = args.max_concurrency
+
+    database_url = create_sample_database("sqlite:///" + os.path.join(tempfile.mkdtemp(), "national_accounts.db"))
+
+    # The agent is verbose, keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        resources = build_resources(args, database_url)
+        start = time.perf_counter()
+        threaded = run_threads(resources, args)
+        threaded_elapsed = time.perf_counter() - start
+
+        resources = build_resources(args, database_url)
+        start = time.perf_counter()
+        pooled = asyncio.run(run_async(resources, args))
+        pooled_elapsed = time.perf_counter() - start
+
+    report(f"threads={args.threads} + invoke", threaded, threaded_elapsed)
+    report(f"pool={args.max_concurrency} + ainvoke", pooled, pooled_elapsed)
+
+
+if __name__ == "__main__":
+    main()
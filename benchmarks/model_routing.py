@@ -0,0 +1,113 @@
+"""Answer latency of the model router under Bedrock throttling and long tails.
+
+Every corpus question makes --calls sequential LLM calls (an agent action and the
+final answer) against fake models: the large model is slower than the fast one, and
+both throttle some calls and take --slow-factor times longer on others. Compares:
+- large only: every call on the large model, retried until it succeeds (how the agent
+  ran with botocore max_attempts=100)
+- routed: RoutedChatModel with the fast model for single value lookups, hedging,
+  fallback to the other model and the answer deadline
+--time-scale shrinks every latency, hedge delay and deadline to keep the run short.
+Run from the repository root: python -m benchmarks.model_routing
+"""
+import argparse
+import asyncio
+import json
+import time
+from langchain_core.messages import HumanMessage
+from model_router import MAX_ATTEMPTS, choose_model_tier, DeadlineExceededError, RoutedChatModel
+from tracing import CURRENT_TRACE, METRICS, Trace
+from benchmarks.fixtures import FlakyChatModel
+from benchmarks.load_test import percentile
+from benchmarks.replay import CORPUS_PATH
+
+# Seconds of a call without throttling or slowdown, before --time-scale
+LARGE_LATENCY = 3.0
+FAST_LATENCY = 0.8
+# Seconds after which a call is hedged (above the usual latency) and of an answer
+HEDGE_AFTER = {"fast": 1.5, "large": 5.0}
+DEADLINE_SECONDS = 60.0
+BASELINE_BACKOFF_SECONDS = 1.0
+
+
+def build_models(args, seed):
+    def model(latency, offset):
+        return FlakyChatModel(latency=latency * args.time_scale, slow_rate=args.slow_rate, slow_factor=args.slow_factor,
+                              throttle_rate=args.throttle_rate, throttle_latency=0.1 * args.time_scale, seed=seed + offset)
+
+    return model(LARGE_LATENCY, 0), model(FAST_LATENCY, 1)
+
+
+def counter(name):
+    return sum(value for (counter_name, _), value in list(METRICS.counters.items()) if counter_name == name)
+
+
+async def run(name, router, questions, args, routed):
+    async def answer(question):
+        trace = Trace(question)
+        trace.model_tier = choose_model_tier(question) if routed else "large"
+        trace.deadline = time.monotonic() + router.timeout
+        CURRENT_TRACE.set(trace)
+        start = time.perf_counter()
+        try:
+            for _ in range(args.calls):
+                await router.agenerate([[HumanMessage(content=question)]])
+        except DeadlineExceededError:
+            return time.perf_counter() - start, trace.model_tier, "deadline"
+        except Exception:
+            return time.perf_counter() - start, trace.model_tier, "error"
+        return time.perf_counter() - start, trace.model_tier, None
+
+    names = ("sql_agent_llm_hedges_total", "sql_agent_llm_fallbacks_total", "sql_agent_llm_failures_total")
+    before = {counter_name: counter(counter_name) for counter_name in names}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(question):
+        async with semaphore:
+            return await answer(question)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(limited(question) for question in questions))
+    elapsed = time.perf_counter() - start
+
+    # Latencies reported at --time-scale 1
+    latencies = [latency / args.time_scale for latency, _, error in results if error is None]
+    errors = sum(error is not None for _, _, error in results)
+    deadline = sum(error == "deadline" for _, _, error in results)
+    tiers = {tier: sum(result_tier == tier for _, result_tier, _ in results) for tier in ("fast", "large")}
+    delta = {counter_name: counter(counter_name) - before[counter_name] for counter_name in names}
+    print(f"{name:<11} answers={len(results):4d}  p50={percentile(latencies, 50):6.2f} s  p95={percentile(latencies, 95):6.2f} s  "
+          f"p99={percentile(latencies, 99):6.2f} s  max={max(latencies):6.2f} s  errors={errors} (deadline {deadline})  "
+          f"fast/large={tiers['fast']}/{tiers['large']}  throttled={delta['sql_agent_llm_failures_total']}  "
+          f"hedges={delta['sql_agent_llm_hedges_total']}  retries={delta['sql_agent_llm_fallbacks_total']}  ({elapsed:.1f} s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20, help="Runs of every corpus question")
+    parser.add_argument("--calls", type=int, default=2, help="LLM calls of an answer")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--throttle-rate", type=float, default=0.15, help="Share of the calls throttled by Bedrock")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="Share of the calls in the long tail")
+    parser.add_argument("--slow-factor", type=float, default=8.0)
+    parser.add_argument("--time-scale", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH) as f:
+        questions = [item["question"] for item in json.load(f)] * args.repeat
+    scale = args.time_scale
+
+    large, _ = build_models(args, args.seed)
+    baseline = RoutedChatModel(models={"large": large}, fallbacks={}, hedge_after=None, max_attempts=100,
+                               retry_backoff=BASELINE_BACKOFF_SECONDS * scale, timeout=3600)
+    asyncio.run(run("large only", baseline, questions, args, routed=False))
+
+    large, fast = build_models(args, args.seed)
+    router = RoutedChatModel(models={"large": large, "fast": fast}, hedge_after={tier: delay * scale for tier, delay in HEDGE_AFTER.items()},
+                             max_attempts=MAX_ATTEMPTS, retry_backoff=0.25 * scale, timeout=DEADLINE_SECONDS * scale)
+    asyncio.run(run("routed", router, questions, args, routed=True))
+
+
+if __name__ == "__main__":
+    main()
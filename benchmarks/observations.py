@@ -0,0 +1,82 @@
+"""Prompt tokens of large sql_db_query observations, raw and compacted.
+
+Runs wide agent queries (every governorate and activity, several years) against the
+sqlite stand-in through the sql_db_query tool of the agent, with and without the
+ObservationStore. Every observation is resent in the scratchpad of the following
+ReAct steps, --later-steps of them are counted. Then pages through every compacted
+result with sql_db_fetch_rows and checks the rows are exactly the database rows.
+Run from the repository root: python -m benchmarks.observations
+"""
+import argparse
+import os
+import tempfile
+from sqlalchemy import create_engine
+from conversation_memory import count_tokens
+from observations import ObservationStore, parse_rows
+from sql_tools import AgentSQLDatabaseToolkit
+from benchmarks.fixtures import SlowSQLDatabase, ScriptedChatModel, create_sample_database
+
+QUERIES = [
+    "SELECT Governorates, Regions, Activities, GDP_Per_Activity FROM governorates_activities_gdp WHERE Years = '2020/2019' LIMIT 1000",
+    "SELECT Years, Governorates, Activities, GDP_Per_Activity FROM governorates_activities_gdp WHERE Activities = 'Construction' ORDER BY GDP_Per_Activity DESC LIMIT 100",
+    "SELECT Governorates, Years, Total_GDP FROM governorates_totals_gdp LIMIT 200",
+    "SELECT Activities, Years, Q1, Q2, Q3, Q4, Total FROM sectors_growth_rates LIMIT 100",
+    "SELECT Years, Total FROM total_value_added LIMIT 4",
+]
+
+
+def query_tool(db, observation_store):
+    toolkit = AgentSQLDatabaseToolkit(db=db, llm=ScriptedChatModel(), observation_store=observation_store)
+    tools = {tool.name: tool for tool in toolkit.get_tools()}
+    return tools["sql_db_query"], tools.get("sql_db_fetch_rows")
+
+
+def fetch_all(fetch_tool, observation):
+    # Every row of a compacted result, through sql_db_fetch_rows
+    result_id = observation.split(":", 1)[0].split()[-1]
+    rows, start, calls = [], 0, 0
+    while True:
+        page = fetch_tool.invoke(f"{result_id} {start}")
+        calls += 1
+        rows.extend(parse_rows(page.split("\n")[2]))
+        if "For the next rows" not in page:
+            return rows, calls
+        start = len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--later-steps", type=int, default=2, help="ReAct steps resending an observation")
+    parser.add_argument("--show", action="store_true", help="Print the compacted observations")
+    args = parser.parse_args()
+
+    database_url = create_sample_database("sqlite:///" + os.path.join(tempfile.mkdtemp(), "national_accounts.db"))
+    db = SlowSQLDatabase(create_engine(database_url))
+    raw_tool, _ = query_tool(db, None)
+    store = ObservationStore()
+    compact_tool, fetch_tool = query_tool(db, store)
+
+    total_raw, total_compact, mismatches = 0, 0, 0
+    for query in QUERIES:
+        raw = raw_tool.invoke(query)
+        compacted = compact_tool.invoke(query)
+        total_raw += count_tokens(raw)
+        total_compact += count_tokens(compacted)
+        fetched = ""
+        if compacted != raw:
+            rows, calls = fetch_all(fetch_tool, compacted)
+            exact = rows == parse_rows(raw)
+            mismatches += not exact
+            fetched = f"  fetched back in {calls} calls: {'exact' if exact else 'MISMATCH'}"
+        print(f"{count_tokens(raw):6d} -> {count_tokens(compacted):4d} tokens{fetched:<36}  {query[:80]}")
+        if args.show and compacted != raw:
+            print(compacted + "\n")
+
+    later = args.later_steps + 1
+    print(f"\nobservation tokens {total_raw} -> {total_compact}  "
+          f"scratchpad tokens over {later} LLM calls {total_raw * later} -> {total_compact * later} "
+          f"({1 - total_compact / total_raw:.1%} fewer)  mismatches={mismatches}  store={store.metrics()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Prompt size with the full table description vs the schema selected per question.
+
+Tokens are estimated at 4 characters per token. The ReAct loop resends the prompt on
+every step, so the savings are multiplied by --steps.
+Run from the repository root: python -m benchmarks.prompt_savings
+"""
+import argparse
+import json
+import os
+from prompts import AGENT_PROMPT_TEMPLATE, TABLE_DESCRIPTION
+from schema_retrieval import select_table_description, select_tables
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "corpus.json")
+
+
+def estimate_tokens(text):
+    return len(text) // 4
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--steps", type=int, default=3, help="Average LLM calls per question")
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        questions = [item["question"] for item in json.load(f)]
+
+    full_tokens = estimate_tokens(AGENT_PROMPT_TEMPLATE + TABLE_DESCRIPTION)
+    total_full, total_pruned = 0, 0
+    for question in questions:
+        pruned_tokens = estimate_tokens(AGENT_PROMPT_TEMPLATE + select_table_description(question))
+        total_full += full_tokens
+        total_pruned += pruned_tokens
+        print(f"{full_tokens:6d} -> {pruned_tokens:6d}  {question[:60]:<60}  {', '.join(select_tables(question))}")
+
+    saved = total_full - total_pruned
+    print(f"\nquestions={len(questions)}  prompt tokens {total_full} -> {total_pruned} "
+          f"({saved / total_full:.1%} saved, ~{saved * args.steps} tokens over {args.steps} steps per question)")
+
+
+if __name__ == "__main__":
+    main()
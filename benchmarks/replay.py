@@ -0,0 +1,215 @@
+"""Replays the question corpus through SqlAgent without network access.
+
+Bedrock is replaced by the outputs saved for each question (recordings.json) and
+Athena by the sqlite stand-in. The shipped recordings are synthetic fixtures written
+by hand (SQL plus a placeholder final answer), not captured Bedrock responses: with
+them the accuracy checks the pipeline around the model (prompt, paths, SQL run and
+data returned), not the answers of the model. --record saves real outputs instead. For every question it reports the latency, the path
+(cache, fast_path, structured, agent), the agent steps, the estimated prompt tokens (and
+those read from the simulated prompt cache, --prompt-cache off to disable it), the SQL run and
+whether the data returned contains the rows of the corpus expected_sql (or the answer
+contains expected_answer). Changes to the prompt or the table description show up in
+the prompt tokens, changes to the pipeline in the steps, SQL and correctness.
+With --mode structured little is read from the prompt cache: the static prefix of the
+structured prompt is under the 1024 tokens Bedrock caches, only the prefixes ending
+after the table description are.
+
+--output saves the results, --baseline compares with saved results and exits with 1
+on a correctness drop or a regression larger than --tolerance, to gate changes.
+--record re-records the outputs of the real Bedrock model (needs AWS access).
+Run from the repository root: python -m benchmarks.replay
+"""
+import argparse
+import ast
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from langchain_core.callbacks import BaseCallbackHandler
+from sqlalchemy import create_engine, text
+from invoke_agent import SqlAgent
+from shared_resources import SharedResources
+from benchmarks.fixtures import ReplayChatModel, SlowSQLDatabase, create_sample_database
+from benchmarks.load_test import percentile
+from benchmarks.prompt_savings import CORPUS_PATH
+
+RECORDINGS_PATH = os.path.join(os.path.dirname(__file__), "recordings.json")
+# The structured mode sends other prompts, its outputs are recorded apart
+STRUCTURED_RECORDINGS_PATH = os.path.join(os.path.dirname(__file__), "recordings_structured.json")
+
+
+class RecordingCallbackHandler(BaseCallbackHandler):
+    # Collects the outputs and latencies of the real model for recordings.json
+
+    def __init__(self) -> None:
+        self.steps = []
+        self.starts = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        latency = time.perf_counter() - self.starts.pop(run_id, time.perf_counter())
+        self.steps.append({"output": response.generations[0][0].text, "latency": round(latency, 2)})
+
+
+def observed_rows(steps):
+    rows = []
+    for action, observation in steps:
+        if action.tool != "sql_db_query":
+            continue
+        try:
+            rows.extend(tuple(row) for row in ast.literal_eval(str(observation)))
+        except (ValueError, SyntaxError, TypeError):
+            pass
+    return rows
+
+
+def is_correct(item, response, steps, engine):
+    # None when the corpus has nothing to check
+    if item.get("expected_sql"):
+        with engine.connect() as connection:
+            expected = [tuple(row) for row in connection.execute(text(item["expected_sql"])).fetchall()]
+        rows = observed_rows(steps)
+        return bool(expected) and all(row in rows for row in expected)
+    if item.get("expected_answer"):
+        return item["expected_answer"].lower() in (response.get("output") or "").lower()
+    return None
+
+
+def run_question(resources, item, args, engine):
+    agent = SqlAgent(resources=resources, use_answer_cache=False, session_id="benchmark",
+                     prune_schema=not args.no_prune_schema, use_fast_path=not args.no_fast_path, mode=args.mode)
+    recorder = RecordingCallbackHandler()
+    if args.record:
+        resources.llm.callbacks = [recorder]
+    # The agent executor is verbose
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            response, _, steps = agent.invoke_agent(item["question"])
+            error = None
+        except Exception as e:
+            response, steps, error = {}, [], str(e)
+    trace = agent.last_trace
+
+    return {
+        "question": item["question"],
+        "path": trace.path,
+        "latency": trace.duration,
+        "steps": trace.iterations,
+        "llm_calls": len([span for span in trace.spans if span["kind"] == "llm"]),
+        # Every prompt token, cached or not
+        "prompt_tokens": sum(trace.total("llm", attribute) for attribute in ("input_tokens", "cache_read_tokens", "cache_write_tokens")),
+        "cache_read_tokens": trace.total("llm", "cache_read_tokens"),
+        "cache_write_tokens": trace.total("llm", "cache_write_tokens"),
+        "output_tokens": trace.total("llm", "output_tokens"),
+        "sql": [action.tool_input for action, _ in steps if action.tool == "sql_db_query"],
+        "correct": is_correct(item, response, steps, engine) if error is None else False,
+        "error": error,
+        "recording": recorder.steps,
+    }
+
+
+def summarize(results):
+    checked = [result for result in results if result["correct"] is not None]
+    latencies = [result["latency"] for result in results]
+    return {
+        "questions": len(results),
+        "accuracy": sum(1 for result in checked if result["correct"]) / len(checked) if checked else None,
+        "p50_latency": percentile(latencies, 50),
+        "p95_latency": percentile(latencies, 95),
+        "mean_steps": statistics.mean(result["steps"] for result in results),
+        "llm_calls": sum(result["llm_calls"] for result in results),
+        "prompt_tokens": sum(result["prompt_tokens"] for result in results),
+        "cache_read_tokens": sum(result["cache_read_tokens"] for result in results),
+        "cache_write_tokens": sum(result["cache_write_tokens"] for result in results),
+        "output_tokens": sum(result["output_tokens"] for result in results),
+        "sql_queries": sum(len(result["sql"]) for result in results),
+    }
+
+
+def compare(summary, baseline, tolerance):
+    # Regressions of the current run against the baseline summary
+    regressions = []
+    if baseline["accuracy"] is not None and (summary["accuracy"] or 0) < baseline["accuracy"]:
+        regressions.append(f"accuracy {baseline['accuracy']:.1%} -> {summary['accuracy']:.1%}")
+    for metric in ("p50_latency", "p95_latency", "mean_steps", "llm_calls", "prompt_tokens", "sql_queries"):
+        # Latencies under 50 ms apart are noise of the local stand-ins
+        min_delta = 0.05 if metric.endswith("latency") else 0
+        if summary[metric] > baseline[metric] * (1 + tolerance) and summary[metric] - baseline[metric] > min_delta:
+            regressions.append(f"{metric} {baseline[metric]:.3f} -> {summary[metric]:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--mode", choices=["react", "structured"], default="react")
+    parser.add_argument("--recordings", default=None, help="Bedrock outputs to replay (synthetic fixtures unless saved with --record), by default those of --mode")
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplies the recorded Bedrock latencies, 0 to skip them")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="Seconds added to every query of the stand-in")
+    parser.add_argument("--no-fast-path", action="store_true")
+    parser.add_argument("--no-prune-schema", action="store_true")
+    parser.add_argument("--prompt-cache", choices=["simulated", "off"], default="simulated")
+    parser.add_argument("--output", default=None, help="Save the results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="Results JSON file of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative regression against the baseline")
+    parser.add_argument("--record", action="store_true", help="Use Bedrock and save its outputs to --recordings")
+    args = parser.parse_args()
+    if args.recordings is None:
+        args.recordings = STRUCTURED_RECORDINGS_PATH if args.mode == "structured" else RECORDINGS_PATH
+
+    database_url = args.database_url or create_sample_database("sqlite:///" + os.path.join(tempfile.mkdtemp(), "national_accounts.db"))
+    engine = create_engine(database_url)
+    with open(args.corpus) as f:
+        corpus = json.load(f)
+    with open(args.recordings) as f:
+        recordings = json.load(f)
+
+    llm = None if args.record else ReplayChatModel(recordings=recordings, latency_scale=args.latency_scale)
+    resources = SharedResources(llm=llm, db=SlowSQLDatabase(engine, latency=args.db_latency), use_sql_result_cache=False, prompt_cache=args.prompt_cache)
+
+    results = []
+    for item in corpus:
+        result = run_question(resources, item, args, engine)
+        results.append(result)
+        correct = {True: "ok", False: "FAIL", None: "-"}[result["correct"]]
+        print(f"{result['latency'] * 1000:9.1f} ms  {result['path'] or 'error':<9}  steps={result['steps']}  "
+              f"tokens={result['prompt_tokens']:6d}  cached={result['cache_read_tokens']:6d}  sql={len(result['sql'])}  {correct:<4}  {item['question'][:60]}")
+        if result["error"]:
+            print(f"          error: {result['error']}")
+
+    summary = summarize(results)
+    accuracy = f"{summary['accuracy']:.1%}" if summary["accuracy"] is not None else "-"
+    print(f"\nquestions={summary['questions']}  accuracy={accuracy}  p50={summary['p50_latency'] * 1000:.1f} ms  "
+          f"p95={summary['p95_latency'] * 1000:.1f} ms  mean steps={summary['mean_steps']:.2f}  "
+          f"llm calls={summary['llm_calls']}  prompt tokens={summary['prompt_tokens']}  sql queries={summary['sql_queries']}")
+    uncached = summary["prompt_tokens"] - summary["cache_read_tokens"]
+    print(f"prompt cache: {summary['cache_read_tokens']} tokens read, {summary['cache_write_tokens']} written, {uncached} not read from the cache "
+          f"({summary['cache_read_tokens'] / max(summary['prompt_tokens'], 1):.1%} cached)")
+
+    if args.record:
+        for result in results:
+            if result["recording"]:
+                recordings[result["question"]] = result["recording"]
+        with open(args.recordings, "w") as f:
+            json.dump(recordings, f, indent=4)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": summary, "results": results}, f, indent=4)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(summary, json.load(f)["summary"], args.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Per-query latency of the local DuckDB replica.
+
+Builds the replica from the sqlite stand-in (or --source-url, e.g. Athena) and times
+typical agent queries against the source and the replica.
+Run from the repository root: python -m benchmarks.replica_queries
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from sqlalchemy import create_engine
+from langchain_community.utilities import SQLDatabase
+from local_replica import ReplicaSQLDatabase, sync_replica
+from benchmarks.fixtures import create_sample_database
+
+QUERIES = [
+    "SELECT Years, Q1, Q2, Q3, Q4 FROM sectors_growth_rates WHERE Activities = 'ManufacturingIndustries' ORDER BY Years DESC LIMIT 1",
+    "SELECT Years, Total FROM total_value_added ORDER BY Years DESC LIMIT 4",
+    "SELECT Governorates, SUM(GDP_Per_Activity) FROM governorates_activities_gdp WHERE Years = '2023/2022' GROUP BY Governorates ORDER BY 2 DESC LIMIT 4",
+]
+
+
+def time_queries(db, repeat):
+    timings = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            start = time.perf_counter()
+            db.run(query)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source-url", default=None)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    source_url = args.source_url or create_sample_database("sqlite:///" + os.path.join(directory, "national_accounts.db"))
+    source_engine = create_engine(source_url)
+
+    start = time.perf_counter()
+    replica_path = sync_replica(source_engine, os.path.join(directory, "replica.duckdb"))
+    print(f"sync: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for name, db in [("source", SQLDatabase(source_engine)), ("replica", ReplicaSQLDatabase.from_path(replica_path))]:
+        timings = time_queries(db, args.repeat)
+        print(f"{name:<8} median={statistics.median(timings) * 1000:8.2f} ms  "
+              f"p95={sorted(timings)[int(len(timings) * 0.95) - 1] * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Cold vs warm SqlAgent creation time.
+
+Run from the repository root: python -m benchmarks.session_startup
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from langchain_core.language_models.fake import FakeListLLM
+from invoke_agent import SqlAgent
+from shared_resources import SharedResources
+from benchmarks.fixtures import create_sample_database
+
+
+def time_sessions(create_session, sessions):
+    timings = []
+    for _ in range(sessions):
+        start = time.perf_counter()
+        create_session()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name, timings):
+    print(f"{name:<40} first={timings[0] * 1000:9.2f} ms  "
+          f"median={statistics.median(timings) * 1000:9.2f} ms  "
+          f"total={sum(timings) * 1000:9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--database-url", default=None, help="Defaults to a local sqlite stand-in for Athena")
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "national_accounts.db")
+        create_sample_database(database_url)
+    llm = FakeListLLM(responses=["Final Answer: ok"])
+
+    # Before: every session built its own llm, engine, reflected SQLDatabase and agent
+    cold = time_sessions(lambda: SqlAgent(resources=SharedResources(llm=llm, database_url=database_url)), args.sessions)
+    # After: the resources are built once and every session only gets a chat history
+    shared = SharedResources(llm=llm, database_url=database_url)
+    warm = time_sessions(lambda: SqlAgent(resources=shared), args.sessions)
+
+    report("cold (resources per session)", cold)
+    report("warm (shared resources)", warm)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Database round-trips and agent iterations saved by SqlGuard.
+
+Runs typical flawed agent queries (misspelled tables and columns, Years literals not
+in the 'year/(year-1)' form, values in the wrong case, DML, several statements)
+against the sqlite stand-in, once as they are and once through SqlGuard. --db-latency
+adds an Athena-like round-trip to every query that reaches the database.
+Run from the repository root: python -m benchmarks.sql_guard
+"""
+import argparse
+import os
+import tempfile
+import time
+from sqlalchemy import create_engine
+from sql_guard import SqlGuard
+from benchmarks.fixtures import SlowSQLDatabase, create_sample_database
+
+QUERIES = [
+    "SELECT Years, Total FROM total_value_added WHERE Years = '2022'",
+    "SELECT Years, Total FROM total_value_added WHERE Years = 2023",
+    "SELECT Years, Totl FROM total_value_added WHERE Years = '2021/2020'",
+    "SELECT Years, Total FROM total_value_addded WHERE Years = '2022/2021'",
+    "SELECT Years, Q2 FROM activity_value_added WHERE Activities = 'construction' AND Years = '2023/2022'",
+    "SELECT Years, Total_GDP FROM governorates_totals_gdp WHERE Governorates = 'cairo' AND Years = '2022/2021'",
+    "SELECT Years, GDP FROM governorates_totals_gdp WHERE Governorates = 'Giza'",
+    "DELETE FROM total_value_added",
+    "SELECT Years, Total FROM total_value_added; DROP TABLE total_value_added",
+    "SELECT Activities, Total FROM sectors_growth_rates WHERE Years = '2023/2022' ORDER BY Total DESC",
+]
+
+
+def outcome(result):
+    if result.startswith("Error:"):
+        return "error"
+    return "empty" if result in ("", "[]") else "rows"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-latency", type=float, default=0.0, help="Seconds added to every query of the stand-in")
+    args = parser.parse_args()
+
+    database_url = create_sample_database("sqlite:///" + os.path.join(tempfile.mkdtemp(), "national_accounts.db"))
+    db = SlowSQLDatabase(create_engine(database_url), latency=args.db_latency)
+    guard = SqlGuard(db)
+
+    # A query failing or returning no rows costs the agent another iteration and query
+    retries = 0
+    start = time.perf_counter()
+    for query in QUERIES:
+        # The statements changing the data are not run against the stand-in
+        read_only = query.upper().startswith("SELECT") and ";" not in query
+        before = outcome(str(db.run_no_throw(query))) if read_only else "unsafe"
+        retries += before != "rows"
+        checked = guard.check(query)
+        after = "rejected" if checked.error is not None else outcome(str(db.run_no_throw(checked.sql)))
+        changes = ", ".join(checked.fixes + (["LIMIT added"] if checked.limited else [])) or "-"
+        print(f"{before:<6} -> {after:<8}  {changes:<60}  {query[:70]}")
+    elapsed = time.perf_counter() - start
+
+    stats = guard.metrics()
+    print(f"\nqueries={len(QUERIES)}  failed, empty or unsafe without the guard={retries}  fixed={stats['fixed']}  rejected={stats['rejected']}  "
+          f"limited={stats['limited']}  round-trips saved={stats['athena_round_trips_saved']}  "
+          f"agent iterations saved={stats['agent_iterations_saved']}  database queries={db.queries}  ({elapsed * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
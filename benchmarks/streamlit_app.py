@@ -0,0 +1,147 @@
+"""Script run time of app.py against the chat length, and time to the first page.
+
+Runs app.py with Streamlit's AppTest and a fake agent (no Bedrock or Athena):
+- startup: a fresh process renders the first page, with the agent imported in the
+  background (app.py) or before the first render (--eager-import, as app.py did)
+- full runs: page loads and sidebar widgets rerun the whole script, which renders
+  every message of the chat. A question used to cost two of them (its own run and
+  the st.rerun after the answer), it now reruns the chat fragment only, which
+  renders the new messages. AppTest only runs whole scripts: the fragment run is
+  timed on its script runner, which reruns the fragments of the full run with the
+  question in the chat input, as the browser does
+Run from the repository root: python -m benchmarks.streamlit_app
+"""
+import argparse
+import contextlib
+import io
+import statistics
+import subprocess
+import sys
+import time
+from unittest.mock import patch
+from streamlit.runtime.scriptrunner import RerunData, ScriptRunnerEvent
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+if {eager}:
+    import invoke_agent
+from streamlit.testing.v1 import AppTest
+from benchmarks.streamlit_app import FakeAgent
+app = AppTest.from_file("app.py", default_timeout=120)
+app.session_state["sql_agent"] = FakeAgent()
+app.run()
+print(time.perf_counter() - start)
+"""
+
+
+class FakeAgent:
+    last_trace = None
+
+    def stream_agent(self, question):
+        yield {"type": "sql", "content": "SELECT Years, Total FROM total_value_added ORDER BY Years DESC LIMIT 1"}
+        yield {"type": "token", "content": "<p>The total value added is 100.</p>"}
+        yield {"type": "answer", "content": {"output": "<p>The total value added is 100.</p>"}}
+
+    def clear_chat_history(self):
+        pass
+
+
+def startup_seconds(eager):
+    output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT.format(eager=eager)], capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+class FragmentRunner(LocalScriptRunner):
+    # Reruns the fragments registered by the full run, with the widget state given
+
+    def __init__(self, *args, fragment_widget_state=None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.fragment_widget_state = fragment_widget_state
+        self.fragment_started = self.fragment_seconds = None
+
+    def _on_script_finished(self, ctx, event, premature_stop):
+        super()._on_script_finished(ctx, event, premature_stop)
+        if event == ScriptRunnerEvent.FRAGMENT_STOPPED_WITH_SUCCESS:
+            self.fragment_seconds = time.perf_counter() - self.fragment_started
+        elif self.fragment_widget_state is not None:
+            widget_state, self.fragment_widget_state = self.fragment_widget_state, None
+            self.fragment_started = time.perf_counter()
+            self.request_rerun(RerunData(widget_states=widget_state, fragment_id_queue=list(self._fragment_storage._fragments),
+                                         is_fragment_scoped_rerun=True))
+
+
+def chat_app(messages):
+    app = AppTest.from_file("app.py", default_timeout=120)
+    app.session_state["sql_agent"] = FakeAgent()
+    app.session_state["sessionId"] = "benchmark"
+    history = [{"role": "AI", "content": "Hello!"}]
+    for index in range(messages // 2):
+        history += [{"role": "Human", "content": f"Question {index}?"},
+                    {"role": "AI", "content": f"<p>Answer {index}: <b>{index * 1000.5}</b></p>" * 5}]
+    app.session_state["chat_history"] = [dict(message, html=f"<div>{message['content']}</div>") for message in history]
+
+    return app
+
+
+def full_run_seconds(messages, runs):
+    app = chat_app(messages)
+    app.run()
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        app.run()
+        durations.append(time.perf_counter() - start)
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+
+    return statistics.median(durations)
+
+
+def fragment_run_seconds(messages, runs):
+    # A question asked in a chat of messages messages
+    app = chat_app(messages)
+    app.run()
+    app.chat_input[0].set_value("What is the total value added?")
+    question = app._tree.get_widget_states()
+    durations = []
+    for _ in range(runs):
+        app = chat_app(messages)
+        runners = []
+
+        def runner(*args, **kwargs):
+            runners.append(FragmentRunner(*args, fragment_widget_state=question, **kwargs))
+            return runners[-1]
+
+        # app.py prints the answers
+        with patch("streamlit.testing.v1.app_test.LocalScriptRunner", runner), contextlib.redirect_stdout(io.StringIO()):
+            app.run()
+        if app.exception:
+            raise RuntimeError(app.exception[0].value)
+        if runners[0].fragment_seconds is None or len(app.session_state["chat_history"]) != messages + 3:
+            raise RuntimeError("The fragment run did not answer the question")
+        durations.append(runners[0].fragment_seconds)
+
+    return statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[2, 20, 100, 400], help="Messages in the chat")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    lazy, eager = startup_seconds(False), startup_seconds(True)
+    print(f"first page: {lazy * 1000:7.1f} ms with the agent imported in the background, "
+          f"{eager * 1000:7.1f} ms importing it first")
+
+    for length in args.lengths:
+        full = full_run_seconds(length, args.runs)
+        fragment = fragment_run_seconds(length, args.runs)
+        print(f"messages={length:4d}  full run={full * 1000:7.1f} ms  "
+              f"question before (2 full runs)={2 * full * 1000:7.1f} ms  question now (fragment run)={fragment * 1000:6.1f} ms")
+
+if __name__ == "__main__":
+    main()
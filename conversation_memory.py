@@ -0,0 +1,163 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from intent_router import parse_years
+from schema_retrieval import TABLES
+
+# Conversation memory of a SqlAgent session. The prompt gets the last turns in full
+# and the older ones compacted to the entities they resolved (years, activities,
+# governorates, components and tables read), always within a token budget (as long
+# as it is larger than the layout of one turn, about 10 tokens). Turns
+# are kept in a SessionStore (sqlite) keyed by session id, so a session resumes on
+# any worker or after a restart without asking the LLM to rebuild the context.
+
+MEMORY_MAX_TOKENS = int(os.getenv('MEMORY_MAX_TOKENS', '400'))
+# Turns sent in full, the older ones are compacted
+MEMORY_RECENT_TURNS = 1
+# Turns kept per session, the budget decides how many reach the prompt
+MAX_STORED_TURNS = 20
+# Sessions not used for this long are deleted from the store
+SESSION_MAX_AGE_SECONDS = 30 * 24 * 60 * 60
+
+# Known values of the categorical columns, resolved from the SQL literals
+ENTITY_VALUES = {
+    "activities": {value for table in TABLES.values() for value in table["values"].get("Activities", [])},
+    "governorates": set(TABLES["governorates_totals_gdp"]["values"]["Governorates"]),
+    "regions": set(TABLES["governorates_totals_gdp"]["values"]["Regions"]),
+    "components": set(TABLES["expenditure_components_gdp"]["values"]["Components"]),
+}
+
+
+def count_tokens(text):
+    # Same 4 characters per token estimate as the benchmarks
+    return len(text) // 4
+
+
+def plain_text(html):
+    return re.sub(r"\s+", " ", re.sub(r"<[^>]+>", " ", html or "")).strip()
+
+
+def extract_entities(question, intermediate_steps=None):
+    # What the turn was about, from the question and the SQL that answered it
+    sql = " ".join(str(action.tool_input) for action, _ in intermediate_steps or [] if getattr(action, "tool", None) == "sql_db_query")
+    literals = set(re.findall(r"'([^']*)'", sql))
+    entities = {"years": sorted(set(parse_years(question)) | {literal for literal in literals if re.fullmatch(r"\d{4}/\d{4}", literal)})}
+    for name, values in ENTITY_VALUES.items():
+        entities[name] = sorted(literals & values)
+    entities["tables"] = sorted({table for table in re.findall(r"\b(?:from|join)\s+[\"`]?(\w+)", sql, re.I)})
+
+    return {name: values for name, values in entities.items() if values}
+
+
+def cut(text, max_tokens):
+    if max_tokens is None or count_tokens(text) <= max_tokens:
+        return text
+    return text[:max(max_tokens, 0) * 4].rstrip() + "..."
+
+
+def format_turn(turn, compact=False, max_answer_tokens=None, max_question_tokens=None):
+    # Same "Human_message / AI_message" layout as the previous raw history
+    if compact:
+        resolved = "; ".join(f"{name}: {', '.join(values)}" for name, values in turn["entities"].items())
+        answer = f"(answered about {resolved})" if resolved else "(answered)"
+    else:
+        answer = cut(plain_text(turn["answer"]), max_answer_tokens)
+
+    return f"Human_message: {cut(turn['question'], max_question_tokens)}\nAI_message: {answer}\n"
+
+
+class SessionStore:
+    # Turns of every session in a sqlite file shared by the workers
+
+    def __init__(self, path, max_age_seconds=SESSION_MAX_AGE_SECONDS) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # Several Streamlit workers write the same file
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, turns TEXT, updated_at REAL)")
+        self.connection.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - max_age_seconds,))
+        self.connection.commit()
+
+    def load(self, session_id):
+        with self.lock:
+            row = self.connection.execute("SELECT turns FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else []
+
+    def save(self, session_id, turns):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)", (session_id, json.dumps(turns), time.time()))
+            self.connection.commit()
+
+    def delete(self, session_id):
+        with self.lock:
+            self.connection.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self.connection.commit()
+
+
+class ConversationMemory:
+
+    def __init__(self, session_id, store=None, max_tokens=MEMORY_MAX_TOKENS, recent_turns=MEMORY_RECENT_TURNS) -> None:
+        self.session_id = session_id
+        self.store = store
+        self.max_tokens = max_tokens
+        self.recent_turns = recent_turns
+        # [{"question", "answer", "entities"}], oldest first
+        self.turns = store.load(session_id) if store is not None else []
+        self.rendered = None
+
+    def add(self, question, answer, intermediate_steps=None):
+        self.turns.append({"question": question, "answer": answer or "", "entities": extract_entities(question, intermediate_steps)})
+        del self.turns[:-MAX_STORED_TURNS]
+        self.rendered = None
+        if self.store is not None:
+            self.store.save(self.session_id, self.turns)
+
+    def clear(self):
+        self.turns = []
+        self.rendered = None
+        if self.store is not None:
+            self.store.delete(self.session_id)
+
+    def render(self):
+        # History items for the prompt, oldest first, within max_tokens
+        if self.rendered is not None:
+            return list(self.rendered)
+        compact = [index < len(self.turns) - self.recent_turns for index in range(len(self.turns))]
+        first = 0
+
+        def size():
+            return sum(count_tokens(format_turn(turn, compact[first + index])) for index, turn in enumerate(self.turns[first:]))
+
+        # Compact the full turns from the oldest, then drop the oldest turns
+        for index in range(len(self.turns) - 1):
+            if size() <= self.max_tokens:
+                break
+            compact[index] = True
+        while first < len(self.turns) - 1 and size() > self.max_tokens:
+            first += 1
+
+        items = [format_turn(turn, compact[first + index]) for index, turn in enumerate(self.turns[first:])]
+        if items and size() > self.max_tokens:
+            items[-1] = self.fit_turn(self.turns[-1], compact[-1])
+        self.rendered = items
+
+        return list(items)
+
+    def fit_turn(self, turn, compact):
+        # The last turn alone is over the budget: its answer is cut, then its question
+        answer_tokens = 0 if compact else count_tokens(plain_text(turn["answer"]))
+        question_tokens = count_tokens(turn["question"])
+        item = format_turn(turn, compact)
+        while count_tokens(item) > self.max_tokens and (answer_tokens > 0 or question_tokens > 0):
+            overflow = count_tokens(item) - self.max_tokens
+            if answer_tokens > 0:
+                answer_tokens = max(answer_tokens - overflow - 1, 0)
+            else:
+                question_tokens = max(question_tokens - overflow - 1, 0)
+            item = format_turn(turn, compact, None if compact else answer_tokens, question_tokens)
+
+        return item
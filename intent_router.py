@@ -0,0 +1,230 @@
+import re
+from langchain_core.agents import AgentAction
+from schema_retrieval import TABLES, split_words
+
+# Answers the common question shapes without the LLM agent: value added or growth rate
+# of an activity, total value added, real GDP growth and GDP of a governorate, for a
+# year and optionally a quarter. The SQL is built from the known values of the columns
+# and the 'year/(year-1)' Years convention. Anything else, or anything ambiguous,
+# returns None so the question goes to the agent: words the router does not model
+# ("GDP per capita", "GDP deflator") and follow-ups needing the previous turns.
+
+QUARTERS = {"first": 1, "second": 2, "third": 3, "fourth": 4}
+# Words asking for more than a single lookup
+COMPLEX_WORDS = {"compare", "comparison", "highest", "lowest", "top", "which", "rank", "average", "share",
+                 "between", "since", "trend", "public", "private", "current", "constant", "market",
+                 "investment", "invest", "export", "import", "consumption", "difference", "change"}
+# Value words that do not identify an activity on their own
+ACTIVITY_FILLER_WORDS = {"and", "of"}
+GENERIC_ACTIVITY_WORDS = {"other", "activitie", "activity", "service", "total"}
+# Every word of a routed question is one of these or a word of an activity, governorate
+# or region name, any other word is a qualifier the SQL built here would ignore
+MODELED_WORDS = split_words(
+    "gdp gross domestic product value added total growth grow rate real factor cost sector activity industry "
+    "year fiscal financial fy quarter q first second third fourth last latest recent egypt egyptian "
+    "what whats is are was were the a an of in for from to at by on during how much did does do has have "
+    "please show tell me give i want know can could you about and"
+)
+# Follow-ups leaning on the previous turns: "and for 2022?", "what about the private sector?"
+ELLIPTICAL_PATTERN = r"^\s*(and|or|but|also|then|what about|how about|same)\b|\b(it|its|that|this|these|those|them|same|there)\b"
+
+
+class Intent:
+
+    def __init__(self, name, table, value_column, unit, description) -> None:
+        self.name = name
+        self.table = table
+        self.value_column = value_column
+        self.unit = unit
+        self.description = description
+
+
+INTENTS = {
+    "activity_value_added": Intent("activity_value_added", "activity_value_added", None, "Million EGP at current prices", "gross value added at factor cost"),
+    "sector_growth_rate": Intent("sector_growth_rate", "sectors_growth_rates", None, "% at constant prices", "GDP growth rate at factor cost"),
+    "total_value_added": Intent("total_value_added", "total_value_added", None, "Million EGP at current prices", "total gross value added at factor cost"),
+    "real_gdp_growth_rate": Intent("real_gdp_growth_rate", "real_gdp_growth_rates", None, "% at constant prices", "real GDP growth rate at market prices"),
+    "governorate_gdp": Intent("governorate_gdp", "governorates_totals_gdp", "Total_GDP", "Thousand EGP", "GDP"),
+    "governorate_activity_gdp": Intent("governorate_activity_gdp", "governorates_activities_gdp", "GDP_Per_Activity", "Thousand EGP", "GDP"),
+}
+
+
+def parse_years(question):
+    # '2020', '2019/2020' and '2020/2019' are all the financial year '2020/2019'
+    years = []
+    for first, second in re.findall(r"\b((?:19|20)\d{2})(?:\s*[/-]\s*((?:19|20)\d{2}))?\b", question):
+        last = max(int(first), int(second)) if second else int(first)
+        years.append(f"{last}/{last - 1}")
+    return sorted(set(years))
+
+
+def parse_quarter(question):
+    match = re.search(r"\bq([1-4])\b", question, re.I) or re.search(r"\b(first|second|third|fourth)\s+quarter\b", question, re.I)
+    if match is None:
+        return None
+    value = match.group(1).lower()
+    return int(value) if value.isdigit() else QUARTERS[value]
+
+
+def asks_latest(question):
+    return bool(re.search(r"\b(last|latest|recent|current)\s+(quarter|year)\b|\blatest\b", question, re.I))
+
+
+def match_value(question_words, values):
+    # Best value whose distinctive words are in the question, None when absent or ambiguous
+    scores = {}
+    for value in values:
+        value_words = split_words(value) - ACTIVITY_FILLER_WORDS
+        matched = question_words & value_words
+        if not matched - GENERIC_ACTIVITY_WORDS:
+            continue
+        score = len(matched) / len(value_words)
+        # The first word names the activity: "agriculture" is AgricultureForestryFishing and
+        # "manufacturing" is ManufacturingIndustries rather than OtherManufacturing
+        if split_words(re.sub(r"([a-z])([A-Z]).*", r"\1", value)) & question_words:
+            score += 0.3
+        scores[value] = score
+    if not scores:
+        return None
+    best = max(scores.values())
+    winners = [value for value, score in scores.items() if score == best]
+    if best < 0.5 or len(winners) > 1:
+        return None
+    return winners[0]
+
+
+def match_governorate(question):
+    values = TABLES["governorates_totals_gdp"]["values"]["Governorates"]
+    question = question.lower()
+    matches = []
+    for value in values:
+        # "Delta region" is stored as "Total Delta region"
+        name = value.lower()
+        region = re.fullmatch(r"total (.+) region", name)
+        if name != "total egypt" and re.search(rf"\b({re.escape(name)}{'|' + re.escape(region.group(1)) + ' region' if region else ''})\b", question):
+            matches.append(value)
+    # "Suez" is part of "Total Suez Canal region", keep the longest names only
+    matches = [value for value in matches if not any(value != other and value.lower() in other.lower() for other in matches)]
+    return matches[0] if len(matches) == 1 else None
+
+
+def known_words():
+    words = set(MODELED_WORDS)
+    for table in TABLES.values():
+        for column in ("Activities", "Governorates", "Regions"):
+            words |= split_words(" ".join(table["values"].get(column, [])))
+    return words
+
+
+KNOWN_WORDS = known_words()
+
+
+def readable(value):
+    return re.sub(r"([a-z])([A-Z])", r"\1 \2", value)
+
+
+class IntentRouter:
+
+    def __init__(self, db) -> None:
+        self.db = db
+        self.stats = {"routed": 0, "fallbacks": 0}
+
+    def classify(self, question, chat_history=None):
+        # Returns (intent, filters) or None when the agent should answer
+        if chat_history and re.search(ELLIPTICAL_PATTERN, question, re.I):
+            return None
+        words = split_words(question)
+        if words & COMPLEX_WORDS or words - KNOWN_WORDS or len(parse_years(question)) > 1:
+            return None
+
+        governorate = match_governorate(question)
+        if governorate is None and words & {"governorate", "region"}:
+            return None
+        if governorate is not None:
+            activity = match_value(words, TABLES["governorates_activities_gdp"]["values"]["Activities"])
+            # "Suez Canal" is both a governorate name and an activity
+            sector = match_value(words, TABLES["sectors_growth_rates"]["values"]["Activities"])
+            if sector is not None and governorate.lower() in readable(sector).lower():
+                return None
+            if parse_quarter(question) is not None:
+                return None
+            if activity is not None:
+                return INTENTS["governorate_activity_gdp"], {"Governorates": governorate, "Activities": activity}
+            return INTENTS["governorate_gdp"], {"Governorates": governorate}
+
+        if "growth" in words or "grow" in words:
+            if "real" in words:
+                return INTENTS["real_gdp_growth_rate"], {}
+            activity = match_value(words, TABLES["sectors_growth_rates"]["values"]["Activities"])
+            if activity is not None:
+                return INTENTS["sector_growth_rate"], {"Activities": activity}
+            return None
+
+        activity = match_value(words, TABLES["activity_value_added"]["values"]["Activities"])
+        if activity is not None and ({"value", "added"} <= words or "gdp" in words):
+            return INTENTS["activity_value_added"], {"Activities": activity}
+        # Total GDP in general comes from total_value_added
+        if activity is None and ({"total", "value", "added"} <= words or "gdp" in words):
+            return INTENTS["total_value_added"], {}
+
+        return None
+
+    def build_sql(self, intent, filters, question):
+        years = parse_years(question)
+        quarter = parse_quarter(question)
+        conditions = [f"{column} = '{value}'" for column, value in filters.items()]
+        if intent.value_column is not None:
+            columns = [intent.value_column]
+        elif quarter is not None:
+            columns = [f"Q{quarter}"]
+        elif asks_latest(question) and not years:
+            # The last year is often incomplete, all its quarters are returned
+            columns = ["Q1", "Q2", "Q3", "Q4"]
+        else:
+            columns = ["Total"]
+
+        if years:
+            conditions.append(f"Years = '{years[0]}'")
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        return f"SELECT Years, {', '.join(columns)} FROM {intent.table}{where} ORDER BY Years DESC LIMIT 1"
+
+    def format_answer(self, intent, filters, row):
+        # Athena returns lower case column names
+        row = {column.lower(): value for column, value in row.items()}
+        year = row.pop("years")
+        values = [(column.upper() if column.startswith("q") else column, value) for column, value in row.items() if value is not None]
+        if not values:
+            return None
+        subject = " of ".join(readable(value) for value in reversed(list(filters.values())))
+        subject = f" of <b>{subject}</b>" if subject else ""
+        # Numbers are shown exactly as stored, never rounded
+        if len(values) == 1:
+            column, value = values[0]
+            period = f"{column} of " if column.startswith("Q") else ""
+            return f"<p>The {intent.description}{subject} in {period}{year} is <b>{value}</b> ({intent.unit}).</p>"
+
+        items = "".join(f"<li>{column}: <b>{value}</b></li>" for column, value in values)
+        return (f"<p>The {intent.description}{subject} for {year} ({intent.unit}), "
+                f"latest available quarter is {values[-1][0]}:</p><ul>{items}</ul>")
+
+    def route(self, question, chat_history=None):
+        # Returns a response shaped like the agent's one, or None
+        classified = self.classify(question, chat_history)
+        if classified is None:
+            self.stats["fallbacks"] += 1
+            return None
+        intent, filters = classified
+        sql = self.build_sql(intent, filters, question)
+
+        rows = self.db.run(sql, fetch="cursor").mappings().all()
+        output = self.format_answer(intent, filters, dict(rows[0])) if rows else None
+        if output is None:
+            self.stats["fallbacks"] += 1
+            return None
+
+        self.stats["routed"] += 1
+        observation = str([tuple(row.values()) for row in rows])
+        action = AgentAction("sql_db_query", sql, f"Fast path: {intent.name}")
+
+        return {"input": question, "output": output, "intermediate_steps": [(action, observation)]}
@@ -0,0 +1,130 @@
+"""Local DuckDB replica of the national accounts tables.
+
+Sync it from Athena (or any SQLAlchemy url) with:
+    python local_replica.py --source-url <url> --path replica/national_accounts.duckdb
+"""
+import argparse
+import os
+import duckdb
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError
+from langchain_community.utilities import SQLDatabase
+from prompts import parse_table_description
+from rollups import ROLLUPS, rollup_statements
+
+REPLICA_PATH = os.getenv('REPLICA_PATH', os.path.join("replica", "national_accounts.duckdb"))
+# Tables copied by the sync, every table described in the prompt except the rollups
+# that are rebuilt from them
+REPLICA_TABLES = [table for table in parse_table_description() if table not in ROLLUPS]
+
+
+def sync_replica(source_engine, path=REPLICA_PATH, tables=REPLICA_TABLES):
+    # Snapshot the tables into a new file and swap it in, readers never see a partial sync
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    connection = duckdb.connect(tmp_path)
+    connection.execute("CREATE TABLE _replica_sync (table_name VARCHAR, row_count BIGINT, synced_at TIMESTAMP)")
+    with source_engine.connect() as source:
+        for table in tables:
+            result = source.execute(text(f"SELECT * FROM {table}"))
+            columns = list(result.keys())
+            rows = [tuple(row) for row in result.fetchall()]
+            # Text columns (Years, Activities, ...) stay strings, everything else is numeric
+            column_types = [
+                "VARCHAR" if any(isinstance(row[i], str) for row in rows) else "DOUBLE"
+                for i in range(len(columns))
+            ]
+            column_definitions = ", ".join(f'"{column}" {column_type}' for column, column_type in zip(columns, column_types))
+            connection.execute(f"CREATE TABLE {table} ({column_definitions})")
+            if rows:
+                placeholders = ", ".join("?" for _ in columns)
+                connection.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+            connection.execute("INSERT INTO _replica_sync VALUES (?, ?, current_timestamp)", [table, len(rows)])
+            print(f"Synced {table}: {len(rows)} rows")
+    for statement in rollup_statements("duckdb"):
+        connection.execute(statement)
+    for table in ROLLUPS:
+        row_count = connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        connection.execute("INSERT INTO _replica_sync VALUES (?, ?, current_timestamp)", [table, row_count])
+        print(f"Built {table}: {row_count} rows")
+    connection.close()
+
+    os.replace(tmp_path, path)
+
+    return path
+
+
+class ReplicaSQLDatabase(SQLDatabase):
+    # Answers the agent's SQL from the local replica. Queries DuckDB cannot run
+    # (unsupported Athena syntax or functions) are sent to the fallback database.
+
+    def __init__(self, engine, fallback_db=None, **kwargs) -> None:
+        super().__init__(engine, ignore_tables=["_replica_sync"], **kwargs)
+        # Database or callable returning it, so Athena is only connected when needed
+        self._fallback_db = fallback_db
+        self.fallback_count = 0
+
+    @classmethod
+    def from_path(cls, path=REPLICA_PATH, fallback_db=None):
+        engine = create_engine(f"duckdb:///{path}", connect_args={"read_only": True})
+
+        return cls(engine, fallback_db=fallback_db)
+
+    def get_fallback_db(self):
+        if callable(self._fallback_db):
+            self._fallback_db = self._fallback_db()
+
+        return self._fallback_db
+
+    def run(self, command, fetch="all", include_columns=False, **kwargs):
+        try:
+            return super().run(command, fetch=fetch, include_columns=include_columns, **kwargs)
+        except DBAPIError:
+            fallback_db = self.get_fallback_db()
+            if fallback_db is None:
+                raise
+            self.fallback_count += 1
+            return fallback_db.run(command, fetch=fetch, include_columns=include_columns, **kwargs)
+
+
+class ReplicaRefreshWatcher:
+    # Reopens the replica and invalidates the caches when a sync swapped the file
+
+    def __init__(self, caches, db, path=REPLICA_PATH) -> None:
+        self.caches = caches
+        self.db = db
+        self.path = path
+        self.modified_at = os.path.getmtime(path)
+
+    def check(self):
+        modified_at = os.path.getmtime(self.path)
+        if modified_at == self.modified_at:
+            return []
+        self.modified_at = modified_at
+        # Pooled connections still point at the previous file
+        self.db._engine.dispose()
+        for cache in self.caches:
+            cache.invalidate()
+
+        return list(REPLICA_TABLES) + list(ROLLUPS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source-url", default=None, help="Defaults to the Athena connection of the agent")
+    parser.add_argument("--path", default=REPLICA_PATH)
+    args = parser.parse_args()
+
+    if args.source_url is None:
+        from shared_resources import athena_connection_string
+        args.source_url = athena_connection_string()
+    source_engine = create_engine(args.source_url)
+    sync_replica(source_engine, args.path)
+    source_engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+import asyncio
+import contextvars
+import os
+import queue
+import random
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+from intent_router import parse_years
+from schema_retrieval import split_words
+from tracing import CURRENT_TRACE, METRICS
+
+# Picks the Bedrock model of every LLM call within the latency budget of the answer.
+# Lookups of one value go to the fast model, comparisons, rankings, shares and
+# follow-ups to the large one. A call still running after the hedge delay of its model
+# is hedged with the alternate model, a failed call (throttling, timeout) is retried
+# on the alternate model after a short backoff, with at most max_attempts calls in
+# total. The first call to answer wins, when streaming the first call to yield a token
+# wins and is streamed, the tokens of the other calls are dropped. Nothing waits past the deadline of the answer
+# (Trace.deadline, set by SqlAgent), DeadlineExceededError is raised instead.
+
+FAST_MODEL_ID = os.getenv('FAST_MODEL_ID', "anthropic.claude-3-haiku-20240307-v1:0")
+# Seconds an answer may take, LLM calls and queries included
+REQUEST_TIMEOUT_SECONDS = float(os.getenv('REQUEST_TIMEOUT_SECONDS', '60'))
+# Seconds after which a call is hedged with the alternate model (p95 of each model)
+HEDGE_AFTER_SECONDS = {"fast": 4.0, "large": 12.0}
+# Model tried when the other one is slow or fails
+FALLBACKS = {"fast": ["large"], "large": ["fast"]}
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 0.25
+
+# Words of questions needing more than one lookup or some reasoning
+MULTI_STEP_WORDS = split_words("compare comparison versus vs between trend since change difference share contribution "
+                               "rank ranking highest lowest top average fastest slowest largest smallest biggest most "
+                               "least why explain each all over")
+FOLLOW_UP = re.compile(r"\b(it|its|that|this|those|these|them|same|previous|before)\b", re.I)
+# Longer questions usually ask for several values
+MAX_SIMPLE_WORDS = 20
+
+# Hedged calls of synchronous runs, the losing call finishes in the background
+HEDGE_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv('LLM_MAX_WORKERS', '32')), thread_name_prefix="llm")
+
+
+class DeadlineExceededError(TimeoutError):
+    pass
+
+
+def choose_model_tier(question, chat_history=None):
+    # "fast" for a lookup of one value, "large" otherwise
+    words = split_words(question)
+    if words & MULTI_STEP_WORDS or len(parse_years(question)) > 1 or len(question.split()) > MAX_SIMPLE_WORDS:
+        return "large"
+    if chat_history and FOLLOW_UP.search(question):
+        return "large"
+    return "fast"
+
+
+class RoutedChatModel(BaseChatModel):
+    # models: {"fast": ..., "large": ...}, the tier of a call is Trace.model_tier
+    models: Dict[str, Any]
+    default_tier: str = "large"
+    fallbacks: Dict[str, List[str]] = FALLBACKS
+    # None disables hedging
+    hedge_after: Optional[Dict[str, float]] = HEDGE_AFTER_SECONDS
+    max_attempts: int = MAX_ATTEMPTS
+    retry_backoff: float = RETRY_BACKOFF_SECONDS
+    # Deadline of the calls made outside of a SqlAgent answer
+    timeout: float = REQUEST_TIMEOUT_SECONDS
+
+    @property
+    def _llm_type(self):
+        return "routed"
+
+    def plan(self):
+        # Tiers in the order they are tried, and the deadline (monotonic)
+        trace = CURRENT_TRACE.get()
+        tier = getattr(trace, "model_tier", None)
+        if tier not in self.models:
+            tier = self.default_tier
+        deadline = getattr(trace, "deadline", None) or time.monotonic() + self.timeout
+        chain = [tier] + [fallback for fallback in self.fallbacks.get(tier, []) if fallback in self.models]
+        tiers = [chain[index % len(chain)] for index in range(self.max_attempts)]
+        METRICS.increment("sql_agent_llm_route_total", tier=tier)
+
+        return tiers, deadline
+
+    def hedge_delay(self, tier):
+        return (self.hedge_after or {}).get(tier)
+
+    def hedge_at(self, running, tiers, hedged):
+        # Monotonic time at which the only running call is hedged, None when it is not
+        delay = self.hedge_delay(running[0][0]) if len(running) == 1 else None
+        if not tiers or hedged or delay is None:
+            return None
+        return running[0][1] + delay
+
+    def next_wait(self, deadline, running, tiers, hedged):
+        # Seconds until the deadline, or until the running call must be hedged
+        hedge_at = self.hedge_at(running, tiers, hedged)
+        return max(min(deadline, hedge_at or deadline) - time.monotonic(), 0)
+
+    def should_hedge(self, running, tiers, hedged):
+        hedge_at = self.hedge_at(running, tiers, hedged)
+        return hedge_at is not None and time.monotonic() >= hedge_at
+
+    def annotate(self, result, tier, attempts, hedged):
+        result.llm_output = dict(result.llm_output or {}, model_tier=tier, attempts=attempts, hedged=hedged)
+        return result
+
+    def route_chunk(self, tier, attempts, hedged):
+        # Last chunk of a streamed call, streamed results have no llm_output
+        return ChatGenerationChunk(message=AIMessageChunk(content="", response_metadata={"model_tier": tier, "attempts": attempts, "hedged": hedged}))
+
+    def _should_stream(self, *, async_api, run_manager=None, **kwargs):
+        # Streams when every model of the route does
+        return (super()._should_stream(async_api=async_api, run_manager=run_manager, **kwargs)
+                and all(model._should_stream(async_api=async_api, run_manager=run_manager, **kwargs) for model in self.models.values()))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        tiers, deadline = self.plan()
+        futures = {}
+        started = []
+        hedged = False
+        last_error = None
+
+        def start():
+            tier = tiers.pop(0)
+            # The botocore hooks of the call need the trace of the answer
+            context = contextvars.copy_context()
+            futures[HEDGE_EXECUTOR.submit(context.run, self.models[tier]._generate, messages, stop, None, **kwargs)] = (tier, time.monotonic())
+            started.append(tier)
+
+        start()
+        while futures:
+            done, _ = wait(list(futures), timeout=self.next_wait(deadline, list(futures.values()), tiers, hedged), return_when=FIRST_COMPLETED)
+            for future in done:
+                tier, _ = futures.pop(future)
+                if future.exception() is None:
+                    for other in futures:
+                        other.cancel()
+                    return self.annotate(future.result(), tier, len(started), hedged)
+                last_error = future.exception()
+                METRICS.increment("sql_agent_llm_failures_total", tier=tier)
+                if tiers:
+                    # No backoff while a hedged call is still running
+                    if not futures:
+                        time.sleep(min(self.retry_backoff * random.uniform(1, 2), max(deadline - time.monotonic(), 0)))
+                    if time.monotonic() < deadline:
+                        METRICS.increment("sql_agent_llm_fallbacks_total")
+                        start()
+            if not done and self.should_hedge(list(futures.values()), tiers, hedged):
+                hedged = True
+                METRICS.increment("sql_agent_llm_hedges_total")
+                start()
+            elif not done and time.monotonic() >= deadline:
+                METRICS.increment("sql_agent_llm_deadline_exceeded_total")
+                raise DeadlineExceededError(f"No answer from {', '.join(started)} within the deadline")
+
+        raise last_error
+
+    def stream_call(self, call, tier, messages, stop, kwargs, events, stopped):
+        # Runs in HEDGE_EXECUTOR, puts (call, chunk, error) on events, chunk is None at the end
+        try:
+            for chunk in self.models[tier]._stream(messages, stop=stop, **kwargs):
+                if stopped.is_set():
+                    return
+                events.put((call, chunk, None))
+            events.put((call, None, None))
+        except Exception as e:
+            events.put((call, None, e))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        # Hedging and fallbacks as in _generate until a call yields its first chunk,
+        # the call is then streamed to the end and the others are stopped
+        tiers, deadline = self.plan()
+        events = queue.Queue()
+        # call -> (tier, start) of the calls still running
+        running = {}
+        stops = {}
+        started = []
+        hedged = False
+        winner = None
+        last_error = None
+
+        def start():
+            call, tier = len(started), tiers.pop(0)
+            running[call] = (tier, time.monotonic())
+            stops[call] = threading.Event()
+            # The botocore hooks of the call need the trace of the answer
+            context = contextvars.copy_context()
+            HEDGE_EXECUTOR.submit(context.run, self.stream_call, call, tier, messages, stop, kwargs, events, stops[call])
+            started.append(tier)
+
+        start()
+        try:
+            while running:
+                try:
+                    call, chunk, error = events.get(timeout=self.next_wait(deadline, list(running.values()), tiers, hedged or winner is not None))
+                except queue.Empty:
+                    if winner is None and self.should_hedge(list(running.values()), tiers, hedged):
+                        hedged = True
+                        METRICS.increment("sql_agent_llm_hedges_total")
+                        start()
+                    elif time.monotonic() >= deadline:
+                        METRICS.increment("sql_agent_llm_deadline_exceeded_total")
+                        raise DeadlineExceededError(f"No answer from {', '.join(started)} within the deadline")
+                    continue
+                if call not in running:
+                    continue
+                tier, _ = running[call]
+                if error is not None:
+                    del running[call]
+                    if call == winner:
+                        raise error
+                    last_error = error
+                    METRICS.increment("sql_agent_llm_failures_total", tier=tier)
+                    if tiers:
+                        # No backoff while a hedged call is still running
+                        if not running:
+                            time.sleep(min(self.retry_backoff * random.uniform(1, 2), max(deadline - time.monotonic(), 0)))
+                        if time.monotonic() < deadline:
+                            METRICS.increment("sql_agent_llm_fallbacks_total")
+                            start()
+                    continue
+                if winner is None:
+                    winner = call
+                    for other in [other for other in running if other != call]:
+                        stops[other].set()
+                        del running[other]
+                if chunk is None:
+                    yield self.route_chunk(tier, len(started), hedged)
+                    return
+                yield chunk
+        finally:
+            for stopped in stops.values():
+                stopped.set()
+
+        raise last_error
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        tiers, deadline = self.plan()
+        events = asyncio.Queue()
+        running = {}
+        tasks = {}
+        started = []
+        hedged = False
+        winner = None
+        last_error = None
+
+        async def stream_call(call, tier):
+            try:
+                async for chunk in self.models[tier]._astream(messages, stop=stop, **kwargs):
+                    events.put_nowait((call, chunk, None))
+                events.put_nowait((call, None, None))
+            except Exception as e:
+                events.put_nowait((call, None, e))
+
+        def start():
+            call, tier = len(started), tiers.pop(0)
+            running[call] = (tier, time.monotonic())
+            tasks[call] = asyncio.ensure_future(stream_call(call, tier))
+            started.append(tier)
+
+        start()
+        try:
+            while running:
+                try:
+                    call, chunk, error = await asyncio.wait_for(events.get(), timeout=self.next_wait(deadline, list(running.values()), tiers, hedged or winner is not None))
+                except asyncio.TimeoutError:
+                    if winner is None and self.should_hedge(list(running.values()), tiers, hedged):
+                        hedged = True
+                        METRICS.increment("sql_agent_llm_hedges_total")
+                        start()
+                    elif time.monotonic() >= deadline:
+                        METRICS.increment("sql_agent_llm_deadline_exceeded_total")
+                        raise DeadlineExceededError(f"No answer from {', '.join(started)} within the deadline")
+                    continue
+                if call not in running:
+                    continue
+                tier, _ = running[call]
+                if error is not None:
+                    del running[call]
+                    if call == winner:
+                        raise error
+                    last_error = error
+                    METRICS.increment("sql_agent_llm_failures_total", tier=tier)
+                    if tiers:
+                        if not running:
+                            await asyncio.sleep(min(self.retry_backoff * random.uniform(1, 2), max(deadline - time.monotonic(), 0)))
+                        if time.monotonic() < deadline:
+                            METRICS.increment("sql_agent_llm_fallbacks_total")
+                            start()
+                    continue
+                if winner is None:
+                    winner = call
+                    for other in [other for other in running if other != call]:
+                        tasks[other].cancel()
+                        del running[other]
+                if chunk is None:
+                    yield self.route_chunk(tier, len(started), hedged)
+                    return
+                yield chunk
+        finally:
+            # The losing or timed out calls are cancelled
+            for task in tasks.values():
+                task.cancel()
+
+        raise last_error
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        tiers, deadline = self.plan()
+        tasks = {}
+        started = []
+        hedged = False
+        last_error = None
+
+        def start():
+            tier = tiers.pop(0)
+            tasks[asyncio.ensure_future(self.models[tier]._agenerate(messages, stop, None, **kwargs))] = (tier, time.monotonic())
+            started.append(tier)
+
+        start()
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(list(tasks), timeout=self.next_wait(deadline, list(tasks.values()), tiers, hedged), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tier, _ = tasks.pop(task)
+                    if task.exception() is None:
+                        return self.annotate(task.result(), tier, len(started), hedged)
+                    last_error = task.exception()
+                    METRICS.increment("sql_agent_llm_failures_total", tier=tier)
+                    if tiers:
+                        if not tasks:
+                            await asyncio.sleep(min(self.retry_backoff * random.uniform(1, 2), max(deadline - time.monotonic(), 0)))
+                        if time.monotonic() < deadline:
+                            METRICS.increment("sql_agent_llm_fallbacks_total")
+                            start()
+                if not done and self.should_hedge(list(tasks.values()), tiers, hedged):
+                    hedged = True
+                    METRICS.increment("sql_agent_llm_hedges_total")
+                    start()
+                elif not done and time.monotonic() >= deadline:
+                    METRICS.increment("sql_agent_llm_deadline_exceeded_total")
+                    raise DeadlineExceededError(f"No answer from {', '.join(started)} within the deadline")
+        finally:
+            # The losing or timed out calls are cancelled
+            for task in tasks:
+                task.cancel()
+
+        raise last_error
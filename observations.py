@@ -0,0 +1,180 @@
+import ast
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from conversation_memory import count_tokens
+from sql_cache import canonicalize_sql
+from sql_guard import tokenize
+from tracing import METRICS
+
+# Large sql_db_query results are kept here instead of going back to the agent in
+# full: every later ReAct step resends the observations of the scratchpad. The agent
+# gets a compact view instead, the first rows with their exact values (without the
+# columns having the same value in every row), the min and max of the numeric columns
+# over all the rows, and the id of the result. The fetch tool (sql_db_fetch_rows)
+# returns the following rows of the result on demand, exactly as stored.
+
+# Observations longer than this are compacted
+MAX_OBSERVATION_TOKENS = int(os.getenv('MAX_OBSERVATION_TOKENS', '300'))
+# Rows shown by a compact view, and returned by one fetch
+OBSERVATION_ROWS = 10
+MAX_STORED_RESULTS = 256
+RESULT_TTL_SECONDS = 60 * 60
+
+
+def parse_rows(observation):
+    try:
+        rows = ast.literal_eval(observation)
+    except (ValueError, SyntaxError, TypeError):
+        return None
+    return rows if isinstance(rows, list) else None
+
+
+def select_columns(sql, width):
+    # Names of the columns of the outer SELECT list (the alias when there is one),
+    # None for "*" or a list the rows do not match
+    tokens = tokenize(sql)
+    columns, current, depth = [], [], 0
+    for token in tokens[1:] if tokens and tokens[0].name == "select" else []:
+        if token.text == "(":
+            depth += 1
+        elif token.text == ")":
+            depth -= 1
+        elif depth == 0 and token.name == "from":
+            break
+        if depth == 0 and token.text == ",":
+            columns.append(current)
+            current = []
+        elif not (depth == 0 and token.name == "distinct" and not current and not columns):
+            current.append(token)
+    columns.append(current)
+    names = []
+    for column in columns:
+        named = [token for token in column if token.is_name]
+        if not column or column[-1].text == "*":
+            return None
+        name = column[-1] if column[-1].is_name else (named[-1] if named else None)
+        names.append(name.text.strip('"`') if name is not None else f"column {len(names) + 1}")
+
+    return names if len(names) == width else None
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class ObservationStore:
+    # Full results of the compacted observations, shared by the sessions
+
+    def __init__(self, max_tokens=MAX_OBSERVATION_TOKENS, rows=OBSERVATION_ROWS, max_results=MAX_STORED_RESULTS, ttl_seconds=RESULT_TTL_SECONDS) -> None:
+        self.max_tokens = max_tokens
+        self.rows = rows
+        self.max_results = max_results
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        # Result id -> (columns, rows, expiry)
+        self.results = OrderedDict()
+        self.stats = {"compacted": 0, "tokens_saved": 0, "fetches": 0, "expired": 0}
+
+    def put(self, query, columns, rows):
+        result_id = "r" + hashlib.sha1(canonicalize_sql(query).encode("utf-8")).hexdigest()[:8]
+        with self.lock:
+            self.results.pop(result_id, None)
+            self.results[result_id] = (columns, rows, time.monotonic() + self.ttl_seconds)
+            while len(self.results) > self.max_results:
+                self.results.popitem(last=False)
+
+        return result_id
+
+    def get(self, result_id):
+        with self.lock:
+            result = self.results.get(result_id)
+            if result is None:
+                return None
+            if result[2] < time.monotonic():
+                del self.results[result_id]
+                self.stats["expired"] += 1
+                return None
+            self.results.move_to_end(result_id)
+            return result
+
+    def compact(self, query, observation):
+        # The observation itself when it is short or not a list of rows
+        if count_tokens(observation) <= self.max_tokens:
+            return observation
+        rows = parse_rows(observation)
+        if not rows or not all(isinstance(row, tuple) and len(row) == len(rows[0]) for row in rows):
+            return observation
+        width = len(rows[0])
+        columns = select_columns(query, width) or [f"column {index + 1}" for index in range(width)]
+        result_id = self.put(query, columns, rows)
+
+        constant = [index for index in range(width) if len(rows) > 1 and all(row[index] == rows[0][index] for row in rows)]
+        shown = [index for index in range(width) if index not in constant]
+        lines = [f"Result {result_id}: {len(rows)} rows, the first {min(self.rows, len(rows))} are shown with their exact values."]
+        if constant:
+            lines.append("Same value in every row: " + ", ".join(f"{columns[index]}={rows[0][index]!r}" for index in constant))
+        lines.append("Columns: " + ", ".join(columns[index] for index in shown))
+        lines.append(str([tuple(row[index] for index in shown) for row in rows[:self.rows]]))
+        lines.extend(self.summaries(columns, rows, shown))
+        if len(rows) > self.rows:
+            lines.append(f'For the next rows use sql_db_fetch_rows with "{result_id} {self.rows}", or a narrower query.')
+        compacted = "\n".join(lines)
+
+        saved = count_tokens(observation) - count_tokens(compacted)
+        with self.lock:
+            self.stats["compacted"] += 1
+            self.stats["tokens_saved"] += saved
+        METRICS.increment("sql_agent_observations_compacted_total")
+        METRICS.increment("sql_agent_observation_tokens_saved_total", saved)
+
+        return compacted
+
+    def summaries(self, columns, rows, shown):
+        # Min and max of the numeric columns over all the rows, labelled with the text
+        # columns of their row, and the number of distinct values of the text columns
+        labels = [index for index in shown if not any(is_number(row[index]) for row in rows)]
+
+        def label(row):
+            return " / ".join(str(row[index]) for index in labels[:2])
+
+        lines = []
+        for index in shown:
+            values = [row for row in rows if is_number(row[index])]
+            if index in labels:
+                lines.append(f"{columns[index]}: {len({row[index] for row in rows})} distinct values")
+            elif values:
+                low = min(values, key=lambda row: row[index])
+                high = max(values, key=lambda row: row[index])
+                lines.append(f"{columns[index]}: min {low[index]!r} ({label(low)}), max {high[index]!r} ({label(high)})")
+
+        return ["Over all rows: " + "; ".join(lines)] if lines else []
+
+    def fetch(self, tool_input):
+        # tool_input: "<result id> <first row>" (rows counted from 0)
+        match = re.search(r"\b(r[0-9a-f]{8})\b\W*(\d+)?", str(tool_input))
+        if match is None:
+            return 'Error: expected "<result id> <first row>", e.g. "r0123abcd 10".'
+        result_id, start = match.group(1), int(match.group(2) or 0)
+        result = self.get(result_id)
+        if result is None:
+            return f"Error: result {result_id} is no longer available, run the query again."
+        columns, rows, _ = result
+        if start >= len(rows):
+            return f"Error: result {result_id} only has {len(rows)} rows."
+        with self.lock:
+            self.stats["fetches"] += 1
+        end = min(start + self.rows, len(rows))
+        lines = [f"Rows {start}-{end - 1} of the {len(rows)} rows of result {result_id}, with their exact values.",
+                 "Columns: " + ", ".join(columns), str(rows[start:end])]
+        if end < len(rows):
+            lines.append(f'For the next rows use sql_db_fetch_rows with "{result_id} {end}".')
+
+        return "\n".join(lines)
+
+    def metrics(self):
+        with self.lock:
+            return dict(self.stats, results=len(self.results))
@@ -0,0 +1,204 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Any
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+from conversation_memory import count_tokens
+from prompts import PROMPT_CACHE_POINT
+
+# Prefix caching of the prompts. The prompts of prompts.py mark the end of their
+# static parts with PROMPT_CACHE_POINT, PromptCachingChatModel removes the marks and:
+# - "bedrock": sends the parts before every mark as text blocks with cache_control,
+#   Bedrock then reads them from its prompt cache and reports the cached tokens
+# - "simulated": sends the plain prompt and reports in the usage the tokens a prefix
+#   cache would have read or written, counted by SimulatedPrefixCache
+# - "off": the model is not wrapped and the prompts are built without the marks
+#   (strip_cache_points), unless another model of the route caches them
+# "auto" is "bedrock" for the models supporting prompt caching and "off" otherwise.
+PROMPT_CACHE = os.getenv('PROMPT_CACHE', 'auto')
+# Bedrock model ids (or inference profiles, e.g. "us.anthropic...") with prompt caching
+PROMPT_CACHING_MODELS = (
+    "anthropic.claude-3-5-haiku-20241022",
+    "anthropic.claude-3-7-sonnet",
+    "anthropic.claude-sonnet-4",
+    "anthropic.claude-opus-4",
+    "amazon.nova",
+)
+# Bedrock keeps a prefix 5 minutes after its last use and does not cache short ones
+CACHE_TTL_SECONDS = 300
+MIN_CACHEABLE_TOKENS = 1024
+# Cache points accepted in one request
+MAX_CACHE_POINTS = 4
+
+
+def supports_prompt_caching(model_id):
+    return any(model in (model_id or "") for model in PROMPT_CACHING_MODELS)
+
+
+def resolve_prompt_cache(mode, model_id):
+    if mode == "auto":
+        return "bedrock" if supports_prompt_caching(model_id) else "off"
+    return mode
+
+
+def strip_cache_points(template):
+    # Prompts of the models not wrapped, which would get the marks as they are
+    return template.replace(PROMPT_CACHE_POINT, "")
+
+
+def split_prompt(text):
+    # Parts of the prompt between the cache points, the last one is not cached
+    return text.split(PROMPT_CACHE_POINT)
+
+
+class SimulatedPrefixCache:
+    # Local stand-in of the Bedrock prompt cache: remembers the prefixes ending at a
+    # cache point until their TTL expires and counts the tokens read and written
+
+    def __init__(self, ttl_seconds=CACHE_TTL_SECONDS, min_tokens=MIN_CACHEABLE_TOKENS) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.lock = threading.Lock()
+        # Prefix hash -> expiry (monotonic)
+        self.entries = {}
+
+    def lookup(self, parts):
+        # (cache_read, cache_write) tokens of a prompt split at its cache points. The
+        # longest cached prefix is read, what follows it up to the last cache point is written
+        now = time.monotonic()
+        digest = hashlib.sha256()
+        prefixes = []
+        tokens = 0
+        for part in parts[:-1][:MAX_CACHE_POINTS]:
+            digest.update(part.encode("utf-8") + b"\0")
+            tokens += count_tokens(part)
+            if tokens >= self.min_tokens:
+                prefixes.append((digest.hexdigest(), tokens))
+        if not prefixes:
+            return 0, 0
+        with self.lock:
+            read = max((tokens for key, tokens in prefixes if self.entries.get(key, 0) > now), default=0)
+            # Every use extends the TTL of the prefixes
+            for key, _ in prefixes:
+                self.entries[key] = now + self.ttl_seconds
+            if len(self.entries) > 10000:
+                self.entries = {key: expiry for key, expiry in self.entries.items() if expiry > now}
+
+        return read, prefixes[-1][1] - read
+
+
+class PromptCachingChatModel(BaseChatModel):
+    # Wraps the chat model of the agent, see PROMPT_CACHE for the modes
+    model: BaseChatModel
+    mode: str = "off"
+    # SimulatedPrefixCache of the "simulated" mode (cache is the LLM response cache)
+    prefix_cache: Any = None
+
+    @property
+    def _llm_type(self):
+        return f"prompt-caching-{self.model._llm_type}"
+
+    @property
+    def _identifying_params(self):
+        return {"mode": self.mode, **self.model._identifying_params}
+
+    def prepare(self, messages):
+        # Messages without the cache point marks, and the parts of the prompt
+        prepared, parts = [], None
+        for message in messages:
+            if isinstance(message.content, str) and PROMPT_CACHE_POINT in message.content:
+                parts = split_prompt(message.content)
+                if self.mode == "bedrock":
+                    blocks = [{"type": "text", "text": part} for part in parts if part.strip()]
+                    for block in blocks[:-1][:MAX_CACHE_POINTS]:
+                        block["cache_control"] = {"type": "ephemeral"}
+                    message = message.model_copy(update={"content": blocks})
+                else:
+                    message = message.model_copy(update={"content": "".join(parts)})
+            prepared.append(message)
+
+        return prepared, parts
+
+    def simulates_usage(self, parts):
+        return self.mode == "simulated" and parts is not None and self.prefix_cache is not None
+
+    def cache_usage(self, usage, parts, content):
+        # Same usage as Bedrock: input_tokens are the tokens not read from or written to the cache
+        read, written = self.prefix_cache.lookup(parts)
+        usage = dict(usage or {"input_tokens": count_tokens("".join(parts)), "output_tokens": count_tokens(content)})
+        usage["input_tokens"] = max(usage["input_tokens"] - read - written, 0)
+        usage["input_token_details"] = {"cache_read": read, "cache_creation": written}
+        usage["total_tokens"] = usage["input_tokens"] + read + written + usage["output_tokens"]
+
+        return usage
+
+    def record_usage(self, result, parts):
+        if not self.simulates_usage(parts):
+            return result
+        for generation in result.generations[:1]:
+            message = generation.message
+            message.usage_metadata = self.cache_usage(message.usage_metadata, parts, str(message.content))
+
+        return result
+
+    def record_chunk_usage(self, chunk, parts, pending):
+        # The simulated cache usage goes on the chunk reporting the input tokens, returns
+        # whether it is still to be reported
+        usage = chunk.message.usage_metadata
+        if pending and usage and usage.get("input_tokens"):
+            chunk.message.usage_metadata = self.cache_usage(usage, parts, "")
+            return False
+        return pending
+
+    def usage_chunk(self, parts, content):
+        # For models streaming without usage
+        return ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self.cache_usage(None, parts, content)))
+
+    def _should_stream(self, *, async_api, run_manager=None, **kwargs):
+        # Streams when the wrapped model does
+        return (super()._should_stream(async_api=async_api, run_manager=run_manager, **kwargs)
+                and self.model._should_stream(async_api=async_api, run_manager=run_manager, **kwargs))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        messages, parts = self.prepare(messages)
+        return self.record_usage(self.model._generate(messages, stop=stop, run_manager=run_manager, **kwargs), parts)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        messages, parts = self.prepare(messages)
+        return self.record_usage(await self.model._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs), parts)
+
+    # The caller reports the tokens of the chunks to the callbacks, the wrapped model
+    # does not get the run manager
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        messages, parts = self.prepare(messages)
+        pending, content = self.simulates_usage(parts), ""
+        for chunk in self.model._stream(messages, stop=stop, **kwargs):
+            pending = self.record_chunk_usage(chunk, parts, pending)
+            content += chunk.text
+            yield chunk
+        if pending:
+            yield self.usage_chunk(parts, content)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        messages, parts = self.prepare(messages)
+        pending, content = self.simulates_usage(parts), ""
+        async for chunk in self.model._astream(messages, stop=stop, **kwargs):
+            pending = self.record_chunk_usage(chunk, parts, pending)
+            content += chunk.text
+            yield chunk
+        if pending:
+            yield self.usage_chunk(parts, content)
+
+
+def with_prompt_cache(llm, mode, prefix_cache=None, cache_points=False):
+    # cache_points: the prompts keep the marks for another model of the route, an "off"
+    # model is then wrapped to remove them. Completion LLMs (e.g. the fakes of the
+    # benchmarks) are not wrapped, they get the marks, HTML comments the model ignores
+    if not isinstance(llm, BaseChatModel) or (mode == "off" and not cache_points):
+        return llm
+    if mode == "simulated" and prefix_cache is None:
+        prefix_cache = SimulatedPrefixCache()
+    return PromptCachingChatModel(model=llm, mode=mode, prefix_cache=prefix_cache)
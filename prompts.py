@@ -0,0 +1,346 @@
+import re
+
+# Prompt pieces shared by every SqlAgent instance.
+# They are static, so they live at module level instead of being rebuilt on every call.
+
+# Bump when the static prefix of a prompt changes. Everything before the first
+# PROMPT_CACHE_POINT is the same for every request, so Bedrock prompt caching (or the
+# simulated cache of prompt_cache.py) reuses it. The table description is cached up to
+# the second cache point for the questions selecting the same tables. The per request
+# fields (chat history, question, scratchpad) only come after the last cache point.
+# Bedrock does not cache prefixes under 1024 tokens (MIN_CACHEABLE_TOKENS): the static
+# prefix of the structured prompt (about 670 tokens) is only cached with the table
+# description, the agent prompt (about 1050 tokens) is cached on its own.
+PROMPT_VERSION = "5"
+# Removed from the prompt text before it is sent, see prompt_cache.py
+PROMPT_CACHE_POINT = "<!-- cache point -->"
+
+# Prompt used by the zero-shot ReAct sql agent
+AGENT_PROMPT_TEMPLATE = ("""Role: You are a SQL developer creating queries for Amazon Athena to answer non-technical users(Don't use words like sql, database, query and so on) questions about National Accounts Data of Egypt.
+                                             
+            Objective: Generate SQL queries to return data based on the provided schema and user request.
+                                                
+            1. Query Decomposition and Understanding:
+            - Analyze the user’s request to understand the main objective.
+            - Break down reqeusts into sub-queries that can each address a part of the user's request, using the schema provided.
+            - If the question does not seem related to the database, just return "I don't know" as the answer.
+                        
+            2. SQL Query Creation:
+            - For each sub-query, use the relevant tables and fields from the provided schema.
+            - Construct SQL queries that are precise and tailored to retrieve the exact data required by the user’s request.
+            - DO NOT make any DML statements (INSERT, UPDATE, DELETE, DROP etc.) to the database.
+            - Unless the user specifies a specific number of examples they wish to obtain, always limit your query to at most {top_k} results.
+            - You can order the results by a relevant column to return the most interesting examples in the database.
+                                
+            3. Query Execution and Response:
+            - Execute the constructed SQL queries against the Amazon Athena database.
+            - You MUST double check your query before executing it. If you get an error while executing a query, rewrite the query and try again.
+            - Return the results exactly as they are fetched from the database, ensuring data integrity and accuracy.
+            
+
+            Here is the tool you can use: <tool>{tools}</tool>
+                    
+                
+            Question: "Question here"
+            Thought: You should always think about what to do
+            Action: The action to take, should be one of [{tool_names}]
+            Action Input: The input to the action
+            Observation: The result of the action
+            ... (this Thought/Action/Action Input/Observation can repeat N times)
+            Thought: I now know the final answer
+            Final Answer: The final answer to the original input question should contain only the information present in the database, without any additional details. It should avoid using technical terms like database, SQL, table, or query. Numbers from the database should not be rounded. The answer should be organized and easy to read, formatted in HTML, and should not use headers greater than h4.
+                    
+            YOU MUST FOLLOW THESE RULES:
+                <rules>
+                <rule>Sometimes the data for the last year's quarters isn't complete, so when asked about the last quarter, take into consideration checking Q1, Q2, and Q3 instead of just Q4.</rule>
+                <rule>If you retrieve data from the private or public sector, or from current or constant prices, you should explicitly state this.</rule>
+                <rule>Don't access any data from (governorates_totals_gdp or governorates_activities_gdp) tables, only when a specific governorate is asked by user.</rule>
+                <rule>Don't access any data from TotalGrossDomesticProductAtMarketPrices table, only when user asks about market prices.</rule>    
+                <rule>When you ask about total gdp general, you must retrieve it from total_value_added table. Give total_value_added the highest periority</rule>
+                <rule>For changes, growth, shares and rankings, read the precomputed tables described below, if any (the *_metrics and *_ranks tables, regions_activities_gdp), instead of computing them.</rule>
+                <rule>When an Observation only shows the first rows of a result, get the rows you need with sql_db_fetch_rows or a narrower query. Only use values shown in the Observations, never estimate the others.</rule>
+                </rules>
+""" + PROMPT_CACHE_POINT + """
+            Here are columns descriptions for the Amazon Athena database:
+            {table_description}
+""" + PROMPT_CACHE_POINT + """
+            Relevant pieces of previous conversation:
+            <chat_history>{chat_history}</chat_history>
+            (You do not need to use these pieces of information if not relevant)
+
+            Question: {input}
+
+            {agent_scratchpad}   
+        """)
+
+# Examples that can be added to the prompt:
+#         <example>- question: What is the growth rate of manufacturing industry in the last quarter?
+#                  - query: SELECT Years, Q1, Q2, Q3, Q4 FROM sectors_growth_rates WHERE Activities = 'ManufacturingIndustries' ORDER BY Years DESC LIMIT 1;
+#         </example>
+
+AGENT_PROMPT_INPUT_VARIABLES = ["tools", "top_k", "table_description", "chat_history", "tool_names", "input", "agent_scratchpad"]
+
+# Prompt of the structured mode: one call returns every query and the answer template
+STRUCTURED_SQL_PROMPT_TEMPLATE = ("""Role: You are a SQL developer creating queries for Amazon Athena to answer non-technical users questions about National Accounts Data of Egypt.
+
+            Objective: Write all the SQL queries needed to answer the user request in one go, based on the provided schema, and an HTML template of the answer.
+            - Use only the relevant tables and fields of the schema. Construct precise queries that retrieve exactly the data required.
+            - DO NOT make any DML statements (INSERT, UPDATE, DELETE, DROP etc.) to the database.
+            - Unless the user specifies a specific number of examples they wish to obtain, always limit your query to at most {top_k} results.
+            - The answer template should contain only the information present in the database, without any additional details. It should avoid using technical terms like database, SQL, table, or query. It should be organized and easy to read, formatted in HTML, and should not use headers greater than h4.
+            - In the template, {{result_N}} is replaced by all the rows returned by the query number N (starting at 1) and {{result_N[row][column]}} by one value, both starting at 0 and in the order of the SELECT. Values are shown exactly as stored, never rounded.
+            - If the question does not seem related to the database, return no queries and "I don't know" as the answer template.
+
+            YOU MUST FOLLOW THESE RULES:
+                <rules>
+                <rule>Sometimes the data for the last year's quarters isn't complete, so when asked about the last quarter, take into consideration checking Q1, Q2, and Q3 instead of just Q4.</rule>
+                <rule>If you retrieve data from the private or public sector, or from current or constant prices, you should explicitly state this.</rule>
+                <rule>Don't access any data from (governorates_totals_gdp or governorates_activities_gdp) tables, only when a specific governorate is asked by user.</rule>
+                <rule>Don't access any data from TotalGrossDomesticProductAtMarketPrices table, only when user asks about market prices.</rule>
+                <rule>When you ask about total gdp general, you must retrieve it from total_value_added table. Give total_value_added the highest periority</rule>
+                <rule>For changes, growth, shares and rankings, read the precomputed tables described below, if any (the *_metrics and *_ranks tables, regions_activities_gdp), instead of computing them.</rule>
+                </rules>
+
+            Reply with a JSON object only, like {{"queries": ["SELECT ..."], "answer_template": "<p>... {{result_1[0][1]}} ...</p>"}}
+""" + PROMPT_CACHE_POINT + """
+            Here are columns descriptions for the Amazon Athena database:
+            {table_description}
+""" + PROMPT_CACHE_POINT + """
+            Relevant pieces of previous conversation:
+            <chat_history>{chat_history}</chat_history>
+            (You do not need to use these pieces of information if not relevant)
+
+            Question: {input}
+        """)
+
+STRUCTURED_SQL_PROMPT_INPUT_VARIABLES = ["top_k", "table_description", "chat_history", "input"]
+
+# Final call of the structured mode, when the template cannot be filled (e.g. no rows)
+STRUCTURED_ANSWER_PROMPT_TEMPLATE = ("""Role: You answer non-technical users questions about National Accounts Data of Egypt from the data below.
+
+            Answer with only the information present in the data, without any additional details. Avoid technical terms like database, SQL, table, or query. Numbers should not be rounded. If the data is empty, say that it is not available. The answer should be organized and easy to read, formatted in HTML, and should not use headers greater than h4.
+
+            Question: {input}
+            {results}
+            Final Answer:""")
+
+STRUCTURED_ANSWER_PROMPT_INPUT_VARIABLES = ["input", "results"]
+
+# Columns descriptions for the Amazon Athena database
+TABLE_DESCRIPTION = """
+            <athena_columns>
+                <governorates_activities_gdp_columns>
+                Governorates: Contains the governorates of Egypt, aggregated governorates in 'Total Egypt' and totals of regions. Here are values of this column: 
+                <Governorates>
+                    Alexandria,Aswan,Asyut,Beheira,Beni Suef,Cairo,Dakahlia,Damietta,Fayoum,Gharbia,Giza,Ismailia,Kafr ElSheikh,Luxor,Matruh,Minya,Menoufia,New Valley,North Sinai,Port Said,Qalyubia,Qena,Red Sea,Sharqia,Sohag,South Sinai,Suez,Total Egypt,Total Greater Cairo region,Total Central Upper Egypt region,Total Suez Canal region,Total Alexandria region,Total North Upper Egypt region,Total South Upper Egypt region,Total Delta region
+                </Governorates>
+                Regions: Contains the regions of Egypt, where each region includes many governorates. Here are values of this column:  <Regions>Delta,South Upper Egypt,North Upper Egypt,Alexandria,Suez Canal,Central Upper Egypt,Greater Cairo, Total Egypt</Regions>
+                Years: Contains financial years that should be treated as string data types, formatted as 'year/(year-1)'. For example: '2024/2023', '2020/2019', and so on. If the user enters a year like '2020' or '2019/2020', it should be considered as '2020/2019'. Similarly '2016' or  '2015/2016' should be considered as '2016/2015', and so on.
+                Activities: Contains the activities or sectors that are in the governorate <Activities>Agriculture,BusinessServices,AccommodationandFoodServiceActivities,Communication,Construction,CrudePetroleumExtraction,DomesticWorkers,Education,ElectricityandGas,GeneralGovernment,FinancialCorporations,Health,Information,ManufacturingIndustries,NonFinancialCorporations,NonProfitInstitutionsServingHouseholdSector,OtherExtractions,OtherServices,PetroleumRefinement,RealEstateOwnership,Sewerage,WasteRecycling,Water,WholesaleandRetailTrade</Activities>
+                GDP_Per_Activity: Contains the gross domestic product GDP values for each activity, and it is mandatory to measure any value in units of 'Thousand EGP' when retrieving data from this column.
+                </governorates_activities_gdp_columns>
+                <governorates_totals_gdp_columns>
+                Governorates: Contains the governorates of Egypt, aggregated governorates in 'Total Egypt' and totals of regions. Here are values of this column: 
+                <Governorates>
+                    Alexandria,Aswan,Asyut,Beheira,Beni Suef,Cairo,Dakahlia,Damietta,Fayoum,Gharbia,Giza,Ismailia,Kafr ElSheikh,Luxor,Matruh,Minya,Menoufia,New Valley,North Sinai,Port Said,Qalyubia,Qena,Red Sea,Sharqia,Sohag,South Sinai,Suez,Total Egypt,Total Greater Cairo region,Total Central Upper Egypt region,Total Suez Canal region,Total Alexandria region,Total North Upper Egypt region,Total South Upper Egypt region,Total Delta region
+                </Governorates>
+                Regions: Contains the regions of Egypt, where each region includes many governorates. Here are values of this column:  <Regions>Delta,South Upper Egypt,North Upper Egypt,Alexandria,Suez Canal,Central Upper Egypt,Greater Cairo, Total Egypt</Regions>
+                Years: Contains financial years that should be treated as string data types, formatted as 'year/(year-1)'. For example: '2024/2023', '2020/2019', and so on. If the user enters a year like '2020' or '2019/2020', it should be considered as '2020/2019'. Similarly '2016' or  '2015/2016' should be considered as '2016/2015', and so on.
+                Total_GDP: Contains gross domestic product (GDP) values for aggregated activities in a specific year. And it is the main column to get the total GDP. And it is mandatory to measure any value in units of 'Thousand EGP' when retrieving data from this column.
+                Custom_Fees: Contains gross domestic product (GDP) values for custom fees in a specific year. And it is mandatory to measure any value in units of 'Thousand EGP' when retrieving data from this column.
+                Total_GDP_With_Custom_Fees: Contains gross domestic product (GDP) values for custom fees plus total GDP in a specific year. And it is mandatory to measure any value in units of 'Thousand EGP' when retrieving data from this column.
+                </governorates_totals_gdp_columns>
+                <investments_activities_columns>
+                Years: Contains financial years that should be treated as string data types, formatted as 'year/(year-1)'. For example: '2024/2023', '2020/2019', and so on. If the user enters a year like '2020' or '2019/2020', it should be considered as '2020/2019'. Similarly '2016' or  '2015/2016' should be considered as '2016/2015', and so on.
+                Activities: Contains economic activities or sectors for public investments<Activities>AccommodationandFoodServiceActivities,Agriculture,Construction,Education,Electricity,FinancialIntermediaryInsuranceAndSocialSecurity,Health,InformationAndCommunication,NaturalGas,OtherExtractions,OtherManufacturing,OtherServices,Petroleum,RealEstateOwnership,SuezCanal,TransportationAndStorage,WaterAndSewerage,WholesaleandRetailTrade,petroleumRefining</Activities>
+                First_Quarter: Contains the first-quarter public investments at current prices for a specific activity in a specific year. And it is mandatory to measure any value in units of 'Million EGP' when retrieving data from this column.
+                Second_Quarter: Contains the second-quarter public investments at current prices for a specific activity in a specific year. And it is mandatory to measure any value in units of 'Million EGP' when retrieving data from this column.
+                Third_Quarter: Contains the third-quarter public investments at current prices for a specific activity in a specific year. And it is mandatory to measure any value in units of 'Million EGP' when retrieving data from this column.
+                Fourth_Quarter: Contains the fourth-quarter public investments at current prices for a specific activity in a specific year. And it is mandatory to measure any value in units of 'Million EGP' when retrieving data from this column.
+                Total_Activity_Investment: Contains the total public investments at current prices for a specific activity in a specific year. And it is mandatory to measure any value in units of 'Million EGP' when retrieving data from this column.
+                </investments_activities_columns>
+                <investments_totals_columns>
+                Years: Contains financial years that should be treated as string data types, formatted as 'year/(year-1)'. For example: '2024/2023', '2020/2019', and so on. If the user enters a year like '2020' or '2019/2020', it should be considered as '2020/2019'. Similarly '2016' or  '2015/2016' should be considered as '2016/2015', and so on.
+                First_Quarter: Contains the first-quarter public investments at current prices in a specific year. And it is mandatory to measure any value in units of 'Million EGP' when retrieving data from this column.
+                Second_Quarter: Contains the second-quarter public investments at current prices in a specific year. And it is mandatory to measure any value in units of 'Million EGP' when retrieving data from this column.
+                Third_Quarter: Contains the third-quarter public investments at current prices in a specific year. And it is mandatory to measure any value in units of 'Million EGP' when retrieving data from this column.
+                Fourth_Quarter: Contains the fourth-quarter public investments at current prices in a specific year. And it is mandatory to measure any value in units of 'Million EGP' when retrieving data from this column.
+                Total_Year_Investment: Contains the total public investments at current prices in a specific year. And it is mandatory to measure any value in units of 'Million EGP' when retrieving data from this column.
+                </investments_totals_columns>
+                <expenditure_components_gdp_columns>
+                It is mandatory to specify whether the data was retrieved from current price columns or constant price columns.
+                Years: Contains financial years that should be treated as string data types, formatted as 'year/(year-1)'. For example: '2024/2023', '2020/2019', and so on. If the user enters a year like '2020' or '2019/2020', it should be considered as '2020/2019'. Similarly '2016' or  '2015/2016' should be considered as '2016/2015', and so on.
+                Components: Contains the expenditure components at both market prices and constant prices <components>
+                    ExportsOfGoodsAndServices,GovernmentConsumption,GrossCapitalFormation,ImportsOfGoodsAndServices,PrivateConsumption
+                </components>
+                Q1_Current_Prices: Contains the GDP value at current prices for the first quarter of a specific year and expenditure component. And it is mandatory to measure any value in units of 'Billion EGP' at current prices when retrieving data from this column.
+                Q2_Current_Prices: Contains the GDP value at current prices for the second quarter of a specific year and expenditure component. And it is mandatory to measure any value in units of 'Billion EGP' at current prices when retrieving data from this column.
+                Q3_Current_Prices: Contains the GDP value at current prices for the third quarter of a specific year and expenditure component. And it is mandatory to measure any value in units of 'Billion EGP' at current prices when retrieving data from this column.
+                Q4_Current_Prices: Contains the GDP value at current prices for the fourth quarter of a specific year and expenditure component. And it is mandatory to measure any value in units of 'Billion EGP' at current prices when retrieving data from this column.
+                Total_Current_Prices: Contains the GDP value at current prices for a specific year and expenditure component. And it is mandatory to measure any value in units of 'Billion EGP' at current prices when retrieving data from this column.
+                Q1_Constant_Prices: Contains the GDP value at constant prices (base year 2021-2022) for the first quarter of a specific year and expenditure component. And it is mandatory to measure any value in units of 'Billion EGP' at constant prices when retrieving data from this column.
+                Q2_Constant_Prices: Contains the GDP value at constant prices (base year 2021-2022) for the second quarter of a specific year and expenditure component. And it is mandatory to measure any value in units of 'Billion EGP' at constant prices when retrieving data from this column.
+                Q3_Constant_Prices: Contains the GDP value at constant prices (base year 2021-2022) for the third quarter of a specific year and expenditure component. And it is mandatory to measure any value in units of 'Billion EGP' at constant prices when retrieving data from this column.
+                Q4_Constant_Prices: Contains the GDP value at constant prices (base year 2021-2022) for the fourth quarter of a specific year and expenditure component. And it is mandatory to measure any value in units of 'Billion EGP' at constant prices when retrieving data from this column.
+                Total_Constant_Prices: Contains the GDP value at constant prices (base year 2021-2022) for a specific year and expenditure component. And it is mandatory to measure any value in units of 'Billion EGP' at constant prices when retrieving data from this column.
+                </expenditure_components_gdp_columns>
+                <TotalGrossDomesticProductAtMarketPrices_columns>
+                It is mandatory to specify whether the data was retrieved from current price columns or constant price columns.
+                Years: Contains financial years that should be treated as string data types, formatted as 'year/(year-1)'. For example: '2024/2023', '2020/2019', and so on. If the user enters a year like '2020' or '2019/2020', it should be considered as '2020/2019'. Similarly '2016' or  '2015/2016' should be considered as '2016/2015', and so on.
+                Q1_Current_Prices: Contains the total gross domestic product at market prices value at current prices for the first quarter of a specific year. And it is mandatory to measure any value in units of 'Billion EGP' at current prices when retrieving data from this column.
+                Q2_Current_Prices: Contains the total gross domestic product at market prices value at current prices for the second quarter of a specific year. And it is mandatory to measure any value in units of 'Billion EGP' at current prices when retrieving data from this column.
+                Q3_Current_Prices: Contains the total gross domestic product at market prices value at current prices for the third quarter of a specific year. And it is mandatory to measure any value in units of 'Billion EGP' at current prices when retrieving data from this column.
+                Q4_Current_Prices: Contains the total gross domestic product at market prices value at current prices for the fourth quarter of a specific year. And it is mandatory to measure any value in units of 'Billion EGP' at current prices when retrieving data from this column.
+                Total_Current_Prices: Contains the total gross domestic product at market prices value at current prices for a specific year. And it is mandatory to measure any value in units of 'Billion EGP' at current prices when retrieving data from this column.
+                Q1_Constant_Prices: Contains the total gross domestic product at market prices value at constant prices for the first quarter of a specific year. And it is mandatory to measure any value in units of 'Billion EGP' at constant prices when retrieving data from this column.
+                Q2_Constant_Prices: Contains the total gross domestic product at market prices value at constant prices for the second quarter of a specific year. And it is mandatory to measure any value in units of 'Billion EGP' at constant prices when retrieving data from this column.
+                Q3_Constant_Prices: Contains the total gross domestic product at market prices value at constant prices for the third quarter of a specific year. And it is mandatory to measure any value in units of 'Billion EGP' at constant prices when retrieving data from this column.
+                Q4_Constant_Prices: Contains the total gross domestic product at market prices value at constant prices for the fourth quarter of a specific year. And it is mandatory to measure any value in units of 'Billion EGP' at constant prices when retrieving data from this column.
+                Total_Constant_Prices: Contains the total gross domestic product at market prices value at constant prices for a specific year. And it is mandatory to measure any value in units of 'Billion EGP' at constant prices when retrieving data from this column.
+                </TotalGrossDomesticProductAtMarketPrices_columns>
+                <real_gdp_growth_rates_columns>
+                Years: Contains financial years that should be treated as string data types, formatted as 'year/(year-1)'. For example: '2024/2023', '2020/2019', and so on. If the user enters a year like '2020' or '2019/2020', it should be considered as '2020/2019'. Similarly '2016' or  '2015/2016' should be considered as '2016/2015', and so on.
+                Q1: Contains the real GDP growth rate value at market prices for the first quarter of a specific year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Q2: Contains the real GDP growth rate value at market prices for the second quarter of a specific year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Q3: Contains the real GDP growth rate value at market prices for the third quarter of a specific year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Q4: Contains the real GDP growth rate value at market prices for the fourth quarter of a specific year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Total: Contains the total real GDP growth rate value at market prices of a specific year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                </real_gdp_growth_rates_columns>
+                <total_gdp_growth_rate_at_factor_cost_columns>
+                It is mandatory to specify whether the data was retrieved from public sector columns or private sector columns.
+                Years: Contains financial years that should be treated as string data types, formatted as 'year/(year-1)'. For example: '2024/2023', '2020/2019', and so on. If the user enters a year like '2020' or '2019/2020', it should be considered as '2020/2019'. Similarly '2016' or  '2015/2016' should be considered as '2016/2015', and so on.
+                Public_Q1: Contains the total GDP growth rate at factor cost for the first quarter of the public sector for a specific year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Public_Q2: Contains the total GDP growth rate at factor cost for the second quarter of the public sector for a specific year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Public_Q3: Contains the total GDP growth rate at factor cost for the third quarter of the public sector for a specific year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Public_Q4: Contains the total GDP growth rate at factor cost for the fourth quarter of the public sector for a specific year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Public: Contains the total GDP growth rate at factor cost for the public sector for a specific year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Private_Q1: Contains the total GDP growth rate at factor cost for the first quarter of the private sector for a specific year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Private_Q2: Contains the total GDP growth rate at factor cost for the second quarter of the private sector for a specific year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Private_Q3: Contains the total GDP growth rate at factor cost for the third quarter of the private sector for a specific year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Private_Q4: Contains the total GDP growth rate at factor cost for the fourth quarter of the private sector for a specific year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Private: Contains the total GDP growth rate at factor cost for the private sector for a specific year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Q1: Contains the total GDP growth rate at factor cost for the first quarter of a specific year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Q2: Contains the total GDP growth rate at factor cost for the second quarter of a specific year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Q3: Contains the total GDP growth rate at factor cost for the third quarter of a specific year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Q4: Contains the total GDP growth rate at factor cost for the fourth quarter of a specific year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Total: Contains the total GDP growth rate at factor cost for a specific year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                </total_gdp_growth_rate_at_factor_cost_columns>
+                <sectors_growth_rates_columns>
+                It is mandatory to specify whether the data was retrieved from public sector columns or private sector columns.
+                Years: Contains financial years that should be treated as string data types, formatted as 'year/(year-1)'. For example: '2024/2023', '2020/2019', and so on. If the user enters a year like '2020' or '2019/2020', it should be considered as '2020/2019'. Similarly '2016' or  '2015/2016' should be considered as '2016/2015', and so on.
+                Activities: Contains economic activities or sectors of growth rates<Activities>AccommodationandFoodServiceActivities,AgricultureForestryFishing,BusinessServices,Communication,Construction,Education,Electricity,FinancialIntermediariesAuxiliaryServices,Gas,GeneralGovernment,Health,Information,ManufacturingIndustries,MiningQuarrying,OtherExtractions,OtherManufacturing,OtherServices,Petroleum,RealEstateActivitie,RealEstateOwnership,SocialSecurityAndInsurance,SocialServices,SuezCanal,TransportationAndStorage,WaterSewerageRemediationActivitie,WholesaleandRetailTrade,petroleumRefining</Activities>.
+                Public_Q1: Contains the GDP growth rate at factor cost for the first quarter of the public sector for a specific activity and year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Public_Q2: Contains the GDP growth rate at factor cost for the second quarter of the public sector for a specific activity and year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Public_Q3: Contains the GDP growth rate at factor cost for the third quarter of the public sector for a specific activity and year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Public_Q4: Contains the GDP growth rate at factor cost for the fourth quarter of the public sector for a specific activity and year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Public: Contains the GDP growth rate at factor cost for the public sector for a specific activity and year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Private_Q1: Contains the GDP growth rate at factor cost for the first quarter of the private sector for a specific activity and year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Private_Q2: Contains the GDP growth rate at factor cost for the second quarter of the private sector for a specific activity and year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Private_Q3: Contains the GDP growth rate at factor cost for the third quarter of the private sector for a specific activity and year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Private_Q4: Contains the GDP growth rate at factor cost for the fourth quarter of the private sector for a specific activity and year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Private: Contains the GDP growth rate at factor cost for the private sector for a specific activity and year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Q1: Contains the GDP growth rate at factor cost for the first quarter of a specific activity and year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Q2: Contains the GDP growth rate at factor cost for the second quarter of a specific activity and year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Q3: Contains the GDP growth rate at factor cost for the third quarter of a specific activity and year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Q4: Contains the GDP growth rate at factor cost for the fourth quarter of a specific activity and year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Total: Contains the GDP growth rate at factor cost for a specific activity and year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                </sectors_growth_rates_columns>
+                <activity_value_added_columns>
+                It is mandatory to specify whether the data was retrieved from public sector columns or private sector columns.
+                Years: Contains financial years that should be treated as string data types, formatted as 'year/(year-1)'. For example: '2024/2023', '2020/2019', and so on. If the user enters a year like '2020' or '2019/2020', it should be considered as '2020/2019'. Similarly '2016' or  '2015/2016' should be considered as '2016/2015', and so on.
+                Activities: Contains economic activities or sectors of gross value added at factor cost<Activities>AccommodationandFoodServiceActivities,AgricultureForestryFishing,BusinessServices,Communication,Construction,Education,Electricity,FinancialIntermediariesAuxiliaryServices,Gas,GeneralGovernment,Health,Information,ManufacturingIndustries,MiningQuarrying,OtherExtractions,OtherManufacturing,OtherServices,Petroleum,RealEstateActivitie,RealEstateOwnership,SocialSecurityAndInsurance,SocialServices,SuezCanal,TransportationAndStorage,WaterSewerageRemediationActivitie,WholesaleandRetailTrade,petroleumRefining</Activities>.
+                Public_Q1: Contains the gross value added at factor cost for the first quarter of the public sector for a specific activity and year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Public_Q2: Contains the gross value added at factor cost for the second quarter of the public sector for a specific activity and year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Public_Q3: Contains the gross value added at factor cost for the third quarter of the public sector for a specific activity and year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Public_Q4: Contains the gross value added at factor cost for the fourth quarter of the public sector for a specific activity and year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Public: Contains the gross value added at factor cost for the public sector for a specific activity and year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Private_Q1: Contains the gross value added at factor cost for the first quarter of the private sector for a specific activity and year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Private_Q2: Contains the gross value added at factor cost for the second quarter of the private sector for a specific activity and year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Private_Q3: Contains the gross value added at factor cost for the third quarter of the private sector for a specific activity and year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Private_Q4: Contains the gross value added at factor cost for the fourth quarter of the private sector for a specific activity and year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Private: Contains the gross value added at factor cost for the private sector for a specific activity and year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Q1: Contains the gross value added at factor cost for the first quarter of a specific activity and year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Q2: Contains the gross value added at factor cost for the second quarter of a specific activity and year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Q3: Contains the gross value added at factor cost for the third quarter of a specific activity and year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Q4: Contains the gross value added at factor cost for the fourth quarter of a specific activity and year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Total: Contains the total gross value added at factor cost for a specific activity and year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                </activity_value_added_columns>
+                <total_value_added_columns>
+                It is mandatory to specify whether the data was retrieved from public sector columns or private sector columns.
+                Years: Contains financial years that should be treated as string data types, formatted as 'year/(year-1)'. For example: '2024/2023', '2020/2019', and so on. If the user enters a year like '2020' or '2019/2020', it should be considered as '2020/2019'. Similarly '2016' or  '2015/2016' should be considered as '2016/2015', and so on.
+                Public_Q1: Contains the gross value added at factor cost for the first quarter of the public sector for a specific year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Public_Q2: Contains the gross value added at factor cost for the second quarter of the public sector for a specific year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Public_Q3: Contains the gross value added at factor cost for the third quarter of the public sector for a specific year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Public_Q4: Contains the gross value added at factor cost for the fourth quarter of the public sector for a specific year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Public: Contains the gross value added at factor cost for the public sector for a specific year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Private_Q1: Contains the gross value added at factor cost for the first quarter of the private sector for a specific year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Private_Q2: Contains the gross value added at factor cost for the second quarter of the private sector for a specific year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Private_Q3: Contains the gross value added at factor cost for the third quarter of the private sector for a specific year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Private_Q4: Contains the gross value added at factor cost for the fourth quarter of the private sector for a specific year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Private: Contains the gross value added at factor cost for the private sector for a specific year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Q1: Contains the gross value added at factor cost for the first quarter of a specific year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Q2: Contains the gross value added at factor cost for the second quarter of a specific year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Q3: Contains the gross value added at factor cost for the third quarter of a specific year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Q4: Contains the gross value added at factor cost for the fourth quarter of a specific year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                Total: Contains the total gross value added at factor cost for a specific year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                </total_value_added_columns>
+                <total_value_added_metrics_columns>
+                Precomputed from total_value_added, use it for the change, growth and public / private shares of total GDP instead of computing them. The latest year may be incomplete.
+                Years: Contains financial years formatted as 'year/(year-1)', like in total_value_added.
+                Total: Contains the total gross value added at factor cost for a specific year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                YoY_Change: Contains the change of Total from the previous year in units of 'Million EGP' at current prices.
+                YoY_Growth_Rate: Contains the change of Total from the previous year in '%' at current prices.
+                Public_Share: Contains the share of the public sector in Total, in '%'.
+                Private_Share: Contains the share of the private sector in Total, in '%'.
+                </total_value_added_metrics_columns>
+                <activity_value_added_metrics_columns>
+                Precomputed from activity_value_added and total_value_added, use it for the change, growth, share of GDP and ranking of activities instead of computing them. The latest year may be incomplete.
+                Years: Contains financial years formatted as 'year/(year-1)', like in activity_value_added.
+                Activities: Contains the same activities as activity_value_added.
+                Total: Contains the total gross value added at factor cost for a specific activity and year. And it is mandatory to measure any value in units of 'Million EGP' at current prices when retrieving data from this column.
+                YoY_Change: Contains the change of Total from the previous year in units of 'Million EGP' at current prices.
+                YoY_Growth_Rate: Contains the change of Total from the previous year in '%' at current prices.
+                Share_Of_GDP: Contains the share of the activity in the total gross value added of the year, in '%'.
+                Rank_In_Year: Contains the rank of the activity by Total within the year, 1 is the largest.
+                </activity_value_added_metrics_columns>
+                <sectors_growth_ranks_columns>
+                Precomputed from sectors_growth_rates, use it to find the fastest or slowest growing activities.
+                Years: Contains financial years formatted as 'year/(year-1)', like in sectors_growth_rates.
+                Activities: Contains the same activities as sectors_growth_rates.
+                Total: Contains the GDP growth rate at factor cost for a specific activity and year. And it is mandatory to measure any value in units of '%' at constant prices when retrieving data from this column.
+                Rank_In_Year: Contains the rank of the activity by growth rate within the year, 1 is the fastest growing.
+                </sectors_growth_ranks_columns>
+                <governorates_gdp_metrics_columns>
+                Precomputed from governorates_totals_gdp, only for governorates (not the totals of Egypt or regions). Use it for the growth, share and ranking of governorates, only when governorates are asked by user.
+                Years: Contains financial years formatted as 'year/(year-1)', like in governorates_totals_gdp.
+                Governorates: Contains the governorates of Egypt, like in governorates_totals_gdp.
+                Regions: Contains the region of the governorate.
+                Total_GDP: Contains the GDP of the governorate without custom fees in units of 'Thousand EGP'.
+                YoY_Growth_Rate: Contains the change of Total_GDP from the previous year in '%'.
+                Share_Of_Egypt: Contains the share of the governorate in the GDP of Egypt ('Total Egypt'), in '%'.
+                Rank_In_Year: Contains the rank of the governorate by Total_GDP within the year, 1 is the largest.
+                </governorates_gdp_metrics_columns>
+                <regions_activities_gdp_columns>
+                Precomputed from governorates_activities_gdp, the GDP of every activity summed over the governorates of each region. Use it only when regions are asked by user.
+                Years: Contains financial years formatted as 'year/(year-1)', like in governorates_activities_gdp.
+                Regions: Contains the regions of Egypt, like the Regions column of governorates_activities_gdp.
+                Activities: Contains the same activities as governorates_activities_gdp.
+                GDP: Contains the GDP of the activity in the region in units of 'Thousand EGP'.
+                Share_Of_Egypt: Contains the share of the region in the GDP of the activity in Egypt, in '%'.
+                </regions_activities_gdp_columns>
+            </athena_columns>
+        """
+
+# Column names of every table and the known values of its categorical columns
+# (Governorates, Regions, Activities, ...), parsed from the description above.
+def parse_table_description(description=TABLE_DESCRIPTION):
+    tables = {}
+    for table, section in re.findall(r"<(?!athena_)(\w+)_columns>(.*?)</\1_columns>", description, re.S):
+        columns = re.findall(r"^\s*(\w+): Contains", section, re.M)
+        values = {}
+        for tag, content in re.findall(r"<(\w+)>(.*?)</\1>", section, re.S):
+            column = next((c for c in columns if c.lower() == tag.lower()), None)
+            if column is not None:
+                values[column] = [value.strip() for value in content.split(",") if value.strip()]
+        tables[table] = {"text": section, "columns": columns, "values": values}
+    return tables
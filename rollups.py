@@ -0,0 +1,106 @@
+"""Precomputed derived metrics of the national accounts tables.
+
+Growth, shares, ranks and regional sums are materialized once per data refresh so
+the agent answers them with a lookup instead of aggregating the source tables. The
+tables are documented in TABLE_DESCRIPTION, the agent is only shown (and SqlGuard
+only allows) those the database has. sync_replica rebuilds them in the local replica
+after every sync. On Athena, run after the tables are loaded (part of the data
+refresh, until then the agent computes the metrics from the source tables):
+    python rollups.py --target-url <url>
+"""
+import argparse
+from sqlalchemy import create_engine, text
+
+
+def previous(column, key=None, years="Years"):
+    # Value of the previous year for the same key, Years ('2023/2022') sort in time order
+    partition = f"PARTITION BY {key} " if key else ""
+    return f"LAG({column}) OVER ({partition}ORDER BY {years})"
+
+
+def growth(column, key=None, years="Years"):
+    # Year over year change in %, rounded to 2 decimals
+    return f"ROUND(100.0 * ({column} - {previous(column, key, years)}) / NULLIF({previous(column, key, years)}, 0), 2)"
+
+
+# Table -> (SELECT over the source tables, columns of the lookup index)
+ROLLUPS = {
+    "total_value_added_metrics": (f"""
+        SELECT Years, Total,
+            Total - {previous("Total")} AS YoY_Change,
+            {growth("Total")} AS YoY_Growth_Rate,
+            ROUND(100.0 * Public / NULLIF(Total, 0), 2) AS Public_Share,
+            ROUND(100.0 * Private / NULLIF(Total, 0), 2) AS Private_Share
+        FROM total_value_added""", ["Years"]),
+    "activity_value_added_metrics": (f"""
+        SELECT a.Years, a.Activities, a.Total,
+            a.Total - {previous("a.Total", "a.Activities", "a.Years")} AS YoY_Change,
+            {growth("a.Total", "a.Activities", "a.Years")} AS YoY_Growth_Rate,
+            ROUND(100.0 * a.Total / NULLIF(t.Total, 0), 2) AS Share_Of_GDP,
+            RANK() OVER (PARTITION BY a.Years ORDER BY a.Total DESC) AS Rank_In_Year
+        FROM activity_value_added a
+        LEFT JOIN total_value_added t ON t.Years = a.Years""", ["Years", "Activities"]),
+    "sectors_growth_ranks": ("""
+        SELECT Years, Activities, Total,
+            RANK() OVER (PARTITION BY Years ORDER BY Total DESC) AS Rank_In_Year
+        FROM sectors_growth_rates""", ["Years", "Activities"]),
+    "governorates_gdp_metrics": (f"""
+        SELECT g.Years, g.Governorates, g.Regions, g.Total_GDP,
+            {growth("g.Total_GDP", "g.Governorates", "g.Years")} AS YoY_Growth_Rate,
+            ROUND(100.0 * g.Total_GDP / NULLIF(e.Total_GDP, 0), 2) AS Share_Of_Egypt,
+            RANK() OVER (PARTITION BY g.Years ORDER BY g.Total_GDP DESC) AS Rank_In_Year
+        FROM governorates_totals_gdp g
+        LEFT JOIN governorates_totals_gdp e ON e.Years = g.Years AND e.Governorates = 'Total Egypt'
+        WHERE g.Governorates NOT LIKE 'Total%'""", ["Years", "Governorates"]),
+    "regions_activities_gdp": ("""
+        SELECT g.Years, g.Regions, g.Activities, SUM(g.GDP_Per_Activity) AS GDP,
+            ROUND(100.0 * SUM(g.GDP_Per_Activity) / NULLIF(MAX(e.GDP_Per_Activity), 0), 2) AS Share_Of_Egypt
+        FROM governorates_activities_gdp g
+        LEFT JOIN governorates_activities_gdp e ON e.Years = g.Years AND e.Activities = g.Activities AND e.Governorates = 'Total Egypt'
+        WHERE g.Governorates NOT LIKE 'Total%'
+        GROUP BY g.Years, g.Regions, g.Activities""", ["Years", "Regions", "Activities"]),
+}
+
+
+def rollup_statements(dialect):
+    # DDL rebuilding every rollup. Athena has no indexes and writes Parquet, DuckDB
+    # skips the row groups outside of the lookup through the min/max of sorted columns
+    statements = []
+    for table, (select, index_columns) in ROLLUPS.items():
+        statements.append(f"DROP TABLE IF EXISTS {table}")
+        if dialect == "awsathena":
+            statements.append(f"CREATE TABLE {table} WITH (format = 'PARQUET') AS {select}")
+        elif dialect == "duckdb":
+            statements.append(f"CREATE TABLE {table} AS SELECT * FROM ({select}) ORDER BY {', '.join(index_columns)}")
+        else:
+            statements.append(f"CREATE TABLE {table} AS {select}")
+            statements.append(f"CREATE INDEX {table}_lookup ON {table} ({', '.join(index_columns)})")
+    return statements
+
+
+def build_rollups(engine):
+    # Athena runs DDL statements one at a time, outside of transactions
+    with engine.connect() as connection:
+        for statement in rollup_statements(engine.dialect.name):
+            connection.execute(text(statement))
+            connection.commit()
+
+    return list(ROLLUPS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-url", default=None, help="Defaults to the Athena connection of the agent")
+    args = parser.parse_args()
+
+    if args.target_url is None:
+        from shared_resources import athena_connection_string
+        args.target_url = athena_connection_string()
+    engine = create_engine(args.target_url)
+    for table in build_rollups(engine):
+        print(f"Built {table}")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import math
+import re
+from prompts import parse_table_description
+from rollups import ROLLUPS
+
+# Selects the parts of TABLE_DESCRIPTION relevant to a question so the prompt does not
+# carry every column of every table. Tables are scored with an IDF weighted keyword
+# index built from the table names and their known values, the prompt rules (governorate
+# and market price tables) are enforced, and sector / price columns the question does
+# not ask about are dropped. When nothing matches only total_value_added is kept, the
+# table the rules give the highest priority for general GDP questions.
+
+TABLES = parse_table_description()
+
+# Words users employ for a table that do not appear in its name or values
+TABLE_KEYWORDS = {
+    "governorates_activities_gdp": {"governorate", "region", "activity", "sector"},
+    "governorates_totals_gdp": {"governorate", "region", "custom", "fee", "total"},
+    "investments_activities": {"investment", "invest", "public", "activity", "sector"},
+    "investments_totals": {"investment", "invest", "public", "total"},
+    "expenditure_components_gdp": {"expenditure", "component", "consumption", "export", "import", "capital", "formation", "spending"},
+    "TotalGrossDomesticProductAtMarketPrices": {"market", "price"},
+    "real_gdp_growth_rates": {"real", "growth", "rate"},
+    "total_gdp_growth_rate_at_factor_cost": {"growth", "rate", "factor", "cost", "total"},
+    "sectors_growth_rates": {"growth", "rate", "sector", "activity"},
+    "activity_value_added": {"value", "added", "sector", "activity"},
+    "total_value_added": {"value", "added", "total", "gdp"},
+    "total_value_added_metrics": {"value", "added", "total", "change", "increase", "decrease", "growth", "share", "public", "private"},
+    "activity_value_added_metrics": {"value", "added", "activity", "sector", "change", "increase", "decrease", "growth", "share", "contribution", "rank", "largest", "biggest", "highest", "lowest"},
+    "sectors_growth_ranks": {"growth", "rate", "activity", "sector", "rank", "fastest", "slowest", "highest", "lowest"},
+    "governorates_gdp_metrics": {"governorate", "region", "growth", "share", "rank", "largest", "biggest", "highest", "lowest"},
+    "regions_activities_gdp": {"region", "activity", "sector", "share"},
+}
+# Words found all over the schema (or in value names like ExportsOfGoodsAndServices)
+# that do not point to a table
+GENERIC_WORDS = {"gdp", "egypt", "of", "and", "the", "in", "at", "for", "to", "by", "on"}
+GOVERNORATE_TABLES = ["governorates_activities_gdp", "governorates_totals_gdp", "governorates_gdp_metrics", "regions_activities_gdp"]
+MARKET_PRICES_TABLE = "TotalGrossDomesticProductAtMarketPrices"
+# Asked about total GDP in general, it has the highest priority
+DEFAULT_TABLE = "total_value_added"
+MAX_TABLES = 3
+# Tables scoring at least this share of the best score are kept
+MIN_RELATIVE_SCORE = 0.6
+# Words of the activity names ("SuezCanal" -> suez, canal), removed before looking for
+# governorates: the Suez Canal activity is not the Suez governorate
+ACTIVITY_NAMES = sorted({tuple(re.sub(r"([a-z])([A-Z])", r"\1 \2", value).lower().split())
+                         for table in TABLES.values() for value in table["values"].get("Activities", [])}, key=len, reverse=True)
+
+
+def split_words(text):
+    # "ManufacturingIndustries" -> manufacturing, industry
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    words = set()
+    for word in re.findall(r"[a-z]+", text.lower()):
+        if len(word) > 3 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.add(word)
+    return words
+
+
+def build_index(tables=TABLES):
+    table_words = {}
+    for table, description in tables.items():
+        words = split_words(table) | TABLE_KEYWORDS.get(table, set())
+        for values in description["values"].values():
+            words |= split_words(" ".join(values))
+        table_words[table] = words - GENERIC_WORDS
+
+    # Words shared by every table do not tell tables apart
+    document_frequency = {}
+    for words in table_words.values():
+        for word in words:
+            document_frequency[word] = document_frequency.get(word, 0) + 1
+    idf = {word: math.log(len(tables) / count) for word, count in document_frequency.items()}
+
+    return table_words, idf
+
+
+TABLE_WORDS, IDF = build_index()
+
+
+def mentions_governorate(text):
+    values = TABLES["governorates_totals_gdp"]["values"]
+    names = [name for name in values["Governorates"] + values["Regions"] if name != "Total Egypt"]
+    text = text.lower()
+    for words in ACTIVITY_NAMES:
+        text = re.sub(r"\b" + r"\s*".join(map(re.escape, words)) + r"\b", " ", text)
+    return any(re.search(rf"\b{re.escape(name.lower())}\b", text) for name in names) or bool(re.search(r"\b(governorate|region)s?\b", text))
+
+
+def mentions_market_prices(text):
+    return bool(re.search(r"\bmarket\s+prices?\b", text.lower()))
+
+
+def with_history(question, chat_history=None):
+    # Follow-up questions ("and for Giza?") borrow the words of the previous questions
+    previous = " ".join(re.findall(r"Human_message: (.*)", "\n".join(chat_history or [])))
+    return f"{question} {previous}"
+
+
+def available_tables(table_names):
+    # Documented tables of a database given the tables it reflects. The rollups only
+    # exist once rollups.py ran on it (sync_replica builds them in the replica), the
+    # other tables are always kept: the replica sends the tables it lacks to Athena
+    names = {name.lower() for name in table_names}
+    return [table for table in TABLES if table not in ROLLUPS or table.lower() in names]
+
+
+def select_tables(question, chat_history=None, tables=None):
+    # tables: the tables that may be selected, all the documented ones by default
+    text = with_history(question, chat_history)
+    words = split_words(text)
+
+    scores = {table: sum(IDF[word] for word in words & table_words) for table, table_words in TABLE_WORDS.items()}
+    if not mentions_governorate(text):
+        for table in GOVERNORATE_TABLES:
+            scores[table] = 0
+    if not mentions_market_prices(text):
+        scores[MARKET_PRICES_TABLE] = 0
+    scores = {table: score for table, score in scores.items() if tables is None or table in tables}
+
+    best = max(scores.values())
+    if best == 0:
+        return [DEFAULT_TABLE]
+    selected = sorted((table for table, score in scores.items() if score >= best * MIN_RELATIVE_SCORE), key=lambda table: -scores[table])[:MAX_TABLES]
+    if DEFAULT_TABLE not in selected:
+        selected.append(DEFAULT_TABLE)
+
+    return selected
+
+
+def prune_columns(section, question):
+    question = question.lower()
+    lines = section.split("\n")
+    # Sector columns are only needed when the question is about the public or private sector
+    if not re.search(r"\b(public|private)\b", question):
+        lines = [line for line in lines if not re.match(r"\s*(Public|Private)(_Q\d)?:", line)
+                 and "public sector columns or private sector columns" not in line]
+    # Keep one price basis when the question names only one of them
+    if "current" in question and "constant" not in question:
+        lines = [line for line in lines if not re.match(r"\s*\w+_Constant_Prices:", line)]
+    elif "constant" in question and "current" not in question:
+        lines = [line for line in lines if not re.match(r"\s*\w+_Current_Prices:", line)]
+
+    return "\n".join(lines)
+
+
+def describe_tables(tables, text=None):
+    # TABLE_DESCRIPTION of the given tables, without the columns text does not ask about
+    sections = "".join(
+        f"\n                <{table}_columns>{TABLES[table]['text'] if text is None else prune_columns(TABLES[table]['text'], text)}</{table}_columns>"
+        for table in tables
+    )
+
+    return f"\n            <athena_columns>{sections}\n            </athena_columns>\n        "
+
+
+def select_table_description(question, chat_history=None, tables=None):
+    return describe_tables(select_tables(question, chat_history, tables), with_history(question, chat_history))
@@ -0,0 +1,275 @@
+from sqlalchemy import create_engine, event
+from langchain_community.utilities import SQLDatabase
+from langchain_community.agent_toolkits import create_sql_agent
+from langchain_aws import ChatBedrock
+from botocore.config import Config
+import boto3
+from langchain.prompts import PromptTemplate
+import os
+import threading
+import time
+from urllib.parse import quote_plus
+from dotenv import load_dotenv
+from answer_cache import AnswerCache, TableRefreshWatcher
+from athena_backend import ATHENA_RESULT_REUSE_MINUTES, AthenaResultReuse, create_athena_engine
+from conversation_memory import SessionStore
+from intent_router import IntentRouter
+from local_replica import REPLICA_PATH, ReplicaSQLDatabase, ReplicaRefreshWatcher
+from observations import ObservationStore
+from model_router import FAST_MODEL_ID, REQUEST_TIMEOUT_SECONDS, RoutedChatModel
+from prompt_cache import PROMPT_CACHE, resolve_prompt_cache, strip_cache_points, with_prompt_cache
+from prompts import AGENT_PROMPT_TEMPLATE, AGENT_PROMPT_INPUT_VARIABLES
+from schema_retrieval import available_tables, describe_tables
+from single_flight import SingleFlight
+from sql_cache import SqlResultCache, WARMUP_QUERIES
+from sql_guard import SqlGuard
+from sql_tools import AgentSQLDatabaseToolkit
+from structured_sql import StructuredSqlPipeline
+from tracing import record_bedrock_retries, record_cursor_stats, start_metrics_server
+from worker_pool import AgentWorkerPool
+
+# Load environment variables from .env file
+load_dotenv()
+# Retrieve credentials from environment variables
+aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
+aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
+
+DEFAULT_MODEL_ID = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+# "athena" queries Athena directly, "replica" answers from the local DuckDB replica
+SQL_AGENT_BACKEND = os.getenv('SQL_AGENT_BACKEND', 'athena')
+# "react" runs the ReAct agent loop, "structured" plans every query in one LLM call
+SQL_AGENT_MODE = os.getenv('SQL_AGENT_MODE', 'react')
+# Optional sqlite file keeping the sql results between restarts
+SQL_RESULT_CACHE_PATH = os.getenv('SQL_RESULT_CACHE_PATH')
+# Sqlite file with the chat history of every session, shared by the workers
+SESSION_STORE_PATH = os.getenv('SESSION_STORE_PATH', os.path.join("sessions", "sessions.db"))
+# Agent runs in flight for the whole process and for one session
+MAX_CONCURRENT_RUNS = int(os.getenv('MAX_CONCURRENT_RUNS', '8'))
+MAX_CONCURRENT_RUNS_PER_USER = int(os.getenv('MAX_CONCURRENT_RUNS_PER_USER', '1'))
+# Port of the Prometheus metrics endpoint, disabled when not set
+METRICS_PORT = os.getenv('METRICS_PORT')
+# Bedrock calls made by botocore for one LLM call, throttled calls included
+BEDROCK_MAX_ATTEMPTS = 3
+# Tokens an answer may generate, the HTML answers are far shorter
+MAX_OUTPUT_TOKENS = 4096
+# How often the Glue catalog is checked for refreshed Athena tables
+TABLE_REFRESH_CHECK_SECONDS = 300
+
+
+def athena_connection_string():
+    region = 'us-east-1'
+    athena_url = f"athena.{region}.amazonaws.com"
+    athena_port = '443' #Update, if port is different
+    athena_db = 'athena_db' #from user defined params
+    s3stagingathena = 's3://athena-destination-store-mped/'
+    athena_wkgrp = 'primary'
+
+    # Secret keys may contain "/" and "+", the cursor (rest, arrow or pandas) is set by athena_backend.py
+    return f"awsathena+rest://{quote_plus(aws_access_key_id or '')}:{quote_plus(aws_secret_access_key or '')}@{athena_url}:{athena_port}/{athena_db}?s3_staging_dir={s3stagingathena}&work_group={athena_wkgrp}"
+
+
+class SharedResources:
+    # Everything that is expensive to build and holds no per user state: the Bedrock
+    # client/llm, the Athena engine (and its connection pool), the SQLDatabase with the
+    # reflected tables metadata, the prompt and the agent executor.
+    # The agent executor can be shared because the chat history is passed on every call.
+
+    def __init__(self, model_id=DEFAULT_MODEL_ID, llm=None, database_url=None, backend="athena", replica_path=REPLICA_PATH, sql_result_cache_path=None, warm_queries=None, db=None, use_sql_result_cache=True, session_store_path=None, prompt_cache=PROMPT_CACHE, use_sql_guard=True, use_single_flight=True, compact_observations=True) -> None:
+        self.model_id = model_id
+        # "auto", "bedrock", "simulated" or "off", see prompt_cache.py
+        self.prompt_cache_mode = prompt_cache
+        # The prompts keep the cache points when a model of the route caches them
+        model_ids = [model_id] if llm is not None else [model_id, FAST_MODEL_ID]
+        self.cache_points = any(resolve_prompt_cache(prompt_cache, model) != "off" for model in model_ids)
+        self.backend = backend
+        self.replica_path = replica_path
+        # Initialize the llm
+        self.llm = with_prompt_cache(llm, resolve_prompt_cache(prompt_cache, model_id)) if llm is not None else self.get_llm()
+        self.sql_guard = None
+        # Max age of the Athena results the queries reuse, bounded by the table refreshes
+        self.athena_result_reuse = AthenaResultReuse() if ATHENA_RESULT_REUSE_MINUTES > 0 else None
+        # Initialize db connection, a database_url (e.g. sqlite) replaces Athena
+        self.db = db if db is not None else self.db_connection(database_url)
+        # Tables described to the agent, the rollups only once rollups.py built them
+        self.described_tables = available_tables(self.db.get_usable_table_names())
+        self.table_description = describe_tables(self.described_tables)
+        # Checks and fixes the SQL of the agent against the reflected schema before it runs
+        self.sql_guard = SqlGuard(self.db, tables=self.described_tables) if use_sql_guard else None
+        # Results of sql_db_query shared by all sessions
+        self.sql_result_cache = SqlResultCache(path=sql_result_cache_path) if use_sql_result_cache else None
+        # Identical questions and queries running for several sessions share one run
+        self.single_flight = SingleFlight() if use_single_flight else None
+        # Full rows of the large results the agent only gets a compact view of
+        self.observation_store = ObservationStore() if compact_observations else None
+        # Builds and runs the SQL of the common questions itself
+        self.intent_router = IntentRouter(self.db)
+        # Initialize prompt and agent
+        self.prompt = self.get_prompt()
+        self.agent = self.get_agent()
+        # Single pass alternative to the agent, selected per SqlAgent
+        self.structured_sql = StructuredSqlPipeline(self.llm, self.db, self.sql_result_cache, self.sql_guard, self.single_flight, self.cache_points)
+        # Answers shared by all sessions, invalidated when Athena tables are refreshed
+        self.answer_cache = AnswerCache()
+        self.table_refresh_watcher = self.get_table_refresh_watcher(database_url)
+        # None until the first check, made by the first question
+        self.last_refresh_check = None
+        # Chat history of the sessions, kept in memory only without a path
+        self.session_store = SessionStore(session_store_path) if session_store_path else None
+        # Bounds the concurrent agent runs of all sessions
+        self.worker_pool = AgentWorkerPool(MAX_CONCURRENT_RUNS, MAX_CONCURRENT_RUNS_PER_USER)
+        if warm_queries and self.sql_result_cache is not None:
+            # Warm in the background so the first session does not wait for Athena
+            threading.Thread(target=self.sql_result_cache.warm, args=(self.db, warm_queries), daemon=True).start()
+
+    def db_connection(self, database_url=None):
+        if database_url is None:
+            database_url = athena_connection_string()
+        if self.backend == "replica":
+            # The remote database is only connected for queries the replica cannot run
+            db = ReplicaSQLDatabase.from_path(self.replica_path, fallback_db=lambda: SQLDatabase(self.instrument_engine(self.create_engine(database_url))))
+            self.instrument_engine(db._engine)
+            return db
+        engine = self.instrument_engine(self.create_engine(database_url))
+        # Tables are reflected once here and reused by every session
+        db = SQLDatabase(engine)
+
+        return db
+
+    def create_engine(self, database_url):
+        # Pooled Athena engine with backoff polling, result reuse and query logs, see
+        # athena_backend.py. Other urls (e.g. sqlite) get a plain engine
+        if database_url.startswith("awsathena"):
+            return create_athena_engine(database_url, result_reuse=self.athena_result_reuse)
+
+        return create_engine(database_url)
+
+    def instrument_engine(self, engine):
+        # Athena statistics (bytes scanned, queue and execution time) of every query
+        event.listen(engine, "after_cursor_execute", record_cursor_stats)
+        # Sizes of the tables for the cost guard
+        event.listen(engine, "after_cursor_execute", self.record_table_scan)
+
+        return engine
+
+    def record_table_scan(self, *args):
+        if self.sql_guard is not None:
+            self.sql_guard.record_scan(*args)
+
+    def get_llm(self):
+        # The fast and the large model behind the latency budgeted router
+        return RoutedChatModel(models={"large": self.get_bedrock_llm(self.model_id), "fast": self.get_bedrock_llm(FAST_MODEL_ID)})
+
+    def get_bedrock_llm(self, model_id):
+        # Initialize the language model. botocore retries a few times only, the router
+        # falls back to the other model and keeps every call within the answer deadline
+        retry_config = Config(
+            region_name = 'us-east-1',
+            retries = {
+                'max_attempts': BEDROCK_MAX_ATTEMPTS,
+                'mode': 'standard'
+            },
+            read_timeout = REQUEST_TIMEOUT_SECONDS,
+        )
+
+        boto3_bedrock_runtime = boto3.client("bedrock-runtime", config=retry_config, aws_secret_access_key=aws_secret_access_key, aws_access_key_id=aws_access_key_id)
+        # Count the retries made inside max_attempts
+        boto3_bedrock_runtime.meta.events.register("after-call.bedrock-runtime", record_bedrock_retries)
+
+
+        model_kwargs =  {
+            "max_tokens": MAX_OUTPUT_TOKENS,
+            "temperature": 0,
+            "top_k": 250,
+            "top_p": 1,
+        }
+        llm = ChatBedrock(
+        client=boto3_bedrock_runtime,
+        model_id=model_id,
+        model_kwargs=model_kwargs,
+        )
+
+        # Reuses the static prefix of the prompts when Bedrock supports prompt caching
+        return with_prompt_cache(llm, resolve_prompt_cache(self.prompt_cache_mode, model_id), cache_points=self.cache_points)
+
+    def get_prompt(self):
+        prompt = PromptTemplate(
+            input_variables=AGENT_PROMPT_INPUT_VARIABLES,
+            template=AGENT_PROMPT_TEMPLATE if self.cache_points else strip_cache_points(AGENT_PROMPT_TEMPLATE))
+
+        return prompt
+
+    def get_agent(self):
+        toolkit = AgentSQLDatabaseToolkit(db=self.db, llm=self.llm, sql_result_cache=self.sql_result_cache, sql_guard=self.sql_guard, single_flight=self.single_flight,
+                                          observation_store=self.observation_store)
+        agent_executor = create_sql_agent(
+            self.llm,
+            toolkit=toolkit,
+            verbose=True,
+            agent_type="zero-shot-react-description",
+            prompt=self.prompt,
+            agent_executor_kwargs={
+                "return_intermediate_steps": True,
+                "handle_parsing_errors": True,
+            },
+            # Stops iterating once the answer is out of time, see model_router.py
+            max_execution_time=REQUEST_TIMEOUT_SECONDS,
+        )
+
+        return agent_executor
+
+    def get_table_refresh_watcher(self, database_url=None):
+        caches = [cache for cache in (self.answer_cache, self.sql_result_cache, self.athena_result_reuse) if cache is not None]
+        if self.backend == "replica":
+            return ReplicaRefreshWatcher(caches, self.db, self.replica_path)
+        # Only the Athena tables are tracked through the Glue catalog
+        if database_url is not None:
+            return None
+        glue_client = boto3.client("glue", region_name='us-east-1', aws_secret_access_key=aws_secret_access_key, aws_access_key_id=aws_access_key_id)
+
+        return TableRefreshWatcher(caches, glue_client)
+
+    def check_table_refresh(self):
+        if self.table_refresh_watcher is None:
+            return
+        now = time.monotonic()
+        if self.last_refresh_check is not None and now - self.last_refresh_check < TABLE_REFRESH_CHECK_SECONDS:
+            return
+        self.last_refresh_check = now
+        try:
+            self.table_refresh_watcher.check()
+        except Exception as e:
+            print(f"Failed to check tables refresh: {e}")
+
+    def dispose(self):
+        # Close the pooled connections of the engine
+        self.db._engine.dispose()
+
+
+# One SharedResources per model id and backend for the whole process
+_shared_resources = {}
+_shared_resources_lock = threading.Lock()
+# Started with the first resources, kept across reset_shared_resources
+_metrics_server = []
+
+
+def get_shared_resources(model_id=DEFAULT_MODEL_ID, backend=SQL_AGENT_BACKEND):
+    key = (model_id, backend)
+    resources = _shared_resources.get(key)
+    if resources is None:
+        # Double checked so concurrent first sessions build the resources only once
+        with _shared_resources_lock:
+            resources = _shared_resources.get(key)
+            if resources is None:
+                if METRICS_PORT and not _metrics_server:
+                    _metrics_server.append(start_metrics_server(int(METRICS_PORT)))
+                resources = SharedResources(model_id, backend=backend, sql_result_cache_path=SQL_RESULT_CACHE_PATH, warm_queries=WARMUP_QUERIES, session_store_path=SESSION_STORE_PATH)
+                _shared_resources[key] = resources
+
+    return resources
+
+
+def reset_shared_resources():
+    with _shared_resources_lock:
+        for resources in _shared_resources.values():
+            resources.dispose()
+        _shared_resources.clear()
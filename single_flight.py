@@ -0,0 +1,84 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from answer_cache import context_key, normalize_question
+from sql_cache import canonicalize_sql
+
+# Coalesces identical calls in flight. The first caller of a key (the leader) runs
+# the call, the callers arriving before it finishes (the followers) wait for its
+# result or its exception instead of running the call again. Nothing is kept once
+# the call finished, the answer and SQL result caches serve the later callers.
+# The futures are concurrent.futures.Future so that threads (invoke_agent, the
+# sql_db_query tool) and the worker pool event loop can wait on the same call.
+
+
+def answer_key(question, chat_history, mode):
+    # Equivalent questions asked with the same history context share one run
+    return ("answer", mode, context_key(chat_history), normalize_question(question))
+
+
+def sql_key(query):
+    return ("sql", canonicalize_sql(query))
+
+
+class SingleFlight:
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # key -> Future of the call in flight
+        self.calls = {}
+        self.stats = {"leaders": 0, "followers": 0, "errors": 0}
+
+    def join(self, key):
+        # (future, leader), the leader must settle the future
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.stats["followers"] += 1
+                return future, False
+            future = self.calls[key] = Future()
+            self.stats["leaders"] += 1
+
+        return future, True
+
+    def settle(self, key, future, result=None, error=None):
+        with self.lock:
+            if self.calls.get(key) is future:
+                del self.calls[key]
+            if error is not None:
+                self.stats["errors"] += 1
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def run(self, key, function, *args):
+        # (result, leader)
+        future, leader = self.join(key)
+        if not leader:
+            return future.result(), False
+        try:
+            result = function(*args)
+        except BaseException as e:
+            self.settle(key, future, error=e)
+            raise
+        self.settle(key, future, result)
+
+        return result, True
+
+    async def arun(self, key, coroutine_function, *args):
+        future, leader = self.join(key)
+        if not leader:
+            return await asyncio.wrap_future(future), False
+        try:
+            result = await coroutine_function(*args)
+        except BaseException as e:
+            self.settle(key, future, error=e)
+            raise
+        self.settle(key, future, result)
+
+        return result, True
+
+    def metrics(self):
+        with self.lock:
+            return dict(self.stats, in_flight=len(self.calls))
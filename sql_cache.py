@@ -0,0 +1,207 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Results of the sql_db_query tool, keyed on the canonical form of the SQL so that
+# queries differing only in whitespace, case or literal ordering share one entry.
+
+# Queries run at startup so the most asked numbers are already cached
+WARMUP_QUERIES = [
+    "SELECT Years, Q1, Q2, Q3, Q4, Total FROM total_value_added ORDER BY Years DESC LIMIT 4",
+    "SELECT Years, Q1, Q2, Q3, Q4, Total FROM real_gdp_growth_rates ORDER BY Years DESC LIMIT 4",
+    "SELECT Years, Activities, Q1, Q2, Q3, Q4, Total FROM sectors_growth_rates WHERE Years = (SELECT MAX(Years) FROM sectors_growth_rates)",
+]
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>--[^\n]*|/\*.*?\*/)
+    |(?P<string>'(?:[^']|'')*')
+    |(?P<identifier>"(?:[^"]|"")*"|`[^`]*`)
+    |(?P<number>\d+(?:\.\d+)?)
+    |(?P<word>\w+)
+    |(?P<space>\s+)
+    |(?P<symbol><>|!=|<=|>=|\|\||.)
+""", re.S | re.X)
+# Words ending the conditions of a WHERE clause
+CLAUSE_END_WORDS = {"group", "order", "having", "limit", "union", "intersect", "except"}
+
+
+def sort_in_lists(tokens):
+    # IN ('b', 'a') == IN ('a', 'b'), tokens are (kind, value)
+    tokens = list(tokens)
+    for index in range(len(tokens) - 1):
+        if tokens[index] != ("word", "in") or tokens[index + 1][1] != "(":
+            continue
+        end = next((position for position in range(index + 2, len(tokens)) if tokens[position][1] == ")"), None)
+        if end is None:
+            continue
+        items = tokens[index + 2:end]
+        values, commas = items[0::2], items[1::2]
+        if values and all(kind in ("string", "number") for kind, _ in values) and all(value == "," for _, value in commas):
+            items[0::2] = sorted(values, key=lambda token: token[1])
+            tokens[index + 2:end] = items
+
+    return tokens
+
+
+def sort_conjunctions(tokens):
+    # WHERE a = 1 AND b = 2 == WHERE b = 2 AND a = 1, only for plain conjunctions (no
+    # OR, BETWEEN, parentheses or subquery). String literals are single tokens, an
+    # "and" inside one is not a conjunction.
+    result = []
+    index = 0
+    while index < len(tokens):
+        result.append(tokens[index])
+        if tokens[index] != ("word", "where"):
+            index += 1
+            continue
+        end = index + 1
+        while end < len(tokens) and tokens[end][1] != ")" and not (tokens[end][0] == "word" and tokens[end][1] in CLAUSE_END_WORDS):
+            end += 1
+        condition = tokens[index + 1:end]
+        plain = not any(token[1] == "(" or (token[0] == "word" and token[1] in ("or", "between", "select")) for token in condition)
+        if plain and condition:
+            conjuncts = [[]]
+            for token in condition:
+                if token == ("word", "and"):
+                    conjuncts.append([])
+                else:
+                    conjuncts[-1].append(token)
+            conjuncts.sort(key=lambda conjunct: " ".join(value for _, value in conjunct))
+            condition = conjuncts[0]
+            for conjunct in conjuncts[1:]:
+                condition = condition + [("word", "and")] + conjunct
+        result += condition
+        index = end
+
+    return result
+
+
+def canonicalize_sql(sql):
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(sql.strip().rstrip(";")):
+        kind, value = match.lastgroup, match.group()
+        if kind in ("comment", "space"):
+            continue
+        if kind == "identifier":
+            value = value[1:-1].lower()
+        elif kind != "string":
+            # Keywords and identifiers are case insensitive in Athena, string literals are not
+            value = value.lower()
+        tokens.append((kind, value))
+    tokens = sort_conjunctions(sort_in_lists(tokens))
+
+    return " ".join(value for _, value in tokens)
+
+
+def referenced_tables(sql):
+    return {table.lower() for table in re.findall(r"\b(?:from|join)\s+[\"`]?(\w+)", sql, re.I)}
+
+
+class SqlResultCache:
+    # In-memory LRU, optionally backed by a sqlite file so results survive restarts
+
+    def __init__(self, max_entries=1024, ttl_seconds=6 * 60 * 60, path=None, max_disk_entries=10000) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        self.connection = None
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS sql_results "
+                "(query TEXT PRIMARY KEY, result TEXT, tables TEXT, created_at REAL, last_used REAL)"
+            )
+            self.connection.commit()
+
+    def get(self, sql):
+        key = canonicalize_sql(sql)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[1] <= self.ttl_seconds:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[0]
+            if entry is not None:
+                del self.entries[key]
+
+            if self.connection is not None:
+                row = self.connection.execute(
+                    "SELECT result, created_at FROM sql_results WHERE query = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] <= self.ttl_seconds:
+                    self.connection.execute("UPDATE sql_results SET last_used = ? WHERE query = ?", (now, key))
+                    self.connection.commit()
+                    self._put_memory(key, row[0], row[1])
+                    self.stats["disk_hits"] += 1
+                    return row[0]
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, sql, result):
+        key = canonicalize_sql(sql)
+        now = time.time()
+        with self.lock:
+            self._put_memory(key, result, now)
+            if self.connection is not None:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO sql_results VALUES (?, ?, ?, ?, ?)",
+                    (key, result, json.dumps(sorted(referenced_tables(sql))), now, now),
+                )
+                self.connection.execute(
+                    "DELETE FROM sql_results WHERE query NOT IN "
+                    "(SELECT query FROM sql_results ORDER BY last_used DESC LIMIT ?)",
+                    (self.max_disk_entries,),
+                )
+                self.connection.commit()
+
+    def warm(self, db, queries=WARMUP_QUERIES):
+        # Run the queries against the database so that their results are cached
+        for sql in queries:
+            if self.get(sql) is not None:
+                continue
+            try:
+                self.put(sql, str(db.run(sql)))
+            except Exception as e:
+                print(f"Failed to warm sql cache with {sql!r}: {e}")
+
+    def invalidate(self, tables=None):
+        with self.lock:
+            if tables is None:
+                count = len(self.entries)
+                self.entries.clear()
+                if self.connection is not None:
+                    self.connection.execute("DELETE FROM sql_results")
+            else:
+                tables = {table.lower() for table in tables}
+                keys = [key for key in self.entries if referenced_tables(key) & tables]
+                for key in keys:
+                    del self.entries[key]
+                count = len(keys)
+                if self.connection is not None:
+                    rows = self.connection.execute("SELECT query, tables FROM sql_results").fetchall()
+                    stale = [(query,) for query, row_tables in rows if set(json.loads(row_tables)) & tables]
+                    self.connection.executemany("DELETE FROM sql_results WHERE query = ?", stale)
+            if self.connection is not None:
+                self.connection.commit()
+            self.stats["invalidations"] += count
+
+    def metrics(self):
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries))
+
+    def _put_memory(self, key, result, created_at):
+        self.entries[key] = (result, created_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
@@ -0,0 +1,340 @@
+import difflib
+import os
+import re
+import threading
+import time
+from sql_cache import TOKEN_PATTERN
+from rollups import ROLLUPS
+from schema_retrieval import TABLES
+from tracing import CURRENT_TRACE, METRICS
+
+# Checks the SQL of sql_db_query against the reflected schema before it reaches the
+# database. Statements other than a single SELECT are rejected. Unknown tables and
+# columns close to a known one, Years literals not in the 'year/(year-1)' form and
+# categorical values differing only in case or spacing are fixed, other unknown
+# identifiers are rejected. A LIMIT of max_rows is added when missing, a safety cap
+# well above the top_k of the prompts: range and trend queries get all their rows and
+# the large results reach the agent as a compact view (ObservationStore). Queries
+# expected to scan more than max_bytes_scanned are rejected. The rejections come back
+# to the agent as "Error: ..." observations, like the database errors, without an
+# Athena round-trip. A fixed query also saves the agent the iteration rewriting it.
+
+# Rows the prompts ask the agent to limit its queries to
+TOP_K = 4
+# Rows returned by a query without LIMIT
+MAX_ROWS = int(os.getenv('SQL_MAX_ROWS', '1000'))
+# Cost guard, estimated from the bytes Athena scanned in the previous queries
+MAX_BYTES_SCANNED = int(os.getenv('SQL_MAX_BYTES_SCANNED', str(1024 ** 3)))
+# Identifiers at least this close to a known one are replaced by it
+MATCH_CUTOFF = 0.8
+ROLLUP_NAMES = {table.lower() for table in ROLLUPS}
+
+FORBIDDEN_KEYWORDS = {"insert", "update", "delete", "drop", "create", "alter", "truncate", "merge", "grant",
+                      "revoke", "unload", "msck", "call", "into", "vacuum", "optimize", "prepare", "execute"}
+KEYWORDS = {
+    "select", "from", "where", "and", "or", "not", "as", "on", "using", "join", "inner", "left", "right", "full",
+    "outer", "cross", "natural", "group", "by", "order", "having", "limit", "offset", "fetch", "first", "next",
+    "rows", "row", "only", "asc", "desc", "nulls", "last", "distinct", "all", "union", "intersect", "except",
+    "with", "recursive", "in", "is", "null", "like", "ilike", "escape", "between", "exists", "any", "some",
+    "case", "when", "then", "else", "end", "over", "partition", "range", "preceding", "following", "unbounded",
+    "current", "filter", "within", "true", "false", "cast", "try_cast", "interval", "date", "time", "timestamp",
+    "zone", "at", "year", "month", "day", "hour", "minute", "second", "quarter", "week", "double", "real",
+    "float", "decimal", "integer", "int", "bigint", "smallint", "tinyint", "varchar", "char", "boolean",
+    "precision", "values", "unnest", "lateral", "ordinality", "tablesample", "current_date",
+    "current_time", "current_timestamp", "localtime", "localtimestamp",
+}
+COMPARISON_OPERATORS = {"=", "<>", "!=", "<", ">", "<=", ">="}
+YEAR_LITERAL = re.compile(r"((?:19|20)\d{2})(?:\s*[/-]\s*((?:19|20)\d{2}))?")
+
+
+class Token:
+
+    def __init__(self, kind, text, start, end) -> None:
+        self.kind = kind
+        self.text = text
+        self.start = start
+        self.end = end
+        # Identifiers are case insensitive in Athena, quotes are not part of the name
+        self.name = text[1:-1].lower() if kind == "identifier" else text.lower()
+
+    @property
+    def is_name(self):
+        return (self.kind == "word" and self.name not in KEYWORDS) or self.kind == "identifier"
+
+
+def tokenize(sql):
+    return [Token(match.lastgroup, match.group(), match.start(), match.end())
+            for match in TOKEN_PATTERN.finditer(sql) if match.lastgroup not in ("comment", "space")]
+
+
+def close_match(name, names):
+    matches = difflib.get_close_matches(name, names, n=2, cutoff=MATCH_CUTOFF)
+    # Ambiguous typos are left to the agent
+    return matches[0] if len(matches) == 1 else None
+
+
+def normalize_value(value):
+    return re.sub(r"[^a-z0-9]", "", value.lower())
+
+
+def financial_year(literal):
+    # '2020', '2019/2020' and '2020-2019' are all the financial year '2020/2019'
+    match = YEAR_LITERAL.fullmatch(literal.strip())
+    if match is None:
+        return None
+    first, second = match.groups()
+    last = max(int(first), int(second)) if second else int(first)
+    return f"{last}/{last - 1}"
+
+
+class GuardResult:
+
+    def __init__(self, sql, error=None, fixes=None, limited=False, estimated_bytes=None) -> None:
+        self.sql = sql
+        self.error = error
+        # Identifiers and literals replaced, the query would have failed without them
+        self.fixes = fixes or []
+        # LIMIT max_rows was added
+        self.limited = limited
+        self.estimated_bytes = estimated_bytes
+
+
+class SqlGuard:
+
+    def __init__(self, db, max_rows=MAX_ROWS, max_bytes_scanned=MAX_BYTES_SCANNED, tables=None) -> None:
+        self.max_rows = max_rows
+        self.max_bytes_scanned = max_bytes_scanned
+        # table -> {column: [known values]}, from the tables documented in the prompt
+        # (the replica sends those it does not have to Athena) and the reflected ones
+        self.tables = {}
+        # Lower case name -> name
+        self.table_names = {}
+        for table, description in TABLES.items():
+            # tables: the documented tables the database has (available_tables)
+            if tables is not None and table not in tables:
+                continue
+            self.tables[table.lower()] = {column.lower(): description["values"].get(column, []) for column in description["columns"]}
+            self.table_names[table.lower()] = table
+        for table in db._metadata.tables.values():
+            known = self.tables.setdefault(table.name.lower(), {})
+            self.table_names.setdefault(table.name.lower(), table.name)
+            for column in table.columns:
+                known.setdefault(column.name.lower(), [])
+        # table -> most bytes Athena scanned for a query of this table alone
+        self.table_bytes = {}
+        self.lock = threading.Lock()
+        self.stats = {"checked": 0, "rejected": 0, "fixed": 0, "limited": 0, "cost_rejected": 0,
+                      "athena_round_trips_saved": 0, "agent_iterations_saved": 0}
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.stats[name] += value
+        METRICS.increment(f"sql_agent_guard_{name}_total", value)
+
+    def check(self, sql):
+        start = time.perf_counter()
+        result = self.validate(sql)
+        self.count("checked")
+        if result.error is not None:
+            # The query would have failed on Athena, or scanned too much
+            self.count("rejected")
+            self.count("athena_round_trips_saved")
+        elif result.fixes:
+            self.count("fixed")
+            # Only an unknown table or column makes Athena return an error (then the agent
+            # rewrites the query), the literals fixed would have returned no rows
+            if any(fix.startswith(("table ", "column ")) for fix in result.fixes):
+                self.count("athena_round_trips_saved")
+                self.count("agent_iterations_saved")
+        if result.limited:
+            self.count("limited")
+        trace = CURRENT_TRACE.get()
+        if trace is not None:
+            trace.add_span("guard", "sql_guard", time.perf_counter() - start, sql=sql, error=result.error,
+                           fixes=result.fixes, limited=result.limited, estimated_bytes=result.estimated_bytes)
+
+        return result
+
+    def validate(self, sql):
+        sql = sql.strip().rstrip(";").strip()
+        tokens = tokenize(sql)
+        if not tokens or tokens[0].name not in ("select", "with", "("):
+            return GuardResult(sql, "Error: Only SELECT queries are allowed.")
+        if any(token.text == ";" for token in tokens):
+            return GuardResult(sql, "Error: Run one query at a time.")
+        for index, token in enumerate(tokens):
+            following = tokens[index + 1].text if index + 1 < len(tokens) else None
+            if token.kind == "word" and token.name in FORBIDDEN_KEYWORDS and following != "(":
+                return GuardResult(sql, f"Error: {token.text.upper()} statements are not allowed, the data is read only.")
+
+        fixes = []
+        replacements = {}
+        tables, error = self.check_tables(tokens, replacements, fixes)
+        if error is None:
+            error = self.check_columns(tokens, tables, replacements, fixes)
+        if error is not None:
+            return GuardResult(sql, error, fixes)
+        self.fix_literals(tokens, tables, replacements, fixes)
+
+        for index in sorted(replacements, reverse=True):
+            token = tokens[index]
+            sql = sql[:token.start] + replacements[index] + sql[token.end:]
+        limited = not self.has_limit(tokens)
+        if limited:
+            sql = f"{sql} LIMIT {self.max_rows}"
+        estimated_bytes = self.estimate_bytes(tables)
+        if estimated_bytes is not None and estimated_bytes > self.max_bytes_scanned:
+            self.count("cost_rejected")
+            return GuardResult(sql, f"Error: The query would scan about {estimated_bytes} bytes, more than the {self.max_bytes_scanned} allowed. Read fewer tables.", fixes, limited, estimated_bytes)
+
+        return GuardResult(sql, None, fixes, limited, estimated_bytes)
+
+    def check_tables(self, tokens, replacements, fixes):
+        # Tables read by the query (with their position), CTE names are not tables
+        ctes = {tokens[index].name for index in range(len(tokens) - 2)
+                if tokens[index].is_name and tokens[index + 1].name == "as" and tokens[index + 2].text == "("}
+        tables = []
+        clause = None
+        for index, token in enumerate(tokens):
+            if token.kind == "word" and token.name in ("select", "from", "join", "where", "on", "group", "order", "having", "limit"):
+                clause = token.name
+            previous = tokens[index - 1] if index else None
+            if not token.is_name or previous is None or (index + 1 < len(tokens) and tokens[index + 1].text == "."):
+                continue
+            # "FROM a", "JOIN a", "FROM a x, b" and "FROM db.a"
+            table_position = previous.name in ("from", "join") or (clause == "from" and previous.text == ",")
+            if previous.text == "." and index >= 2:
+                table_position = tokens[index - 3].name in ("from", "join") if index >= 3 else False
+            if not table_position or token.name in ctes:
+                continue
+            name = token.name
+            if name not in self.tables:
+                # A rollup not built on this database is not a typo of a source table
+                match = close_match(name, list(self.tables)) if name not in ROLLUP_NAMES else None
+                if match is None:
+                    return [], f"Error: Table {token.text} does not exist. Tables: {', '.join(sorted(self.table_names.values()))}"
+                replacements[index] = self.table_names.get(match, match)
+                fixes.append(f"table {token.text} -> {replacements[index]}")
+                name = match
+            tables.append(name)
+
+        return tables, None
+
+    def check_columns(self, tokens, tables, replacements, fixes):
+        columns = {column for table in tables for column in self.tables.get(table, {})}
+        # Aliases, CTE and table names are valid names as well
+        aliases = set(tables)
+        for index, token in enumerate(tokens):
+            if not token.is_name or index == 0:
+                continue
+            previous = tokens[index - 1]
+            following = tokens[index + 1] if index + 1 < len(tokens) else None
+            # "x AS alias", "table alias", "(subquery) alias", "cte AS (" and "FROM db.table"
+            if previous.name == "as" or previous.is_name or previous.text == ")" or previous.kind in ("string", "number") \
+                    or (following is not None and following.name == "as" and index + 2 < len(tokens) and tokens[index + 2].text == "(") \
+                    or (following is not None and following.text == "."):
+                aliases.add(token.name)
+        for index, token in enumerate(tokens):
+            if not token.is_name or index in replacements or token.name in aliases or token.name in columns:
+                continue
+            following = tokens[index + 1] if index + 1 < len(tokens) else None
+            previous = tokens[index - 1] if index else None
+            # Function calls and table references
+            if following is not None and following.text == "(":
+                continue
+            if previous is not None and (previous.name in ("from", "join") or (previous.text == "." and index >= 3 and tokens[index - 3].name in ("from", "join"))):
+                continue
+            match = close_match(token.name, sorted(columns))
+            if match is None:
+                known = sorted({self.column_name(tables, column) for table in tables for column in self.tables.get(table, {})})
+                return f"Error: Column {token.text} does not exist in {', '.join(tables) or 'the tables'}. Columns: {', '.join(known)}"
+            replacements[index] = self.column_name(tables, match)
+            fixes.append(f"column {token.text} -> {replacements[index]}")
+
+        return None
+
+    def column_name(self, tables, column):
+        # Spelled as in the prompt, Athena does not mind the case
+        for table in tables:
+            description = TABLES.get(self.table_names.get(table, table))
+            if description is not None:
+                for name in description["columns"]:
+                    if name.lower() == column:
+                        return name
+        return column
+
+    def comparison_column(self, tokens, index):
+        # Column a literal is compared with: "c = 'x'", "c IN ('x', 'y')", "c BETWEEN 'x' AND 'y'"
+        previous = tokens[index - 1] if index else None
+        if previous is None:
+            return None
+        if previous.text in COMPARISON_OPERATORS and index >= 2 and tokens[index - 2].is_name:
+            return tokens[index - 2].name
+        position = index - 1
+        while position > 0 and (tokens[position].text == "," or tokens[position].kind in ("string", "number")):
+            position -= 1
+        if tokens[position].text == "(" and position >= 2 and tokens[position - 1].name == "in":
+            # "c NOT IN (...)"
+            position -= 3 if tokens[position - 2].name == "not" else 2
+            return tokens[position].name if position >= 0 and tokens[position].is_name else None
+        if previous.name in ("between", "and"):
+            position = index - 1 if previous.name == "between" else index - 3
+            if position >= 1 and tokens[position].name == "between" and tokens[position - 1].is_name:
+                return tokens[position - 1].name
+        return None
+
+    def fix_literals(self, tokens, tables, replacements, fixes):
+        for index, token in enumerate(tokens):
+            if token.kind not in ("string", "number"):
+                continue
+            column = self.comparison_column(tokens, index)
+            if column is None:
+                continue
+            value = token.text[1:-1].replace("''", "'") if token.kind == "string" else token.text
+            if column == "years":
+                year = financial_year(value)
+                if year is not None and (year != value or token.kind == "number"):
+                    replacements[index] = f"'{year}'"
+                    fixes.append(f"Years {token.text} -> '{year}'")
+                continue
+            known = [known for table in tables for known in self.tables.get(table, {}).get(column, [])]
+            if token.kind != "string" or not known or value in known:
+                continue
+            # Only the case and spacing are fixed, the data may have values the prompt does not list
+            matches = {known_value for known_value in known if normalize_value(known_value) == normalize_value(value)}
+            if len(matches) == 1:
+                replacements[index] = "'" + matches.pop().replace("'", "''") + "'"
+                fixes.append(f"value {token.text} -> {replacements[index]}")
+
+    def has_limit(self, tokens):
+        depth = 0
+        for token in tokens:
+            if token.text == "(":
+                depth += 1
+            elif token.text == ")":
+                depth -= 1
+            elif depth == 0 and token.name in ("limit", "fetch"):
+                return True
+        return False
+
+    def estimate_bytes(self, tables):
+        # None until Athena has reported the bytes scanned of every table
+        with self.lock:
+            if not tables or any(table not in self.table_bytes for table in tables):
+                return None
+            return sum(self.table_bytes[table] for table in tables)
+
+    def record_scan(self, conn, cursor, statement, parameters, context, executemany):
+        # SQLAlchemy after_cursor_execute hook learning the size of the tables
+        bytes_scanned = getattr(cursor, "data_scanned_in_bytes", None)
+        if not bytes_scanned:
+            return
+        tables = {table.lower() for table in re.findall(r"\b(?:from|join)\s+(?:[\"`]?\w+[\"`]?\.)?[\"`]?(\w+)", statement, re.I)}
+        if len(tables) == 1:
+            table = tables.pop()
+            with self.lock:
+                self.table_bytes[table] = max(self.table_bytes.get(table, 0), bytes_scanned)
+
+    def metrics(self):
+        with self.lock:
+            return dict(self.stats)
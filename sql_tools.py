@@ -0,0 +1,110 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+from langchain_community.agent_toolkits import SQLDatabaseToolkit
+from langchain_community.tools.sql_database.tool import QuerySQLDataBaseTool
+from langchain_core.callbacks import AsyncCallbackManagerForToolRun, CallbackManagerForToolRun
+from langchain_core.tools import BaseTool
+from single_flight import sql_key
+
+# Tools given to the sql agent. The sql_db_query tool is replaced by a version that
+# goes through the SqlGuard checks and the shared SqlResultCache before reaching the database,
+# and joins the identical query already running for another session (SingleFlight).
+# Large results reach the agent as a compact view, the rest of the rows stay in the
+# ObservationStore and the sql_db_fetch_rows tool returns them on demand.
+
+# Blocking database calls of async agent runs, sized apart from the loop default executor
+SQL_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv('SQL_MAX_WORKERS', '16')), thread_name_prefix="sql")
+
+
+class CachedQuerySQLDataBaseTool(QuerySQLDataBaseTool):
+    cache: Any = None
+    guard: Any = None
+    single_flight: Any = None
+    # ObservationStore compacting the large results, the structured pipeline fills its
+    # templates from the full rows and has none
+    observations: Any = None
+
+    def _run(
+        self,
+        query: str,
+        run_manager: Optional[CallbackManagerForToolRun] = None,
+    ) -> str:
+        result = self.run_checked(query)
+        if self.observations is not None:
+            return self.observations.compact(query, result)
+
+        return result
+
+    def run_checked(self, query):
+        if self.guard is not None:
+            # Invalid or too costly queries never reach the database
+            checked = self.guard.check(query)
+            if checked.error is not None:
+                return checked.error
+            query = checked.sql
+        if self.cache is not None:
+            result = self.cache.get(query)
+            if result is not None:
+                return result
+
+        if self.single_flight is not None:
+            result, _ = self.single_flight.run(sql_key(query), self.run_query, query)
+        else:
+            result = self.run_query(query)
+        # Errors are returned to the agent but never cached
+        if self.cache is not None and not result.startswith("Error:"):
+            self.cache.put(query, result)
+
+        return result
+
+    def run_query(self, query):
+        return str(self.db.run_no_throw(query))
+
+    async def _arun(
+        self,
+        query: str,
+        run_manager: Optional[AsyncCallbackManagerForToolRun] = None,
+    ) -> str:
+        # The context carries the trace of the answer into the executor thread
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(SQL_EXECUTOR, context.run, self._run, query)
+
+
+class FetchRowsTool(BaseTool):
+    name: str = "sql_db_fetch_rows"
+    description: str = (
+        "Input to this tool is the id of a sql_db_query result and the first row wanted, e.g. \"r0123abcd 10\". "
+        "Output is the next rows of the result, with their exact values. Use it when sql_db_query only showed "
+        "the first rows of a large result."
+    )
+    observations: Any = None
+
+    def _run(
+        self,
+        tool_input: str,
+        run_manager: Optional[CallbackManagerForToolRun] = None,
+    ) -> str:
+        return self.observations.fetch(tool_input)
+
+
+class AgentSQLDatabaseToolkit(SQLDatabaseToolkit):
+    sql_result_cache: Any = None
+    sql_guard: Any = None
+    single_flight: Any = None
+    observation_store: Any = None
+
+    def get_tools(self) -> List[BaseTool]:
+        tools = super().get_tools()
+        for index, tool in enumerate(tools):
+            if tool.name == "sql_db_query":
+                tools[index] = CachedQuerySQLDataBaseTool(
+                    db=self.db, description=tool.description, cache=self.sql_result_cache, guard=self.sql_guard,
+                    single_flight=self.single_flight, observations=self.observation_store,
+                )
+        if self.observation_store is not None:
+            tools.append(FetchRowsTool(observations=self.observation_store))
+
+        return tools
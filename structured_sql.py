@@ -0,0 +1,132 @@
+import asyncio
+import re
+from langchain.prompts import PromptTemplate
+from langchain_core.agents import AgentAction
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import JsonOutputParser
+from observations import parse_rows
+from prompt_cache import strip_cache_points
+from prompts import (STRUCTURED_ANSWER_PROMPT_INPUT_VARIABLES, STRUCTURED_ANSWER_PROMPT_TEMPLATE,
+                     STRUCTURED_SQL_PROMPT_INPUT_VARIABLES, STRUCTURED_SQL_PROMPT_TEMPLATE)
+from sql_tools import CachedQuerySQLDataBaseTool
+
+# Fixed pipeline answering with at most two LLM calls instead of the ReAct loop: the
+# first call returns every query and an HTML answer template as JSON, the queries run
+# through the same cached sql_db_query tool as the agent, and the template is filled
+# with the rows. The second call only happens when the template cannot be filled (no
+# rows, missing values). Unparsable plans and failing queries raise StructuredPlanError
+# so SqlAgent can hand the question to the ReAct agent, which can repair its queries.
+
+# {result_1} is every row of the first query, {result_1[0][1]} one value
+RESULT_PLACEHOLDER = re.compile(r"\{result_(\d+)(?:\[(\d+)\]\[(\d+)\])?\}")
+MAX_QUERIES = 4
+
+
+class StructuredPlanError(Exception):
+    pass
+
+
+def parse_plan(text):
+    try:
+        plan = JsonOutputParser().parse(text)
+    except OutputParserException as e:
+        raise StructuredPlanError(f"Unparsable plan: {e}")
+    if not isinstance(plan, dict) or not isinstance(plan.get("queries") or [], list):
+        raise StructuredPlanError(f"Unexpected plan: {text[:200]}")
+    queries = [query.strip().rstrip(";") for query in plan.get("queries") or [] if isinstance(query, str) and query.strip()]
+    if len(queries) > MAX_QUERIES:
+        raise StructuredPlanError(f"Too many queries in the plan: {len(queries)}")
+
+    return queries, plan.get("answer_template") or ""
+
+
+def render_rows(rows):
+    # Values are shown exactly as stored
+    if len(rows) == 1:
+        return ", ".join(str(value) for value in rows[0])
+    return "<ul>" + "".join(f"<li>{', '.join(str(value) for value in row)}</li>" for row in rows) + "</ul>"
+
+
+def fill_template(template, results):
+    # None when the template is missing or refers to a row that was not returned
+    if not template or any(not rows for rows in results):
+        return None
+
+    def replace(match):
+        rows = results[int(match.group(1)) - 1]
+        if match.group(2) is None:
+            return render_rows(rows)
+        return str(rows[int(match.group(2))][int(match.group(3))])
+
+    try:
+        output = RESULT_PLACEHOLDER.sub(replace, template)
+    except (IndexError, TypeError):
+        return None
+    if "{result_" in output:
+        return None
+
+    return output
+
+
+class StructuredSqlPipeline:
+
+    def __init__(self, llm, db, sql_result_cache=None, sql_guard=None, single_flight=None, cache_points=True) -> None:
+        self.llm = llm
+        # cache_points: the llm caches the prompt prefixes, see prompt_cache.py
+        template = STRUCTURED_SQL_PROMPT_TEMPLATE if cache_points else strip_cache_points(STRUCTURED_SQL_PROMPT_TEMPLATE)
+        self.prompt = PromptTemplate(input_variables=STRUCTURED_SQL_PROMPT_INPUT_VARIABLES, template=template)
+        self.answer_prompt = PromptTemplate(input_variables=STRUCTURED_ANSWER_PROMPT_INPUT_VARIABLES, template=STRUCTURED_ANSWER_PROMPT_TEMPLATE)
+        self.query_tool = CachedQuerySQLDataBaseTool(db=db, cache=sql_result_cache, guard=sql_guard, single_flight=single_flight)
+        self.stats = {"template_answers": 0, "llm_answers": 0, "fallbacks": 0}
+
+    def get_plan_prompt(self, input_data):
+        return self.prompt.format(**{name: input_data[name] for name in STRUCTURED_SQL_PROMPT_INPUT_VARIABLES})
+
+    def get_answer_prompt(self, question, steps):
+        results = "".join(f"\nQuery: {action.tool_input}\nObservation: {observation}" for action, observation in steps)
+        return self.answer_prompt.format(input=question, results=results)
+
+    def get_steps(self, queries, observations):
+        steps = [(AgentAction("sql_db_query", query, "Structured plan"), observation) for query, observation in zip(queries, observations)]
+        for query, observation in zip(queries, observations):
+            if observation.startswith("Error:"):
+                self.stats["fallbacks"] += 1
+                raise StructuredPlanError(f"Query failed: {query}: {observation[:200]}")
+        return steps
+
+    def get_template_answer(self, template, steps):
+        output = fill_template(template, [parse_rows(observation) for _, observation in steps])
+        if output is not None:
+            self.stats["template_answers"] += 1
+        return output
+
+    def parse_plan(self, text):
+        try:
+            return parse_plan(text)
+        except StructuredPlanError:
+            self.stats["fallbacks"] += 1
+            raise
+
+    def run(self, input_data, config=None):
+        plan = self.llm.invoke(self.get_plan_prompt(input_data), config=config)
+        queries, template = self.parse_plan(plan.content)
+        steps = self.get_steps(queries, [str(self.query_tool.invoke(query, config=config)) for query in queries])
+        output = self.get_template_answer(template, steps)
+        if output is None:
+            self.stats["llm_answers"] += 1
+            output = self.llm.invoke(self.get_answer_prompt(input_data["input"], steps), config=config).content
+
+        return {"input": input_data["input"], "output": output.strip(), "intermediate_steps": steps}
+
+    async def arun(self, input_data, config=None):
+        # Same as run, the queries of the plan run concurrently
+        plan = await self.llm.ainvoke(self.get_plan_prompt(input_data), config=config)
+        queries, template = self.parse_plan(plan.content)
+        observations = await asyncio.gather(*(self.query_tool.ainvoke(query, config=config) for query in queries))
+        steps = self.get_steps(queries, [str(observation) for observation in observations])
+        output = self.get_template_answer(template, steps)
+        if output is None:
+            self.stats["llm_answers"] += 1
+            output = (await self.llm.ainvoke(self.get_answer_prompt(input_data["input"], steps), config=config)).content
+
+        return {"input": input_data["input"], "output": output.strip(), "intermediate_steps": steps}
@@ -0,0 +1,254 @@
+import ast
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from langchain_core.callbacks import BaseCallbackHandler
+from prompts import PROMPT_VERSION
+
+# Per answer trace of the agent pipeline: one span per LLM call (tokens, prompt cache
+# reads and writes, latency), per SQL query (rows, Athena bytes scanned and
+# queue/execution times, latency), the agent iterations and parsing errors, and the
+# Bedrock retries botocore does not report.
+# Finished traces feed process wide metrics exported as Prometheus text and can be
+# appended as JSON lines to TRACE_LOG_PATH.
+
+TRACE_LOG_PATH = os.getenv('TRACE_LOG_PATH')
+
+# Trace of the answer being computed, seen by callbacks, SQLAlchemy and botocore hooks
+CURRENT_TRACE = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+
+    def __init__(self, question) -> None:
+        self.question = question
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        # "cache", "fast_path", "structured", "agent" or "coalesced" (joined the run of
+        # another session, see single_flight.py)
+        self.path = None
+        # Model of the LLM calls ("fast" or "large") and monotonic deadline of the
+        # answer, see model_router.py
+        self.model_tier = None
+        self.deadline = None
+        self.spans = []
+        self.iterations = 0
+        self.parse_errors = 0
+        self.bedrock_retries = 0
+        self.lock = threading.Lock()
+
+    def add_span(self, kind, name, duration, **attributes):
+        with self.lock:
+            self.spans.append({"kind": kind, "name": name, "duration": duration, **attributes})
+
+    def record_response(self, response):
+        steps = response.get("intermediate_steps") or []
+        self.iterations = len(steps)
+        # handle_parsing_errors=True turns unparsable LLM outputs into "_Exception" steps
+        self.parse_errors = sum(1 for action, _ in steps if getattr(action, "tool", None) == "_Exception")
+
+    def total(self, kind, attribute="duration"):
+        return sum(span.get(attribute) or 0 for span in self.spans if span["kind"] == kind)
+
+    def breakdown(self):
+        # Seconds spent per stage of the answer
+        llm = self.total("llm")
+        sql = self.total("sql")
+        fast_path = self.total("fast_path")
+        return {
+            "total": self.duration,
+            "llm": llm,
+            "sql": sql,
+            "fast_path": fast_path,
+            "athena_queue": self.total("athena", "queue_seconds"),
+            "athena_execution": self.total("athena", "execution_seconds"),
+            "athena_service": self.total("athena", "service_seconds"),
+            "other": max((self.duration or 0) - llm - sql - fast_path, 0),
+        }
+
+    def to_dict(self):
+        return {
+            "question": self.question,
+            "started_at": self.started_at,
+            "path": self.path,
+            "model_tier": self.model_tier,
+            "duration": self.duration,
+            "iterations": self.iterations,
+            "parse_errors": self.parse_errors,
+            "bedrock_retries": self.bedrock_retries,
+            "input_tokens": self.total("llm", "input_tokens"),
+            "output_tokens": self.total("llm", "output_tokens"),
+            "cache_read_tokens": self.total("llm", "cache_read_tokens"),
+            "cache_write_tokens": self.total("llm", "cache_write_tokens"),
+            "prompt_version": PROMPT_VERSION,
+            "athena_bytes_scanned": self.total("athena", "bytes_scanned"),
+            "breakdown": self.breakdown(),
+            "spans": self.spans,
+        }
+
+
+class Metrics:
+    # Counters and latency sums of the finished traces, for the whole process
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.counters = {}
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, trace):
+        self.increment("sql_agent_answers_total", path=trace.path)
+        self.increment("sql_agent_answer_seconds_sum", trace.duration, path=trace.path)
+        self.increment("sql_agent_iterations_total", trace.iterations)
+        self.increment("sql_agent_parse_errors_total", trace.parse_errors)
+        self.increment("sql_agent_bedrock_retries_total", trace.bedrock_retries)
+        for span in trace.spans:
+            self.increment(f"sql_agent_{span['kind']}_calls_total")
+            self.increment(f"sql_agent_{span['kind']}_seconds_sum", span["duration"] or 0)
+            for attribute in ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens", "bytes_scanned", "reused_results", "rows"):
+                if span.get(attribute):
+                    self.increment(f"sql_agent_{span['kind']}_{attribute}_total", span[attribute])
+
+    def to_prometheus(self):
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+        for (name, labels), value in counters:
+            label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+@contextmanager
+def start_trace(question):
+    trace = Trace(question)
+    token = CURRENT_TRACE.set(trace)
+    try:
+        yield trace
+    finally:
+        CURRENT_TRACE.reset(token)
+        finish_trace(trace)
+
+
+def finish_trace(trace):
+    trace.duration = time.perf_counter() - trace.start
+    METRICS.observe(trace)
+    if TRACE_LOG_PATH:
+        with open(TRACE_LOG_PATH, "a") as f:
+            f.write(json.dumps(trace.to_dict(), default=str) + "\n")
+
+
+def count_rows(observation):
+    try:
+        return len(ast.literal_eval(observation))
+    except (ValueError, SyntaxError, TypeError):
+        return None
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    # Spans for the LLM calls and the sql_db_query runs of an agent run
+    run_inline = True
+
+    def __init__(self, trace) -> None:
+        self.trace = trace
+        self.starts = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.starts[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        duration = time.perf_counter() - self.starts.pop(run_id, time.perf_counter())
+        usage = (response.llm_output or {}).get("usage") or {}
+        input_tokens = usage.get("prompt_tokens") or usage.get("input_tokens")
+        output_tokens = usage.get("completion_tokens") or usage.get("output_tokens")
+        cache_read_tokens = cache_write_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                if metadata and (input_tokens is None or "input_token_details" in metadata):
+                    # Streamed chat models and the prompt cache report the usage on the message
+                    input_tokens = metadata.get("input_tokens", 0)
+                    output_tokens = metadata.get("output_tokens", 0)
+                details = metadata.get("input_token_details") or {}
+                cache_read_tokens += details.get("cache_read") or 0
+                cache_write_tokens += details.get("cache_creation") or 0
+        # input_tokens do not include the tokens read from or written to the prompt cache
+        llm_output = response.llm_output or {}
+        for generations in response.generations:
+            for generation in generations:
+                # Streamed calls of RoutedChatModel report the route on the message
+                metadata = getattr(getattr(generation, "message", None), "response_metadata", None) or {}
+                if "model_tier" in metadata:
+                    llm_output = dict(llm_output, **metadata)
+        self.trace.add_span("llm", "bedrock", duration, input_tokens=input_tokens, output_tokens=output_tokens,
+                            cache_read_tokens=cache_read_tokens, cache_write_tokens=cache_write_tokens,
+                            model=llm_output.get("model_tier") or llm_output.get("model_id"),
+                            attempts=llm_output.get("attempts"), hedged=llm_output.get("hedged"))
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self.starts[run_id] = (time.perf_counter(), input_str)
+
+    def on_tool_end(self, output, *, run_id, name=None, **kwargs):
+        start, sql = self.starts.pop(run_id, (time.perf_counter(), None))
+        self.trace.add_span("sql", name or "tool", time.perf_counter() - start, sql=sql, rows=count_rows(str(output)))
+
+
+def record_cursor_stats(conn, cursor, statement, parameters, context, executemany):
+    # SQLAlchemy after_cursor_execute hook, PyAthena cursors know what Athena did
+    trace = CURRENT_TRACE.get()
+    if trace is None:
+        return
+    milliseconds = lambda name: (getattr(cursor, name, None) or 0) / 1000
+    trace.add_span(
+        "athena", "query", milliseconds("total_execution_time_in_millis"),
+        sql=statement,
+        bytes_scanned=getattr(cursor, "data_scanned_in_bytes", None),
+        queue_seconds=milliseconds("query_queue_time_in_millis"),
+        execution_seconds=milliseconds("engine_execution_time_in_millis"),
+        service_seconds=milliseconds("service_processing_time_in_millis"),
+        # Athena served the result of an earlier run, see athena_backend.py
+        reused_results=1 if getattr(cursor, "reused_previous_result", None) else 0,
+    )
+
+
+def record_bedrock_retries(parsed=None, **kwargs):
+    # botocore after-call hook, retries are otherwise hidden by max_attempts
+    trace = CURRENT_TRACE.get()
+    if trace is not None and parsed:
+        trace.bedrock_retries += parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = METRICS.to_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port):
+    # Prometheus scrape endpoint next to the Streamlit server
+    server = ThreadingHTTPServer(("", port), MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
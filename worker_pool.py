@@ -0,0 +1,100 @@
+import asyncio
+import threading
+
+# Agent runs of all sessions go through one event loop running in a background thread.
+# A global limit bounds the runs in flight (Bedrock throttling, Athena concurrent
+# queries), a per user limit stops one session from taking every slot, and the
+# number of waiting runs is bounded so overload is reported instead of piling up.
+# The semaphores belong to the pool loop: coroutines of other loops go through asubmit.
+# ChatBedrock has no async client, its async calls run _generate in the default
+# executor of the loop: the Bedrock calls still block a thread each.
+
+
+class PoolFullError(Exception):
+    pass
+
+
+class AgentWorkerPool:
+
+    def __init__(self, max_concurrency=8, per_user_concurrency=1, max_queue_size=64) -> None:
+        self.max_concurrency = max_concurrency
+        self.per_user_concurrency = per_user_concurrency
+        self.max_queue_size = max_queue_size
+        self.loop = None
+        self.loop_lock = threading.Lock()
+        self.semaphore = None
+        # Guards the counters and the dicts, metrics() is called from other threads
+        self.lock = threading.Lock()
+        self.user_semaphores = {}
+        # Runs waiting or in flight per user, to forget idle users
+        self.user_runs = {}
+        self.waiting = 0
+        self.running = 0
+
+    def get_loop(self):
+        # Start the event loop thread on first use
+        with self.loop_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, daemon=True).start()
+                self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        return self.loop
+
+    async def submit(self, user_id, coroutine):
+        # Run the coroutine once a global and a per user slot are free, on the pool loop
+        with self.lock:
+            if self.waiting >= self.max_queue_size:
+                coroutine.close()
+                raise PoolFullError("Too many requests are waiting, please try again later.")
+            user_semaphore = self.user_semaphores.setdefault(user_id, asyncio.Semaphore(self.per_user_concurrency))
+            self.user_runs[user_id] = self.user_runs.get(user_id, 0) + 1
+            self.waiting += 1
+        try:
+            await user_semaphore.acquire()
+            try:
+                await self.semaphore.acquire()
+            except BaseException:
+                user_semaphore.release()
+                raise
+        except BaseException:
+            coroutine.close()
+            self.release_user(user_id)
+            raise
+        finally:
+            with self.lock:
+                self.waiting -= 1
+
+        with self.lock:
+            self.running += 1
+        try:
+            return await coroutine
+        finally:
+            with self.lock:
+                self.running -= 1
+            self.semaphore.release()
+            user_semaphore.release()
+            self.release_user(user_id)
+
+    def release_user(self, user_id):
+        # Forget idle users so the dicts do not grow with every session
+        with self.lock:
+            self.user_runs[user_id] -= 1
+            if self.user_runs[user_id] == 0:
+                del self.user_runs[user_id]
+                del self.user_semaphores[user_id]
+
+    def submit_threadsafe(self, user_id, coroutine):
+        # For synchronous callers (Streamlit script threads), returns a concurrent.futures.Future
+        return asyncio.run_coroutine_threadsafe(self.submit(user_id, coroutine), self.get_loop())
+
+    async def asubmit(self, user_id, coroutine):
+        # For coroutines of any other event loop (ainvoke_agent callers)
+        return await asyncio.wrap_future(self.submit_threadsafe(user_id, coroutine))
+
+    def run(self, user_id, coroutine, timeout=None):
+        return self.submit_threadsafe(user_id, coroutine).result(timeout)
+
+    def metrics(self):
+        with self.lock:
+            return {"running": self.running, "waiting": self.waiting, "users": len(self.user_semaphores)}